@@ -0,0 +1,3 @@
+"""
+性能ベンチマーク（Azure に接続せずローカルで実行）
+"""
@@ -0,0 +1,132 @@
+"""
+ベンチマーク共通処理（環境設定・統計・結果の保存・合成テキスト）
+"""
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APPLICATIONS = ["総菜", "パン", "菓子", "デザート", "ヨーグルト", "ソース", "ドレッシング", "ゼリー", "冷凍食品", "弁当"]
+ISSUES = ["離水防止", "老化防止", "食感改良", "粘度調整", "保形性", "冷凍耐性", "レトルト耐性", "乳化安定", "分離防止", "加熱安定性"]
+INGREDIENTS = ["キサンタンガム", "ペクチン", "カラギナン", "ローカストビーンガム", "タマリンドガム", "寒天", "ゼラチン", "デキストリン", "加工澱粉", "増粘多糖類"]
+CUSTOMERS = ["A社", "B社", "C社", "D食品", "E製菓", "F乳業"]
+PROCESSES = ["加熱", "冷却", "攪拌", "充填", "殺菌", "凍結", "解凍", "撹拌混合", "真空包装", "レトルト処理"]
+
+
+def configure_environment(db_path: Optional[str] = None) -> str:
+    """
+    Point the app at a throwaway SQLite database with dummy Azure settings
+
+    Must run before config/database are imported. Returns the database path.
+    """
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="fk-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["MYSQL_HOST"] = ""
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+    for name in ("AZURE_OPENAI_API_KEY", "AZURE_SEARCH_API_KEY"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://benchmark.invalid/")
+    os.environ.setdefault("AZURE_SEARCH_ENDPOINT", "https://benchmark.invalid/")
+    os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    return db_path
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0..100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 2)
+
+
+def summarize(values: Iterable[float]) -> Dict[str, Optional[float]]:
+    values = list(values)
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 2)
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_metadata(benchmark: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": parameters
+    }
+
+
+def write_results(path: Optional[str], results: Dict[str, Any]):
+    """Write results as JSON (stdout when path is None or '-')"""
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if not path or path == "-":
+        print(text)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    print(f"結果を保存しました: {path}")
+
+
+def synthetic_report(rng: random.Random, sentences: int) -> str:
+    """Japanese trial-report style text built from the food domain vocabulary"""
+    parts = []
+    for _ in range(sentences):
+        template = rng.choice([
+            "{app}の{issue}を目的として{ing}を{ratio}%添加し、{proc}後の状態を評価した。",
+            "{ing}{ratio}%配合品は{proc}工程後も{issue}の効果が認められた。",
+            "試作{n}回目：{app}向けに{ing}と{ing2}を併用し、{issue}について比較した。",
+            "{proc}条件を{temp}℃・{minutes}分に変更したところ、{app}の{issue}が改善した。",
+            "顧客要望により{app}の{issue}を検討。{ing}の添加量は{ratio}%が最適と判断した。"
+        ])
+        parts.append(template.format(
+            app=rng.choice(APPLICATIONS),
+            issue=rng.choice(ISSUES),
+            ing=rng.choice(INGREDIENTS),
+            ing2=rng.choice(INGREDIENTS),
+            proc=rng.choice(PROCESSES),
+            ratio=round(rng.uniform(0.05, 2.0), 2),
+            n=rng.randint(1, 30),
+            temp=rng.choice([4, 60, 85, 90, 121]),
+            minutes=rng.choice([5, 10, 20, 30, 40])
+        ))
+    return "\n".join(parts)
+
+
+def synthetic_query(rng: random.Random) -> str:
+    return rng.choice([
+        "{app}の{issue}",
+        "{app}で{issue}するには",
+        "{ing}を使った{app}の{issue}",
+        "{issue}に効く原料は？（{app}）"
+    ]).format(app=rng.choice(APPLICATIONS), issue=rng.choice(ISSUES), ing=rng.choice(INGREDIENTS))
@@ -0,0 +1,183 @@
+"""
+合成ドキュメント生成（xlsx / docx / pptx / pdf）
+
+試作報告書に近い構成のファイルを、`scale` に比例した大きさで生成します。
+"""
+import io
+import random
+from typing import Callable, Dict, List
+
+from docx import Document as DocxDocument
+from openpyxl import Workbook
+from pptx import Presentation
+from pptx.util import Inches
+
+from .common import APPLICATIONS, INGREDIENTS, ISSUES, PROCESSES, synthetic_report
+
+
+def _formulation_rows(rng: random.Random, rows: int) -> List[List]:
+    table = [["原料", "配合率(%)", "重量(g)", "備考"]]
+    for _ in range(rows):
+        ratio = round(rng.uniform(0.05, 30.0), 2)
+        table.append([rng.choice(INGREDIENTS), ratio, round(ratio * 10, 1), rng.choice(ISSUES)])
+    return table
+
+
+def build_xlsx(rng: random.Random, scale: int) -> bytes:
+    """Workbook with 配合 / 試作 formulation sheets and a free-text 製造工程 sheet"""
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+
+    for trial in range(1, scale + 1):
+        for sheet_name in (f"配合{trial}", f"試作{trial}"):
+            sheet = workbook.create_sheet(sheet_name)
+            sheet.append(["用途", rng.choice(APPLICATIONS), "課題", rng.choice(ISSUES)])
+            for row in _formulation_rows(rng, 40):
+                sheet.append(row)
+            sheet.append(["評価", synthetic_report(rng, 3)])
+
+    sheet = workbook.create_sheet("製造工程")
+    for step in range(1, 20 * scale + 1):
+        sheet.append([step, rng.choice(PROCESSES), synthetic_report(rng, 1)])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def build_docx(rng: random.Random, scale: int) -> bytes:
+    """Trial report with headings, paragraphs and a formulation table per section"""
+    doc = DocxDocument()
+    doc.add_heading(f"{rng.choice(APPLICATIONS)}の{rng.choice(ISSUES)} 試作報告書", level=1)
+
+    for section in range(1, scale + 1):
+        doc.add_heading(f"{section}. 試作{section}回目", level=2)
+        for _ in range(8):
+            doc.add_paragraph(synthetic_report(rng, 4))
+
+        rows = _formulation_rows(rng, 15)
+        table = doc.add_table(rows=len(rows), cols=len(rows[0]))
+        for row, values in zip(table.rows, rows):
+            for cell, value in zip(row.cells, values):
+                cell.text = str(value)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def build_pptx(rng: random.Random, scale: int) -> bytes:
+    """Presentation with a text box and a formulation table on every other slide"""
+    prs = Presentation()
+    layout = prs.slide_layouts[5]  # Title only
+
+    for slide_number in range(1, 4 * scale + 1):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"{rng.choice(APPLICATIONS)} {rng.choice(ISSUES)} 検討 {slide_number}"
+        textbox = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(2))
+        textbox.text_frame.text = synthetic_report(rng, 4)
+
+        if slide_number % 2 == 0:
+            rows = _formulation_rows(rng, 8)
+            shape = slide.shapes.add_table(len(rows), len(rows[0]), Inches(0.5), Inches(3.8), Inches(9), Inches(3))
+            for row, values in zip(shape.table.rows, rows):
+                for cell, value in zip(row.cells, values):
+                    cell.text = str(value)
+
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+
+def _to_unicode_cmap(characters) -> bytes:
+    """ToUnicode CMap mapping each UCS-2 character code used in the file to itself"""
+    entries = [f"<{ord(char):04X}> <{ord(char):04X}>" for char in sorted(characters)]
+    blocks = []
+    for start in range(0, len(entries), 100):  # At most 100 entries per bfchar block
+        block = entries[start:start + 100]
+        blocks.append(f"{len(block)} beginbfchar\n" + "\n".join(block) + "\nendbfchar")
+    return (
+        "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n"
+        "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+        "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+        + "\n".join(blocks)
+        + "\nendcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n"
+    ).encode("ascii")
+
+
+def build_pdf(rng: random.Random, scale: int, lines_per_page: int = 40) -> bytes:
+    """
+    Text PDF with Japanese text, built without a PDF library
+
+    Character codes are UCS-2 code points under Identity-H with a ToUnicode
+    map, so PdfReader extracts the original text. The font is not embedded
+    and the codes are not real Adobe-Japan1 CIDs: the file is meant for
+    extraction benchmarks, not for viewing.
+    """
+    lines = synthetic_report(rng, 2 * lines_per_page * scale).splitlines()
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    def stream(data: bytes) -> bytes:
+        return f"<< /Length {len(data)} >>\nstream\n".encode("ascii") + data + b"\nendstream"
+
+    catalog = add(b"")
+    pages_id = add(b"")
+    to_unicode = add(stream(_to_unicode_cmap(set("".join(lines)))))
+    descendant = add(
+        b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /HeiseiKakuGo-W5 "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (Japan1) /Supplement 2 >> "
+        b"/FontDescriptor << /Type /FontDescriptor /FontName /HeiseiKakuGo-W5 /Flags 4 "
+        b"/FontBBox [-92 -250 1010 922] /ItalicAngle 0 /Ascent 880 /Descent -120 "
+        b"/CapHeight 700 /StemV 80 >> /DW 1000 >>"
+    )
+    font = add(
+        f"<< /Type /Font /Subtype /Type0 /BaseFont /HeiseiKakuGo-W5 "
+        f"/Encoding /Identity-H /DescendantFonts [{descendant} 0 R] /ToUnicode {to_unicode} 0 R >>".encode("ascii")
+    )
+
+    page_ids = []
+    for page_lines in pages:
+        operations = ["BT", "/F1 10 Tf", "14 TL", "40 800 Td"]
+        for line in page_lines:
+            operations.append(f"<{line.encode('utf-16-be').hex().upper()}> Tj T*")
+        operations.append("ET")
+        content = add(stream("\n".join(operations).encode("ascii")))
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>".encode("ascii")
+        ))
+
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode("ascii")
+    objects[pages_id - 1] = (
+        f"<< /Type /Pages /Kids [{' '.join(f'{page} 0 R' for page in page_ids)}] /Count {len(page_ids)} >>"
+    ).encode("ascii")
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(output.tell())
+        output.write(f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n")
+    xref = output.tell()
+    output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii"))
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode("ascii"))
+    output.write(
+        f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    )
+    return output.getvalue()
+
+
+BUILDERS: Dict[str, Callable[[random.Random, int], bytes]] = {
+    "xlsx": build_xlsx,
+    "docx": build_docx,
+    "pptx": build_pptx,
+    "pdf": build_pdf
+}
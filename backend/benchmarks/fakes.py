@@ -0,0 +1,160 @@
+"""
+Azure サービスのローカル代替（ベンチマーク用）
+
+ネットワークに出ずに検索パイプラインを動かすため、埋め込みは決定的な
+ハッシュベクトル、回答生成と検索は設定したレイテンシだけ待って返します。
+"""
+import asyncio
+import hashlib
+import json
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from services.azure_services import AsyncAzureOpenAIService, format_search_result
+from services.keyword_index import tokenize
+from services.local_search import parse_filter
+
+EMBEDDING_DIM = 1536
+
+
+class Latency:
+    """Normally distributed delay (ms) clipped at zero"""
+
+    def __init__(self, mean_ms: float, jitter_ms: float = 0.0, seed: int = 0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.jitter_ms <= 0:
+            return self.mean_ms / 1000
+        return max(0.0, self._rng.gauss(self.mean_ms, self.jitter_ms)) / 1000
+
+    async def wait(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def deterministic_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """
+    Hashed bag-of-tokens vector, L2-normalized
+
+    Texts sharing vocabulary get similar vectors, so rankings behave like a
+    (weak) real embedding model and the same text always maps to the same
+    vector.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in tokenize(text) or [text]:
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dim] += 1.0 if (value >> 63) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+
+class FakeAsyncOpenAIService(AsyncAzureOpenAIService):
+    """
+    AsyncAzureOpenAIService without the network
+
+    Only the API calls are replaced; get_query_embedding is inherited so the
+    query embedding cache is exercised as in production.
+    """
+
+    def __init__(
+        self,
+        embedding_latency: Latency,
+        chat_latency: Latency,
+        stream_tokens: int = 40,
+        dim: int = EMBEDDING_DIM
+    ):
+        self.embedding_latency = embedding_latency
+        self.chat_latency = chat_latency
+        self.stream_tokens = stream_tokens
+        self.dim = dim
+        self.embedding_calls = 0
+        self.chat_calls = 0
+
+    async def get_embedding(self, text: str) -> List[float]:
+        self.embedding_calls += 1
+        await self.embedding_latency.wait()
+        return deterministic_embedding(text, self.dim)
+
+    async def generate_response(self, query: str, context: str, system_prompt: Optional[str] = None) -> str:
+        self.chat_calls += 1
+        await self.chat_latency.wait()
+        return self._answer(query, context)
+
+    async def stream_response(
+        self,
+        query: str,
+        context: str,
+        system_prompt: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        self.chat_calls += 1
+        total = self.chat_latency.sample()
+        answer = self._answer(query, context)
+        step = max(1, len(answer) // self.stream_tokens)
+        pieces = [answer[i:i + step] for i in range(0, len(answer), step)]
+        for piece in pieces:
+            await asyncio.sleep(total / len(pieces))
+            yield piece
+
+    async def close(self):
+        pass
+
+    @staticmethod
+    def _answer(query: str, context: str) -> str:
+        return f"「{query}」について、検索された{context.count('--- 案件')}件の案件から回答します。" * 4
+
+
+class FakeAsyncSearchService:
+    """
+    AsyncAzureSearchService stand-in: exact cosine search over an in-memory matrix
+
+    `records` are search documents as built by build_search_document
+    (content_vector included); the vectors are copied into one matrix.
+    """
+
+    def __init__(self, records: Sequence[Dict[str, Any]], latency: Latency):
+        self.latency = latency
+        self.records = [{k: v for k, v in record.items() if k != "content_vector"} for record in records]
+        self.metadata = [json.loads(record.get("metadata") or "{}") for record in records]
+        self.matrix = np.asarray([record["content_vector"] for record in records], dtype=np.float32)
+        self.calls = 0
+
+    async def search(
+        self,
+        query: str,
+        embedding: List[float],
+        top_k: int = 10,
+        filters: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        self.calls += 1
+        await self.latency.wait()
+        if not self.records:
+            return []
+
+        scores = self.matrix @ np.asarray(embedding, dtype=np.float32)
+        filter_values = parse_filter(filters)
+        if filter_values:
+            allowed = np.array([
+                all(metadata.get(field) == value for field, value in filter_values.items())
+                for metadata in self.metadata
+            ])
+            scores = np.where(allowed, scores, -np.inf)
+
+        k = min(top_k, len(scores))
+        rows = np.argpartition(-scores, k - 1)[:k]
+        rows = rows[np.argsort(-scores[rows])]
+        return [
+            format_search_result({**self.records[row], "@search.score": float(scores[row])})
+            for row in rows if np.isfinite(scores[row])
+        ]
+
+    async def close(self):
+        pass
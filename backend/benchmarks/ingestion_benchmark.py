@@ -0,0 +1,176 @@
+"""
+ドキュメント取り込み（テキスト抽出・チャンク分割）のベンチマーク
+
+合成した xlsx（配合/試作シート）・docx・pptx・pdf を段階的に大きくしながら
+DocumentProcessor.extract_text_from_file と chunk_text の処理時間を形式ごとに
+計測し、ピークメモリ（tracemalloc）とあわせて JSON で出力します。
+--baseline に以前の結果を渡すと比較し、許容幅を超えた悪化を報告します。
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.ingestion_benchmark --output ingestion.json
+    python -m benchmarks.ingestion_benchmark --scales 1,8,32 --formats xlsx,pdf
+    python -m benchmarks.ingestion_benchmark --baseline ingestion.json --fail-on-regression
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from .common import configure_environment, run_metadata, write_results
+
+# Compared against the baseline (lower is better)
+COMPARED_METRICS = ("extract_ms", "chunk_ms", "peak_memory_mb")
+
+# Changes smaller than this (ms or MB) are timer noise, not regressions
+MIN_REGRESSION_DELTA = 1.0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="テキスト抽出・チャンク分割のベンチマーク")
+    parser.add_argument("--formats", default="xlsx,docx,pptx,pdf", help="対象形式（カンマ区切り）")
+    parser.add_argument("--scales", default="1,4,16", help="ファイルの大きさの倍率（カンマ区切り）")
+    parser.add_argument("--repeat", type=int, default=3, help="各ケースの計測回数（中央値を採用）")
+    parser.add_argument("--chunk-size", type=int, default=None, help="既定は設定値 CHUNK_SIZE")
+    parser.add_argument("--chunk-overlap", type=int, default=None, help="既定は設定値 CHUNK_OVERLAP")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="-", help="結果 JSON の出力先（- は標準出力）")
+    parser.add_argument("--baseline", default=None, help="比較対象の結果 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="悪化とみなす増加率（0.25 = 25%%）")
+    parser.add_argument("--fail-on-regression", action="store_true", help="悪化があれば終了コード 1 を返す")
+    return parser.parse_args(argv)
+
+
+def _timed(fn, *args) -> Tuple[float, Any]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - started) * 1000, result
+
+
+def run_case(processor, fmt: str, scale: int, content: bytes, repeat: int, chunk_size, chunk_overlap) -> Dict[str, Any]:
+    """Time extraction and chunking of one file, then measure peak memory in a separate traced run"""
+    filename = f"benchmark.{fmt}"
+    extract_times, chunk_times = [], []
+    for _ in range(repeat):
+        elapsed, (text, _) = _timed(processor.extract_text_from_file, content, filename)
+        extract_times.append(elapsed)
+        elapsed, chunks = _timed(processor.chunk_text, text, chunk_size, chunk_overlap)
+        chunk_times.append(elapsed)
+
+    # tracemalloc slows allocation-heavy code down, so it is kept out of the timed runs
+    tracemalloc.start()
+    try:
+        text, _ = processor.extract_text_from_file(content, filename)
+        processor.chunk_text(text, chunk_size, chunk_overlap)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    extract_ms = statistics.median(extract_times)
+    return {
+        "format": fmt,
+        "scale": scale,
+        "file_bytes": len(content),
+        "text_chars": len(text),
+        "chunks": len(chunks),
+        "extract_ms": round(extract_ms, 2),
+        "extract_ms_min": round(min(extract_times), 2),
+        "chunk_ms": round(statistics.median(chunk_times), 2),
+        "chunk_ms_min": round(min(chunk_times), 2),
+        "extract_mb_per_second": round(len(content) / 1024 / 1024 / (extract_ms / 1000), 2) if extract_ms else None,
+        "peak_memory_mb": round(peak / 1024 / 1024, 2)
+    }
+
+
+def compare_to_baseline(cases: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    """Ratio of each metric to the baseline case with the same format and scale"""
+    previous = {(case["format"], case["scale"]): case for case in baseline.get("cases", [])}
+    comparisons, regressions = [], []
+    for case in cases:
+        before = previous.get((case["format"], case["scale"]))
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if not before.get(metric):
+                continue
+            ratio = round(case[metric] / before[metric], 3)
+            entry = {
+                "format": case["format"],
+                "scale": case["scale"],
+                "metric": metric,
+                "baseline": before[metric],
+                "current": case[metric],
+                "ratio": ratio
+            }
+            comparisons.append(entry)
+            if ratio > 1 + tolerance and case[metric] - before[metric] >= MIN_REGRESSION_DELTA:
+                regressions.append(entry)
+    return {
+        "baseline_commit": baseline.get("commit"),
+        "tolerance": tolerance,
+        "comparisons": comparisons,
+        "regressions": regressions
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from services.document_processor import DocumentProcessor
+    from .documents import BUILDERS
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in BUILDERS]
+    if unknown:
+        raise SystemExit(f"未対応の形式です: {', '.join(unknown)}（対応: {', '.join(BUILDERS)}）")
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+
+    processor = DocumentProcessor()
+    cases = []
+    for fmt in formats:
+        for scale in scales:
+            content = BUILDERS[fmt](random.Random(args.seed + scale), scale)
+            case = run_case(processor, fmt, scale, content, args.repeat, args.chunk_size, args.chunk_overlap)
+            print(
+                f"{fmt:5s} x{scale:<3d} {case['file_bytes'] / 1024:9.1f} KB  "
+                f"抽出 {case['extract_ms']:9.1f} ms  分割 {case['chunk_ms']:7.1f} ms  "
+                f"チャンク {case['chunks']:5d}  ピーク {case['peak_memory_mb']:7.1f} MB"
+            )
+            cases.append(case)
+
+    return {
+        **run_metadata("ingestion", vars(args)),
+        "cases": cases,
+        # ru_maxrss is KB on Linux
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    configure_environment()
+
+    results = run(args)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            results["comparison"] = compare_to_baseline(results["cases"], json.load(f), args.tolerance)
+        for entry in results["comparison"]["regressions"]:
+            print(
+                f"悪化: {entry['format']} x{entry['scale']} {entry['metric']} "
+                f"{entry['baseline']} -> {entry['current']} ({entry['ratio']}倍)"
+            )
+    write_results(args.output, results)
+
+    if args.fail_on_regression and results.get("comparison", {}).get("regressions"):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+検索 API のオフライン・エンドツーエンドベンチマーク
+
+Azure OpenAI / Azure AI Search をローカル代替（benchmarks/fakes.py）に置き換え、
+合成コーパスを入れた使い捨ての SQLite に対して /api/search（または
+/api/search/stream）へ並列にリクエストを送り、並列度ごとのスループット、
+レイテンシ分位点（p50/p95/p99）、ステージ別の内訳を JSON で出力します。
+実行ごとにコミットハッシュを記録するので、変更前後の比較に使えます。
+
+使い方（backend ディレクトリで実行）:
+    python -m benchmarks.search_benchmark --concurrency 1,8,32 --requests 200 --output search.json
+    python -m benchmarks.search_benchmark --backend local --local-search-mode hybrid
+    python -m benchmarks.search_benchmark --endpoint stream --chat-ms 1500
+
+外部サービスには一切接続しません。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from .common import configure_environment, run_metadata, summarize, synthetic_query, synthetic_report, write_results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="検索 API のオフラインベンチマーク")
+    parser.add_argument("--concurrency", default="1,4,16", help="並列度（カンマ区切り）")
+    parser.add_argument("--requests", type=int, default=100, help="並列度ごとのリクエスト数")
+    parser.add_argument("--warmup", type=int, default=5, help="並列度ごとの計測前リクエスト数")
+    parser.add_argument("--endpoint", choices=["search", "stream"], default="search")
+    parser.add_argument("--backend", choices=["fake", "local"], default="fake",
+                        help="fake: 固定レイテンシの代替検索 / local: ローカルベクトル検索エンジン")
+    parser.add_argument("--local-search-mode", choices=["hybrid", "vector", "keyword"], default="hybrid")
+    parser.add_argument("--documents", type=int, default=300, help="合成ドキュメント数")
+    parser.add_argument("--chunks-per-document", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50, help="クエリの種類数（繰り返し送信）")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--embedding-ms", type=float, default=40.0, help="埋め込み API の平均レイテンシ")
+    parser.add_argument("--search-ms", type=float, default=60.0, help="検索 API の平均レイテンシ（fake のみ）")
+    parser.add_argument("--chat-ms", type=float, default=400.0, help="回答生成の平均レイテンシ")
+    parser.add_argument("--jitter", type=float, default=0.2, help="レイテンシのばらつき（平均に対する標準偏差の比）")
+    parser.add_argument("--response-cache", action="store_true", help="応答キャッシュを有効にする（既定は無効）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="-", help="結果 JSON の出力先（- は標準出力）")
+    return parser.parse_args(argv)
+
+
+def seed_corpus(db, documents: int, chunks_per_document: int, seed: int) -> List[Dict[str, Any]]:
+    """Insert completed documents and their chunks; returns the search index documents"""
+    from models import Document, DocumentChunk
+    from services.local_search import build_search_document
+    from .common import APPLICATIONS, CUSTOMERS, INGREDIENTS, ISSUES
+    from .fakes import deterministic_embedding
+
+    rng = random.Random(seed)
+    records = []
+    for doc_number in range(1, documents + 1):
+        application, issue = rng.choice(APPLICATIONS), rng.choice(ISSUES)
+        ingredient, customer = rng.choice(INGREDIENTS), rng.choice(CUSTOMERS)
+        trial_id = f"T{doc_number:05d}"
+        filename = f"{application}_{issue}_{ingredient}_{customer}_{trial_id}.xlsx"
+        doc = Document(
+            filename=filename,
+            original_filename=filename,
+            file_type="excel",
+            file_size=0,
+            blob_url=f"https://benchmark.invalid/{filename}",
+            application=application,
+            issue=issue,
+            ingredient=ingredient,
+            customer=customer,
+            trial_id=trial_id,
+            status="completed"
+        )
+        db.add(doc)
+        db.flush()
+
+        for chunk_index in range(chunks_per_document):
+            chunk = DocumentChunk(
+                document_id=doc.id,
+                chunk_index=chunk_index,
+                content=synthetic_report(rng, rng.randint(6, 12)),
+                sheet_name="配合",
+                search_id=f"{doc.id}_{chunk_index}"
+            )
+            db.add(chunk)
+            records.append(build_search_document(doc, chunk, deterministic_embedding(chunk.content)))
+    db.commit()
+    return records
+
+
+async def _search_once(client, headers: Dict[str, str], query: str, top_k: int) -> Dict[str, float]:
+    response = await client.post(
+        "/api/search",
+        json={"query": query, "top_k": top_k, "debug": True},
+        headers=headers
+    )
+    response.raise_for_status()
+    return dict(response.json()["debug"]["timings"])
+
+
+async def _stream_once(client, headers: Dict[str, str], query: str, top_k: int) -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    event = None
+    async with client.stream(
+        "POST",
+        "/api/search/stream",
+        json={"query": query, "top_k": top_k},
+        headers=headers
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event == "error":
+                    raise RuntimeError(json.loads(line[len("data: "):])["detail"])
+                if event == "done":
+                    timings = dict(json.loads(line[len("data: "):])["timings"])
+    return timings
+
+
+async def run_level(
+    client,
+    headers: Dict[str, str],
+    queries: List[str],
+    concurrency: int,
+    requests: int,
+    warmup: int,
+    endpoint: str,
+    top_k: int
+) -> Dict[str, Any]:
+    """Send `requests` requests from `concurrency` concurrent clients"""
+    from services.cache import get_embedding_cache, get_response_cache
+
+    send = _stream_once if endpoint == "stream" else _search_once
+    counter = itertools.count()
+
+    # Every level starts cold so levels are comparable
+    get_embedding_cache().clear()
+    get_response_cache().clear()
+
+    for i in range(warmup):
+        await send(client, headers, queries[i % len(queries)], top_k)
+
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors: List[str] = []
+
+    async def client_loop():
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            started = time.perf_counter()
+            try:
+                timings = await send(client, headers, queries[i % len(queries)], top_k)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            for name, value in timings.items():
+                if name.endswith("_ms"):
+                    stages.setdefault(name[:-3], []).append(value)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "duration_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {name: summarize(values) for name, values in stages.items()}
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    import main as app_module
+    from auth import create_access_token
+    from database import SessionLocal, init_db
+    from services.history_writer import get_search_history_writer
+    from .fakes import FakeAsyncOpenAIService, FakeAsyncSearchService, Latency
+
+    init_db()
+    db = SessionLocal()
+    try:
+        print(f"合成コーパスを作成中: {args.documents} 件 x {args.chunks_per_document} チャンク")
+        records = seed_corpus(db, args.documents, args.chunks_per_document, args.seed)
+    finally:
+        db.close()
+
+    await app_module.startup_event()
+
+    service = app_module.search_service
+    service.openai_service = FakeAsyncOpenAIService(
+        Latency(args.embedding_ms, args.embedding_ms * args.jitter, args.seed),
+        Latency(args.chat_ms, args.chat_ms * args.jitter, args.seed + 1)
+    )
+    if args.backend == "local":
+        from services.local_search import get_local_search_service
+        get_local_search_service().upload_documents(records)
+    else:
+        service.search_service = FakeAsyncSearchService(
+            records, Latency(args.search_ms, args.search_ms * args.jitter, args.seed + 2)
+        )
+
+    rng = random.Random(args.seed)
+    queries = [synthetic_query(rng) for _ in range(args.queries)]
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+    levels = []
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+        for concurrency in [int(value) for value in args.concurrency.split(",") if value.strip()]:
+            print(f"並列度 {concurrency}: {args.requests} リクエスト")
+            level = await run_level(
+                client, headers, queries, concurrency, args.requests, args.warmup, args.endpoint, args.top_k
+            )
+            print(
+                f"  {level['requests_per_second']} req/s, "
+                f"p50 {level['latency_ms']['p50']} ms, p95 {level['latency_ms']['p95']} ms, "
+                f"p99 {level['latency_ms']['p99']} ms, errors {level['errors']}"
+            )
+            levels.append(level)
+
+    history = get_search_history_writer().stats()
+    await app_module.shutdown_event()
+
+    return {
+        **run_metadata("search", vars(args)),
+        "corpus": {"documents": args.documents, "chunks": len(records)},
+        "levels": levels,
+        "history_writer": history
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="fk-search-bench-")
+    configure_environment(os.path.join(work_dir, "bench.db"))
+    os.environ["SEARCH_BACKEND"] = args.backend if args.backend == "local" else "azure"
+    os.environ["LOCAL_INDEX_DIR"] = os.path.join(work_dir, "index")
+    os.environ["LOCAL_SEARCH_MODE"] = args.local_search_mode
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if args.response_cache else "false"
+    os.environ["SEARCH_ROLLUP_INTERVAL_SECONDS"] = "3600"
+
+    results = asyncio.run(run(args))
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""
+ローカルベクトル検索インデックスを構築するスクリプト
+
+DocumentChunk（処理完了済みドキュメント）から埋め込みを生成し、
+SEARCH_BACKEND=local で使用するインデックスを LOCAL_INDEX_DIR に作成します。
+保存済みの埋め込み（chunk_embeddings）があるチャンクは Azure OpenAI を呼び出しません。
+"""
+import time
+
+from config import get_settings
+from database import SessionLocal
+from services.azure_services import AzureOpenAIService
+from services.embedding_store import embed_with_store
+from services.local_search import get_local_search_service
+
+settings = get_settings()
+db = SessionLocal()
+
+try:
+    print(f"インデックス出力先: {settings.local_index_dir} (dtype: {settings.local_index_dtype})")
+    openai_service = AzureOpenAIService()
+    local_index = get_local_search_service()
+
+    start = time.time()
+    count = local_index.rebuild_from_chunks(
+        db,
+        lambda texts: embed_with_store(openai_service.get_embeddings_batch, texts),
+        batch_size=settings.embedding_batch_size
+    )
+    print(f"✅ {count}件のチャンクをインデックスしました（{time.time() - start:.1f}秒）")
+    print(f"   {local_index.stats()}")
+
+except Exception as e:
+    print(f"❌ エラーが発生しました: {e}")
+    import traceback
+    traceback.print_exc()
+finally:
+    db.close()
@@ -26,6 +26,17 @@ class Settings(BaseSettings):
     azure_search_api_key: str = ""
     azure_search_index_name: str = "food-knowledge-unitech"
 
+    # Search backend: "azure" (Azure AI Search) or "local" (embedded vector index)
+    search_backend: str = "azure"
+    local_index_dir: str = "./local_index"
+    local_index_dtype: str = "float32"  # float32 | int8
+    local_hnsw_threshold: int = 20000  # Switch from brute force to the HNSW graph above this many chunks
+    local_hnsw_m: int = 16
+    local_hnsw_ef_construction: int = 100
+    local_hnsw_ef_search: int = 64
+    local_search_mode: str = "hybrid"  # hybrid (vector + BM25 via RRF) | vector | keyword
+    local_rrf_k: int = 60
+
     # Azure Document Intelligence (rg-unitech-docintel)
     azure_doc_intelligence_endpoint: str = "https://rg-unitech-docintel.cognitiveservices.azure.com/"
     azure_doc_intelligence_key: str = ""
@@ -50,12 +61,103 @@ class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite:///./food_knowledge.db"
 
+    # Client-side Azure OpenAI quota per deployment (TPM 0 disables limiting)
+    openai_rate_limit_enabled: bool = True
+    azure_openai_chat_tpm: int = 30000
+    azure_openai_chat_rpm: int = 0  # 0: derive from TPM (Azure grants 6 RPM per 1000 TPM)
+    azure_openai_embedding_tpm: int = 120000
+    azure_openai_embedding_rpm: int = 0
+    openai_interactive_reserve: float = 0.2  # Share of the quota ingestion may not use
+    openai_max_retries: int = 6  # Retries on 429, timeouts and 5xx
+    openai_backoff_base_seconds: float = 1.0
+    openai_backoff_max_seconds: float = 60.0
+
+    # Async HTTP connection pool for Azure calls on the search path
+    azure_http_max_connections: int = 200
+    azure_http_max_keepalive: int = 50
+    azure_http_timeout_seconds: float = 60.0
+
     # Search Configuration
     search_top_k: int = 10
     similarity_threshold: float = 0.7
     chunk_size: int = 1000
     chunk_overlap: int = 200
 
+    # RAG context sent to the LLM (retrieved text only, excluding prompt and query)
+    context_token_budget: int = 6000
+    context_min_block_tokens: int = 200  # Smallest truncated case worth adding
+    context_token_encoding: str = "o200k_base"  # gpt-4o / gpt-4o-mini
+
+    # Chunk embeddings at ingestion are requested in batches
+    embedding_batch_size: int = 64  # Inputs per embeddings request
+    embedding_batch_max_tokens: int = 50000  # Total input tokens per request
+    embedding_max_input_tokens: int = 8191  # Per-input limit of the embedding models
+    embedding_concurrency: int = 4  # Batch requests in flight per document
+    embedding_token_encoding: str = "cl100k_base"  # text-embedding-ada-002 / text-embedding-3
+    chunk_embedding_store_enabled: bool = True  # Reuse stored vectors of identical chunk text (chunk_embeddings)
+
+    # Uploads stream to temporary files; blob transfers use parallel blocks
+    upload_max_bytes: int = 200 * 1024 * 1024  # Per file; larger requests are refused with 413
+    blob_upload_block_bytes: int = 8 * 1024 * 1024
+    blob_transfer_concurrency: int = 4  # Blocks in flight per upload / download
+    upload_staging_dir: str = "./upload_staging"  # Uploads wait here for a worker when blob storage is not configured
+    bulk_upload_max_bytes: int = 2 * 1024 * 1024 * 1024  # Whole bulk request (files or ZIP archives)
+    bulk_upload_max_files: int = 1000  # Documents per bulk upload, ZIP members included
+    bulk_upload_concurrency: int = 8  # Files of one bulk upload stored to blob storage at once
+
+    # Text extraction runs in child processes, off the API process's GIL
+    extraction_pool_enabled: bool = True
+    extraction_workers: int = 2  # Processes; files beyond this wait for a free one
+    extraction_timeout_seconds: float = 120.0  # Per file; the worker is killed after this
+    extraction_memory_limit_mb: int = 1024  # Address-space limit per worker (0 = none; ignored on Windows)
+    extraction_max_jobs_per_worker: int = 50  # Replace a worker after this many files
+
+    # Durable ingestion job queue (ingestion_jobs table)
+    ingestion_embedded_workers: bool = True  # Run workers inside the API process; False = worker.py only
+    ingestion_worker_concurrency: int = 2  # Jobs processed at once per process
+    ingestion_lease_seconds: int = 300  # A job whose worker stops heartbeating is retried after this
+    ingestion_heartbeat_seconds: int = 30
+    ingestion_poll_seconds: float = 2.0
+    ingestion_max_attempts: int = 3
+    ingestion_retry_backoff_seconds: int = 60  # Doubled after each failed attempt
+    ingestion_shutdown_timeout_seconds: float = 60.0  # Drain time before running jobs are handed back
+    ingestion_job_retention_days: int = 7
+
+    # Query embedding cache
+    embedding_cache_enabled: bool = True
+    embedding_cache_size: int = 1024
+    embedding_cache_ttl_seconds: int = 86400
+    embedding_cache_path: str = ""  # SQLite file shared by all workers (empty: memory only)
+    embedding_cache_disk_ttl_seconds: int = 2592000
+
+    # Search response cache (invalidated by index generation)
+    response_cache_enabled: bool = True
+    response_cache_size: int = 256
+    response_cache_ttl_seconds: int = 3600
+
+    # Document metadata cache used when formatting search results
+    document_metadata_cache_size: int = 4096
+    document_metadata_cache_ttl_seconds: int = 600
+
+    # Search history is written in bulk by a background writer
+    search_history_batch_size: int = 100
+    search_history_flush_interval_seconds: float = 1.0
+    search_history_queue_size: int = 10000
+
+    # Seconds between checks for facet changes made by other workers
+    facet_cache_check_seconds: float = 5.0
+
+    # Seconds /api/admin/stats may serve the same dashboard totals
+    system_stats_cache_seconds: float = 10.0
+
+    # Hourly search analytics rollup job
+    search_rollup_interval_seconds: float = 60.0
+    search_rollup_settle_seconds: float = 30.0  # Leave history younger than this for the next run
+
+    # Prometheus /metrics endpoint (optional bearer token for the scraper)
+    metrics_enabled: bool = True
+    metrics_token: str = ""
+
     class Config:
         env_file = ".env"
         extra = "ignore"
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 from config import get_settings
 from models import Base
@@ -36,6 +36,34 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+
+def _add_missing_columns():
+    """Add columns introduced after a table was first created (create_all only creates new tables)"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            added = set()
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                print(f">> Adding column {table.name}.{column.name} ({column_type})")
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                added.add(column.name)
+
+            # Indexes on the new columns (index=True) are not created by create_all either
+            for index in table.indexes:
+                if added & {column.name for column in index.columns}:
+                    print(f">> Creating index {index.name}")
+                    index.create(conn)
 
 
 def get_db():
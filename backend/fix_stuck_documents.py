@@ -3,6 +3,7 @@
 """
 from database import SessionLocal
 from models import Document
+from services.document_status import set_document_status
 from datetime import datetime, timedelta
 
 db = SessionLocal()
@@ -28,7 +29,7 @@ try:
             print(f"  登録日時: {doc.created_at}")
             
             # ステータスを "error" に更新
-            doc.status = "error"
+            set_document_status(db, doc, "error")
             doc.error_message = "処理がタイムアウトしました。Azure サービスの接続設定を確認してください。"
             print(f"  → ステータスを 'error' に更新しました\n")
         
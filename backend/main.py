@@ -1,23 +1,27 @@
+import asyncio
 import os
+import time
 import uuid
 import json
-from datetime import timedelta, datetime, timezone
-from typing import Optional
+import zipfile
+from datetime import timedelta
+from typing import List, Optional, Tuple
 
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from config import get_settings
 from database import get_db, init_db
-from models import User, Document, DocumentChunk, SearchHistory
+from models import User, Document, DocumentChunk, IngestionJob, UploadBatch
 from schemas import (
     UserCreate, UserResponse, Token, ProfileUpdate, PasswordChange,
     UserUpdate, UserListResponse, SearchRequest, SearchResponse,
     DocumentUploadResponse, DocumentResponse, DocumentListResponse,
-    FacetsResponse, SearchHistoryItem, SystemStats
+    FacetsResponse, SearchHistoryItem, SystemStats, SearchAnalyticsResponse,
+    BulkUploadResponse, UploadBatchResponse, BatchFileStatus
 )
 from auth import (
     get_password_hash, authenticate_user, create_access_token,
@@ -25,7 +29,26 @@ from auth import (
 )
 from services.document_processor import DocumentProcessor
 from services.search_service import SearchService
-from services.azure_services import AzureSearchService, AzureBlobService, AzureOpenAIService
+from services.azure_services import AzureBlobService, AsyncAzureBlobService
+from services.search_backend import get_search_backend
+from services.cache import (
+    get_embedding_cache, get_response_cache, get_document_metadata_cache, bump_index_generation
+)
+from services.history_writer import get_search_history_writer
+from services.facets import ensure_facets
+from services.document_status import set_document_status, on_document_created, on_document_deleted
+from services.stats import ensure_counters, get_system_stats as load_system_stats
+from services.analytics import get_search_rollup_job, get_search_timeseries
+from services.extraction_pool import get_extraction_pool
+from services.dedup import blob_shared, find_processed_duplicate, hash_file
+from services.uploads import (
+    ALLOWED_EXTENSIONS, ArchiveMemberError, UploadSizeLimitMiddleware,
+    copy_member, member_filename, remove_staged_upload, stage_upload, too_large_message, upload_size
+)
+from services.job_queue import enqueue_document, get_ingestion_worker_pool, get_queue_stats
+from services.metrics import (
+    HTTP_REQUESTS, HTTP_REQUEST_DURATION, render_metrics
+)
 
 # Application startup logging
 print("=" * 70)
@@ -58,6 +81,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Refuse oversized uploads while they stream in, before they fill the temp directory
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=settings.upload_max_bytes,
+    paths=["/api/documents/upload"]
+)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=settings.bulk_upload_max_bytes,
+    paths=["/api/documents/bulk-upload"]
+)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and time them per route template (for /metrics)"""
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.inc(method=request.method, route=route_path, status=str(status_code))
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, method=request.method, route=route_path)
+
 print(">> CORS middleware configured")
 
 # Initialize services
@@ -66,6 +117,7 @@ doc_processor = DocumentProcessor()
 print(">> DocumentProcessor initialized")
 search_service = SearchService()
 print(">> SearchService initialized")
+blob_uploader = AsyncAzureBlobService()
 print("=" * 70)
 
 
@@ -108,9 +160,16 @@ async def startup_event():
         try:
             create_initial_admin(db)
             print(">> Initial admin user verified/created successfully")
+            ensure_facets(db)
+            ensure_counters(db)
         finally:
             db.close()
 
+        get_search_history_writer().start()
+        get_search_rollup_job().start()
+        if settings.ingestion_embedded_workers:
+            get_ingestion_worker_pool().start()
+
         print("=" * 60)
         print(">> Startup completed successfully")
         print("=" * 60)
@@ -135,6 +194,16 @@ async def startup_event():
         print("=" * 60)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued search history, drain ingestion jobs and close pooled connections to Azure"""
+    await search_service.close()
+    await blob_uploader.close()
+    # Both join worker threads; drain them off the event loop
+    await asyncio.to_thread(get_search_rollup_job().close)
+    await asyncio.to_thread(get_ingestion_worker_pool().close)
+
+
 # =============================================================================
 # Auth endpoints
 # =============================================================================
@@ -244,17 +313,65 @@ async def search(
     - 「米粉パンを膨らませる方法」
     - 「ヨーグルトのテクスチャ改善」
     """
-    result = search_service.search(
+    result = await search_service.search(
         query=request.query,
         db=db,
         user_id=current_user.id,
         top_k=request.top_k,
-        filters=request.filters
+        filters=request.filters,
+        debug=request.debug
     )
 
     return SearchResponse(**result)
 
 
+def format_sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/search/stream")
+async def search_stream(
+    request: SearchRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    自然言語検索（Server-Sent Events）
+
+    検索結果を `results` イベントで即座に返し、回答を `token` イベントで
+    生成され次第送信し、最後に `done` イベントで所要時間を返します。
+    """
+    user_id = current_user.id
+
+    async def event_stream():
+        from database import SessionLocal
+
+        # The stream outlives the request dependencies, so it owns its session
+        db = SessionLocal()
+        try:
+            async for event, data in search_service.search_stream(
+                query=request.query,
+                db=db,
+                user_id=user_id,
+                top_k=request.top_k,
+                filters=request.filters
+            ):
+                yield format_sse(event, data)
+        except Exception as e:
+            print(f"Streaming search failed: {e}")
+            import traceback
+            traceback.print_exc()
+            yield format_sse("error", {"detail": f"検索に失敗しました: {str(e)}"})
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/search/history", response_model=list[SearchHistoryItem])
 async def get_search_history(
     limit: int = 50,
@@ -268,11 +385,18 @@ async def get_search_history(
 
 @app.get("/api/search/facets", response_model=FacetsResponse)
 async def get_facets(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """フィルターオプション（ファセット）取得"""
-    facets = search_service.get_facets(db)
+    """フィルターオプション（ファセット）取得（件数付き・ETag対応）"""
+    facets, etag = search_service.get_facets(db)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
     return FacetsResponse(**facets)
 
 
@@ -337,7 +461,6 @@ async def get_document_download_url(
 
 @app.post("/api/documents/upload", response_model=DocumentUploadResponse)
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_admin_user)
@@ -348,23 +471,88 @@ async def upload_document(
     対応フォーマット: Excel, Word, PowerPoint, PDF, 画像
     """
     # Validate file type
-    allowed_extensions = {".xlsx", ".xls", ".docx", ".doc", ".pptx", ".ppt", ".pdf", ".png", ".jpg", ".jpeg"}
     ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in allowed_extensions:
+    if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"非対応のファイル形式です: {ext}")
 
-    # Read file content
-    content = await file.read()
+    # The body was spooled to a temporary file while streaming in; never read it whole
+    file_size = upload_size(file)
+    if file_size > settings.upload_max_bytes > 0:
+        raise HTTPException(status_code=413, detail=too_large_message(settings.upload_max_bytes))
+
+    # Identical files (renamed or re-uploaded) reuse the stored file and processing results
+    content_hash = await asyncio.to_thread(hash_file, file.file)
+    duplicate = find_processed_duplicate(db, content_hash)
+    if duplicate is not None and duplicate.blob_url:
+        stored = (duplicate.filename, duplicate.blob_url, None)
+    else:
+        stored = await store_upload(file.file, ext, file_size)
+    doc = add_document(db, file.filename, file_size, content_hash, stored)
+    db.commit()
+    db.refresh(doc)
+    get_document_metadata_cache().put(doc)
+    get_ingestion_worker_pool().wake()
+
+    message = "ドキュメントをアップロードしました。処理中です。"
+    if duplicate is not None:
+        message = f"同じ内容のドキュメント（ID: {duplicate.id}）が登録済みのため、処理結果を再利用します。"
+
+    return DocumentUploadResponse(
+        id=doc.id,
+        filename=file.filename,
+        status="pending",
+        message=message
+    )
+
+
+async def store_upload(file_obj, ext: str, file_size: int) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Put an uploaded file where the ingestion worker will read it
+
+    Returns (blob name, blob URL, staged path). The file goes to blob
+    storage, or is copied to the staging directory when blob storage is
+    not configured. A failed blob upload raises 503.
+    """
+    blob_name = f"{uuid.uuid4()}{ext}"
+    if not settings.azure_storage_connection_string:
+        # No blob storage: the worker reads a local copy of the file
+        return blob_name, None, await asyncio.to_thread(stage_upload, file_obj, ext)
+
+    # Upload to blob storage from the temporary file; the worker reads it back from there
+    try:
+        return blob_name, await blob_uploader.upload_file(file_obj, blob_name, file_size), None
+    except Exception as e:
+        print(f"Blob upload failed: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="ファイルの保存に失敗しました（Blob Storage）。しばらくしてから再度お試しください"
+        )
+
+
+def add_document(
+    db: Session,
+    filename: str,
+    file_size: int,
+    content_hash: str,
+    stored: Tuple[str, Optional[str], Optional[str]],
+    batch_id: Optional[int] = None
+) -> Document:
+    """Add the Document of a stored upload and its ingestion job to the session (not committed)"""
+    blob_name, blob_url, staged_path = stored
+    ext = os.path.splitext(filename)[1].lower()
 
     # Parse filename for metadata
-    metadata = doc_processor.parse_filename(file.filename)
+    metadata = doc_processor.parse_filename(filename)
 
     # Create document record
     doc = Document(
-        filename=f"{uuid.uuid4()}{ext}",
-        original_filename=file.filename,
+        filename=blob_name,
+        original_filename=filename,
         file_type=ext[1:],
-        file_size=len(content),
+        file_size=file_size,
+        blob_url=blob_url,
+        content_hash=content_hash,
+        batch_id=batch_id,
         application=metadata.get("application"),
         issue=metadata.get("issue"),
         ingredient=metadata.get("ingredient"),
@@ -373,147 +561,197 @@ async def upload_document(
         status="pending"
     )
     db.add(doc)
-    db.commit()
-    db.refresh(doc)
-
-    # Process document in background
-    background_tasks.add_task(process_document_task, doc.id, content)
-
-    return DocumentUploadResponse(
-        id=doc.id,
-        filename=file.filename,
-        status="pending",
-        message="ドキュメントをアップロードしました。処理中です。"
-    )
+    on_document_created(db, doc)
+    db.flush()
 
+    # Queue processing in the same transaction, so an accepted upload is never lost
+    enqueue_document(db, doc.id, staged_path)
+    return doc
 
-def process_document_task(document_id: int, content: bytes):
-    """Background task to process and index document"""
-    from database import SessionLocal
-    
-    # Create a new database session for the background task
-    db = SessionLocal()
-    
-    try:
-        doc = db.query(Document).filter(Document.id == document_id).first()
-        if not doc:
-            print(f"Document {document_id} not found")
-            return
-
-        print(f"Processing document {document_id}: {doc.original_filename}")
-        doc.status = "processing"
-        db.commit()
-
-        # Extract text and structured data
-        print(f"Extracting text from {doc.original_filename}...")
-        text, structured_data = doc_processor.extract_text_from_file(content, doc.original_filename)
-        doc.extracted_text = text
-        doc.structured_data = structured_data
-        print(f"Extracted {len(text)} characters")
-
-        # Upload to blob storage
-        try:
-            print("Uploading to blob storage...")
-            blob_service = AzureBlobService()
-            blob_url = blob_service.upload_file(content, doc.filename)
-            doc.blob_url = blob_url
-            print(f"Blob uploaded: {blob_url}")
-        except Exception as e:
-            print(f"Blob upload failed: {e}")
-            import traceback
-            traceback.print_exc()
 
-        # Chunk text
-        print("Chunking text...")
-        chunks = doc_processor.chunk_text(text)
-        print(f"Created {len(chunks)} chunks")
+@app.post("/api/documents/bulk-upload", response_model=BulkUploadResponse)
+async def bulk_upload_documents(
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    ドキュメント一括アップロード
 
-        # Generate embeddings and index
+    複数ファイル、または ZIP アーカイブ（中のファイルを1件ずつ登録）を受け付けます。
+    登録できなかったファイルは理由とともに返し、残りのファイルは登録します。
+    進捗は GET /api/documents/batches/{batch_id} で確認できます。
+    """
+    batch = UploadBatch(user_id=current_user.id)
+    db.add(batch)
+    db.flush()
+
+    # Files are stored concurrently (at most BULK_UPLOAD_CONCURRENCY at once, which also
+    # bounds the unpacked ZIP members on disk); documents are created afterwards, in order
+    slots = asyncio.Semaphore(max(settings.bulk_upload_concurrency, 1))
+    accepted = []  # (filename, size, content hash, storing task)
+    rejected = []
+    storing = {}  # Content hash -> task storing it to blob storage, shared by identical files
+
+    def check(ext: str) -> Optional[str]:
+        """Reason a file cannot be registered before it is read"""
+        if ext not in ALLOWED_EXTENSIONS:
+            return f"非対応のファイル形式です: {ext}"
+        if len(accepted) >= settings.bulk_upload_max_files > 0:
+            return f"一括アップロードの上限（{settings.bulk_upload_max_files}件）を超えています"
+        return None
+
+    async def store(file_obj, ext: str, file_size: int, owned: bool):
+        """Store one file, then free its slot (and its unpacked copy)"""
         try:
-            print("Generating embeddings and indexing...")
-            
-            # Check Azure service configuration
-            from config import get_settings
-            settings = get_settings()
-            
-            if not settings.azure_openai_api_key:
-                raise ValueError("Azure OpenAI API キーが設定されていません。.env ファイルを確認してください。")
-            
-            if not settings.azure_search_api_key:
-                raise ValueError("Azure Search API キーが設定されていません。.env ファイルを確認してください。")
-            
-            openai_service = AzureOpenAIService()
-            search_service_azure = AzureSearchService()
-
-            search_docs = []
-            for i, chunk in enumerate(chunks):
-                if i % 10 == 0:
-                    print(f"Processing chunk {i+1}/{len(chunks)}...")
-                
-                embedding = openai_service.get_embedding(chunk)
-
-                # Create chunk record
-                chunk_record = DocumentChunk(
-                    document_id=doc.id,
-                    chunk_index=i,
-                    content=chunk,
-                    sheet_name=None,  # TODO: Extract from structured_data
-                    search_id=f"{doc.id}_{i}"
-                )
-                db.add(chunk_record)
-
-                # Prepare search document (matching actual index schema)
-                # Prepare metadata JSON with additional fields
-                metadata_dict = {
-                    "application": doc.application,
-                    "issue": doc.issue,
-                    "ingredient": doc.ingredient,
-                    "customer": doc.customer,
-                    "trial_id": doc.trial_id,
-                    "sheet_name": chunk_record.sheet_name
-                }
-
-                search_doc = {
-                    "id": f"{doc.id}_{i}",
-                    "document_id": str(doc.id),  # Convert to string to match schema
-                    "content": chunk,
-                    "title": doc.original_filename,  # Use "title" field instead of "filename"
-                    "chunk_index": i,
-                    "metadata": json.dumps(metadata_dict, ensure_ascii=False),  # Store additional fields as JSON
-                    "created_at": datetime.now(timezone.utc).isoformat(),
-                    "content_vector": embedding
-                }
-                search_docs.append(search_doc)
-
-            # Upload to search index
-            print(f"Uploading {len(search_docs)} documents to search index...")
-            search_service_azure.upload_documents(search_docs)
-
-            from models import get_jst_now
-            doc.indexed_at = get_jst_now()
-            doc.status = "completed"
-            print(f"Document {document_id} processing completed successfully")
+            return await store_upload(file_obj, ext, file_size)
+        finally:
+            if owned:
+                file_obj.close()
+            slots.release()
+
+    def add(file_obj, filename: str, file_size: int, content_hash: str, owned: bool = False):
+        """Schedule storing a file; the caller has acquired a slot for it"""
+        ext = os.path.splitext(filename)[1].lower()
+        duplicate = find_processed_duplicate(db, content_hash)
+        shared = duplicate is not None and duplicate.blob_url
+        if shared or (settings.azure_storage_connection_string and content_hash in storing):
+            if owned:
+                file_obj.close()
+            slots.release()
+            if shared:
+                task = asyncio.get_running_loop().create_future()
+                task.set_result((duplicate.filename, duplicate.blob_url, None))
+            else:
+                task = storing[content_hash]
+        else:
+            task = asyncio.create_task(store(file_obj, ext, file_size, owned))
+            storing[content_hash] = task
+        accepted.append((filename, file_size, content_hash, task))
 
-        except Exception as e:
-            print(f"Indexing failed: {e}")
-            import traceback
-            traceback.print_exc()
-            doc.status = "error"
-            doc.error_message = str(e)
+    try:
+        for file in files:
+            ext = os.path.splitext(file.filename)[1].lower()
+            if ext == ".zip":
+                # Members are decompressed one at a time to a temporary file, never the whole archive
+                try:
+                    archive = zipfile.ZipFile(file.file)
+                except zipfile.BadZipFile:
+                    rejected.append({"filename": file.filename, "reason": "ZIP ファイルを読み込めません"})
+                    continue
+                with archive:
+                    for info in archive.infolist():
+                        filename = member_filename(info)
+                        if filename is None:
+                            continue
+                        reason = check(os.path.splitext(filename)[1].lower())
+                        if reason:
+                            rejected.append({"filename": filename, "reason": reason})
+                            continue
+                        await slots.acquire()
+                        try:
+                            member, member_size, content_hash = await asyncio.to_thread(
+                                copy_member, archive, info, settings.upload_max_bytes
+                            )
+                        except ArchiveMemberError as e:
+                            slots.release()
+                            rejected.append({"filename": filename, "reason": str(e)})
+                            continue
+                        except BaseException:
+                            slots.release()
+                            raise
+                        add(member, filename, member_size, content_hash, owned=True)
+                continue
+
+            file_size = upload_size(file)
+            reason = check(ext)
+            if reason is None and file_size > settings.upload_max_bytes > 0:
+                reason = too_large_message(settings.upload_max_bytes)
+            if reason:
+                rejected.append({"filename": file.filename, "reason": reason})
+                continue
+            content_hash = await asyncio.to_thread(hash_file, file.file)
+            await slots.acquire()
+            add(file.file, file.filename, file_size, content_hash)
+    finally:
+        # Let every started transfer finish before the request's files are closed
+        results = await asyncio.gather(*(task for *_, task in accepted), return_exceptions=True)
+
+    failure = next((r for r in results if isinstance(r, Exception) and not isinstance(r, HTTPException)), None)
+    if failure is not None:
+        # Nothing is registered, so no worker will read the staged copies
+        for result in results:
+            if isinstance(result, tuple) and result[2]:
+                remove_staged_upload(result[2])
+        raise failure
+
+    documents = []
+    for filename, file_size, content_hash, task in accepted:
+        if isinstance(task.exception(), HTTPException):
+            rejected.append({"filename": filename, "reason": task.exception().detail})
+            continue
+        documents.append(add_document(db, filename, file_size, content_hash, task.result(), batch.id))
+
+    # All documents and their jobs are committed together
+    batch.accepted = len(documents)
+    batch.rejected = rejected
+    db.commit()
+    for doc in documents:
+        db.refresh(doc)
+        get_document_metadata_cache().put(doc)
+    if documents:
+        get_ingestion_worker_pool().wake()
+
+    print(f"Bulk upload {batch.id}: {len(documents)} accepted, {len(rejected)} rejected")
+    message = f"{len(documents)}件のドキュメントを登録しました。処理中です。"
+    if rejected:
+        message += f"（{len(rejected)}件は登録できませんでした）"
+
+    return BulkUploadResponse(
+        batch_id=batch.id,
+        accepted=len(documents),
+        rejected=rejected,
+        message=message
+    )
 
-        db.commit()
 
-    except Exception as e:
-        print(f"Document processing failed: {e}")
-        import traceback
-        traceback.print_exc()
-        doc = db.query(Document).filter(Document.id == document_id).first()
-        if doc:
-            doc.status = "error"
-            doc.error_message = str(e)
-            db.commit()
-    finally:
-        db.close()
+@app.get("/api/documents/batches/{batch_id}", response_model=UploadBatchResponse)
+async def get_upload_batch(
+    batch_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """一括アップロードの進捗（全体の件数とファイルごとの状態）"""
+    batch = db.query(UploadBatch).filter(UploadBatch.id == batch_id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="アップロードバッチが見つかりません")
+
+    rows = db.query(
+        Document.id, Document.original_filename, Document.status, Document.error_message
+    ).filter(Document.batch_id == batch_id).order_by(Document.id).all()
+
+    counts = {"pending": 0, "processing": 0, "completed": 0, "error": 0}
+    for row in rows:
+        counts[row.status] = counts.get(row.status, 0) + 1
+    finished = counts["completed"] + counts["error"]
+
+    return UploadBatchResponse(
+        id=batch.id,
+        created_at=batch.created_at,
+        accepted=batch.accepted,
+        total=len(rows),
+        pending=counts["pending"],
+        processing=counts["processing"],
+        completed=counts["completed"],
+        error=counts["error"],
+        progress=round(finished / len(rows), 4) if rows else 1.0,
+        finished=finished == len(rows),
+        files=[
+            BatchFileStatus(id=row.id, filename=row.original_filename, status=row.status, error_message=row.error_message)
+            for row in rows
+        ],
+        rejected=batch.rejected or []
+    )
 
 
 @app.get("/api/documents", response_model=DocumentListResponse)
@@ -560,28 +798,25 @@ async def get_document(
 @app.post("/api/documents/{document_id}/reprocess")
 async def reprocess_document(
     document_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_admin_user)
 ):
-    """ドキュメント再処理"""
+    """ドキュメント再処理（元ファイルはワーカーがBlob Storageから取得）"""
     doc = db.query(Document).filter(Document.id == document_id).first()
     if not doc:
         raise HTTPException(status_code=404, detail="ドキュメントが見つかりません")
+    if not doc.blob_url:
+        raise HTTPException(status_code=400, detail="元ファイルがBlob Storageに保存されていないため再処理できません")
 
     # Reset status
-    doc.status = "pending"
+    set_document_status(db, doc, "pending")
     doc.error_message = None
+    enqueue_document(db, doc.id, reprocess=True)
     db.commit()
+    get_document_metadata_cache().put(doc)
+    get_ingestion_worker_pool().wake()
 
-    # Download original file and reprocess
-    try:
-        blob_service = AzureBlobService()
-        content = blob_service.download_file(doc.filename)
-        background_tasks.add_task(process_document_task, doc.id, content)
-        return {"message": "ドキュメントの再処理を開始しました"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ファイルの取得に失敗しました: {str(e)}")
+    return {"message": "ドキュメントの再処理を開始しました"}
 
 
 @app.delete("/api/documents/{document_id}")
@@ -591,7 +826,8 @@ async def delete_document(
     current_user: User = Depends(get_admin_user)
 ):
     """ドキュメント削除"""
-    doc = db.query(Document).filter(Document.id == document_id).first()
+    # Locked until the commit, so a running ingestion job either commits its chunks first or finds the document gone
+    doc = db.query(Document).filter(Document.id == document_id).with_for_update().first()
     if not doc:
         raise HTTPException(status_code=404, detail="ドキュメントが見つかりません")
 
@@ -600,13 +836,12 @@ async def delete_document(
         chunks = db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).all()
         chunk_ids = [c.search_id for c in chunks if c.search_id]
         if chunk_ids:
-            search_service_azure = AzureSearchService()
-            search_service_azure.delete_documents(chunk_ids)
+            await asyncio.to_thread(get_search_backend().delete_documents, chunk_ids)
     except Exception as e:
         print(f"Search index deletion failed: {e}")
 
-    # Delete from blob storage
-    if doc.blob_url:
+    # Delete from blob storage (unless a deduplicated upload still uses the file)
+    if doc.blob_url and not blob_shared(db, doc):
         try:
             blob_service = AzureBlobService()
             blob_service.delete_file(doc.filename)
@@ -616,9 +851,20 @@ async def delete_document(
             if "BlobNotFound" not in error_msg and "does not exist" not in error_msg:
                 print(f"Blob deletion failed: {e}")
 
-    # Delete from database
+    # Delete from database (jobs not yet started are dropped; a running one finds the document gone)
+    on_document_deleted(db, doc)
+    queued_jobs = db.query(IngestionJob).filter(
+        IngestionJob.document_id == document_id,
+        IngestionJob.status == "queued"
+    )
+    staged_paths = [job.staged_path for job in queued_jobs]
+    queued_jobs.delete(synchronize_session=False)
     db.delete(doc)
     db.commit()
+    for path in staged_paths:
+        remove_staged_upload(path)
+    get_document_metadata_cache().invalidate(document_id)
+    bump_index_generation(db)
 
     return {"message": "ドキュメントを削除しました"}
 
@@ -632,30 +878,55 @@ async def get_system_stats(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_admin_user)
 ):
-    """システム統計情報取得"""
-    total_documents = db.query(Document).count()
-    indexed_documents = db.query(Document).filter(Document.status == "completed").count()
-    pending_documents = db.query(Document).filter(Document.status == "pending").count()
-    error_documents = db.query(Document).filter(Document.status == "error").count()
-    total_users = db.query(User).count()
-    total_searches = db.query(SearchHistory).count()
-
-    avg_response = db.query(func.avg(SearchHistory.response_time_ms)).scalar() or 0
-
-    return SystemStats(
-        total_documents=total_documents,
-        indexed_documents=indexed_documents,
-        pending_documents=pending_documents,
-        error_documents=error_documents,
-        total_users=total_users,
-        total_searches=total_searches,
-        avg_response_time_ms=float(avg_response)
-    )
+    """システム統計情報取得（集計カウンターから取得）"""
+    return SystemStats(**load_system_stats(db))
+
+
+@app.get("/api/admin/search-analytics", response_model=SearchAnalyticsResponse)
+async def get_search_analytics(
+    hours: int = Query(24, ge=1, le=24 * 90),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """検索分析の時系列取得（1時間単位の件数・0件ヒット数・応答時間パーセンタイル）"""
+    return get_search_timeseries(db, hours)
+
+
+@app.get("/api/admin/cache-stats")
+async def get_cache_stats(
+    current_user: User = Depends(get_admin_user)
+):
+    """キャッシュ統計情報取得（ヒット率・削減できたAzure呼び出し）"""
+    return {
+        "embedding": get_embedding_cache().stats(),
+        "response": get_response_cache().stats(),
+        "document_metadata": get_document_metadata_cache().stats()
+    }
+
+
+@app.get("/api/admin/search-history-writer")
+async def get_search_history_writer_stats(
+    current_user: User = Depends(get_admin_user)
+):
+    """検索履歴ライターの状態取得（キュー待ち・書き込み済み・破棄件数）"""
+    return get_search_history_writer().stats()
+
+
+@app.get("/api/admin/ingestion-queue")
+async def get_ingestion_queue_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """ドキュメント登録ジョブキューの状態取得（状態別件数・最古の待機時間・このプロセスのワーカー）"""
+    return {
+        **get_queue_stats(db),
+        "workers": get_ingestion_worker_pool().stats(),
+        "extraction": get_extraction_pool().stats() if settings.extraction_pool_enabled else None
+    }
 
 
 @app.post("/api/admin/reindex")
 async def reindex_all(
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_admin_user)
 ):
@@ -735,8 +1006,7 @@ async def create_search_index(
 ):
     """検索インデックス作成"""
     try:
-        search_service_azure = AzureSearchService()
-        search_service_azure.create_index()
+        get_search_backend().create_index()
         return {"message": "検索インデックスを作成しました"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"インデックス作成に失敗しました: {str(e)}")
@@ -746,6 +1016,19 @@ async def create_search_index(
 # Health check
 # =============================================================================
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus形式のメトリクス（プロセス内の集計値のみ）"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.metrics_token and request.headers.get("authorization") != f"Bearer {settings.metrics_token}":
+        raise HTTPException(status_code=401, detail="認証が必要です")
+
+    # Collectors query the database; render off the event loop
+    body = await asyncio.to_thread(render_metrics)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/health")
 async def health_check():
     """ヘルスチェック"""
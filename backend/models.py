@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, Float, Boolean, ForeignKey, JSON, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone, timedelta
@@ -38,6 +38,8 @@ class Document(Base):
     file_type = Column(String(50))  # excel, word, powerpoint, pdf, image
     file_size = Column(Integer)
     blob_url = Column(String(500))
+    content_hash = Column(String(64), index=True)  # SHA-256 of the file; identical uploads share processing
+    batch_id = Column(Integer, index=True)  # UploadBatch of a bulk upload
 
     # Metadata from filename parsing
     application = Column(String(100))  # PAN, 乳業, 総菜等
@@ -69,6 +71,7 @@ class DocumentChunk(Base):
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
     chunk_index = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
+    content_hash = Column(String(64))  # SHA-256 of content, compared on reprocessing
 
     # Metadata for search
     sheet_name = Column(String(100))  # For Excel sheets
@@ -91,11 +94,110 @@ class SearchHistory(Base):
     results_count = Column(Integer)
     top_result_score = Column(Float)
     response_time_ms = Column(Integer)
+    cached = Column(Boolean, default=False)  # Served from the response cache
+    stage_timings = Column(JSON)  # Per-stage latency breakdown, e.g. {"embedding_ms": 120.5, ...}
     created_at = Column(DateTime, default=get_jst_now)
 
     user = relationship("User", back_populates="search_histories")
 
 
+class IndexGeneration(Base):
+    """Counter bumped whenever the searchable corpus changes (used to invalidate caches)"""
+    __tablename__ = "index_generations"
+
+    name = Column(String(50), primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=get_jst_now, onupdate=get_jst_now)
+
+
+class FacetValue(Base):
+    """Number of completed documents per filter value (maintained on status changes)"""
+    __tablename__ = "facet_values"
+
+    facet_type = Column(String(20), primary_key=True)  # applications, issues, ingredients
+    value = Column(String(200), primary_key=True)
+    document_count = Column(Integer, nullable=False, default=0)
+
+
+class StatCounter(Base):
+    """Named running total for the admin dashboard (document status counts, search totals)"""
+    __tablename__ = "stat_counters"
+
+    name = Column(String(100), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=get_jst_now, onupdate=get_jst_now)
+
+
+class SearchRollupHourly(Base):
+    """Search history aggregated per hour (JST) by the rollup job"""
+    __tablename__ = "search_rollups_hourly"
+
+    hour = Column(DateTime, primary_key=True)  # Start of the hour
+    search_count = Column(Integer, nullable=False, default=0)
+    zero_result_count = Column(Integer, nullable=False, default=0)
+    cached_count = Column(Integer, nullable=False, default=0)
+    response_time_ms_sum = Column(BigInteger, nullable=False, default=0)
+    latency_histogram = Column(JSON)  # Counts per services.analytics.LATENCY_BUCKETS_MS bucket
+    p50_ms = Column(Float)
+    p95_ms = Column(Float)
+    p99_ms = Column(Float)
+    updated_at = Column(DateTime, default=get_jst_now, onupdate=get_jst_now)
+
+
+class ChunkEmbedding(Base):
+    """Embedding of a chunk text (float32 bytes), keyed by SHA-256 of the embedding model and text"""
+    __tablename__ = "chunk_embeddings"
+
+    key = Column(String(64), primary_key=True)
+    model = Column(String(100), nullable=False)
+    dim = Column(Integer, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=get_jst_now)
+
+
+class IngestionJob(Base):
+    """
+    Durable document processing job claimed by ingestion workers under a lease
+
+    Times are naive JST. A running job whose lease_expires_at has passed
+    belonged to a worker that died and is claimed again.
+    """
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, running, completed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, nullable=False)  # Not claimed before this time (retry backoff)
+    lease_owner = Column(String(100))
+    lease_expires_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    last_error = Column(Text)
+    staged_path = Column(String(500))  # Local copy of the upload (no blob storage); None: download from blob storage
+    reprocess = Column(Boolean, default=False)  # Extract again even if an identical file was processed
+
+    created_at = Column(DateTime, default=get_jst_now)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+class UploadBatch(Base):
+    """
+    Files registered by one bulk upload
+
+    Progress is derived from the documents carrying batch_id; files that
+    were refused at upload time are kept in `rejected`.
+    """
+    __tablename__ = "upload_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    accepted = Column(Integer, nullable=False, default=0)
+    rejected = Column(JSON)  # [{"filename": ..., "reason": ...}]
+    created_at = Column(DateTime, default=get_jst_now)
+
+
 class SystemLog(Base):
     __tablename__ = "system_logs"
 
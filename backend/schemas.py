@@ -65,6 +65,7 @@ class SearchRequest(BaseModel):
     query: str
     top_k: Optional[int] = 10
     filters: Optional[Dict[str, str]] = None
+    debug: bool = False  # Return the per-stage latency breakdown
 
 
 class SearchResultItem(BaseModel):
@@ -89,6 +90,9 @@ class SearchResponse(BaseModel):
     results: List[SearchResultItem]
     total_results: int
     response_time_ms: int
+    cached: bool = False  # True when served from the response cache
+    context_tokens: int = 0  # Tokens of retrieved context sent to the LLM
+    debug: Optional[Dict[str, Any]] = None  # {"timings": {...}} when requested
 
 
 class SearchHistoryItem(BaseModel):
@@ -97,6 +101,8 @@ class SearchHistoryItem(BaseModel):
     results_count: int
     top_result_score: Optional[float]
     response_time_ms: int
+    cached: bool = False
+    stage_timings: Optional[Dict[str, float]] = None
     created_at: datetime
 
 
@@ -108,6 +114,40 @@ class DocumentUploadResponse(BaseModel):
     message: str
 
 
+class RejectedFile(BaseModel):
+    filename: str
+    reason: str
+
+
+class BulkUploadResponse(BaseModel):
+    batch_id: int
+    accepted: int
+    rejected: List[RejectedFile]
+    message: str
+
+
+class BatchFileStatus(BaseModel):
+    id: int
+    filename: str
+    status: str
+    error_message: Optional[str] = None
+
+
+class UploadBatchResponse(BaseModel):
+    id: int
+    created_at: datetime
+    accepted: int
+    total: int  # Documents of the batch that still exist
+    pending: int
+    processing: int
+    completed: int
+    error: int
+    progress: float  # Share of documents finished (completed or error), 0-1
+    finished: bool
+    files: List[BatchFileStatus]
+    rejected: List[RejectedFile]
+
+
 class DocumentResponse(BaseModel):
     id: int
     filename: str
@@ -121,6 +161,7 @@ class DocumentResponse(BaseModel):
     trial_id: Optional[str]
     status: str
     blob_url: Optional[str]
+    content_hash: Optional[str] = None
     created_at: datetime
     indexed_at: Optional[datetime]
 
@@ -139,6 +180,7 @@ class FacetsResponse(BaseModel):
     applications: List[str]
     issues: List[str]
     ingredients: List[str]
+    counts: Dict[str, Dict[str, int]] = {}  # facet type -> value -> completed document count
 
 
 # Admin schemas
@@ -152,6 +194,39 @@ class SystemStats(BaseModel):
     avg_response_time_ms: float
 
 
+class SearchAnalyticsBucket(BaseModel):
+    hour: str
+    searches: int
+    zero_results: int
+    cached: int
+    avg_response_time_ms: float
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+
+
+class SearchAnalyticsSummary(BaseModel):
+    searches: int
+    zero_results: int
+    cached: int
+    avg_response_time_ms: float
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+
+
+class LatencyHistogram(BaseModel):
+    bounds_ms: List[int]  # Bucket upper bounds; counts has one extra open-ended bucket
+    counts: List[int]
+
+
+class SearchAnalyticsResponse(BaseModel):
+    hours: int
+    buckets: List[SearchAnalyticsBucket]
+    summary: SearchAnalyticsSummary
+    latency_histogram: LatencyHistogram
+
+
 class IndexStatusResponse(BaseModel):
     status: str
     document_count: int
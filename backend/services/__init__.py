@@ -1,11 +1,15 @@
 from .document_processor import DocumentProcessor
 from .search_service import SearchService
 from .azure_services import AzureOpenAIService, AzureSearchService, AzureBlobService
+from .cache import EmbeddingCache
+from .local_search import LocalVectorSearchService
 
 __all__ = [
     "DocumentProcessor",
     "SearchService",
     "AzureOpenAIService",
     "AzureSearchService",
-    "AzureBlobService"
+    "AzureBlobService",
+    "EmbeddingCache",
+    "LocalVectorSearchService"
 ]
@@ -0,0 +1,241 @@
+import bisect
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from database import SessionLocal
+from models import SearchHistory, SearchRollupHourly, StatCounter, get_jst_now
+
+settings = get_settings()
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [
+    50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000,
+    5000, 7500, 10000, 15000, 20000, 30000, 60000
+]
+
+# Highest SearchHistory.id already folded into the rollups
+ROLLUP_WATERMARK = "rollups.search_hourly.last_history_id"
+
+
+def latency_bucket(response_time_ms: int) -> int:
+    return bisect.bisect_left(LATENCY_BUCKETS_MS, response_time_ms or 0)
+
+
+def histogram_percentile(histogram: List[int], quantile: float) -> Optional[float]:
+    """
+    Estimate a latency percentile from bucket counts
+
+    Interpolates linearly inside the bucket holding the requested rank; the
+    open-ended last bucket reports its lower bound.
+    """
+    total = sum(histogram)
+    if total == 0:
+        return None
+
+    rank = quantile * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            lower = LATENCY_BUCKETS_MS[index - 1] if index > 0 else 0
+            if index >= len(LATENCY_BUCKETS_MS):
+                return float(lower)
+            upper = LATENCY_BUCKETS_MS[index]
+            return round(lower + (upper - lower) * (rank - seen) / count, 1)
+        seen += count
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+def _empty_histogram() -> List[int]:
+    return [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+def _hour_of(timestamp: datetime) -> datetime:
+    return timestamp.replace(tzinfo=None, minute=0, second=0, microsecond=0)
+
+
+def run_search_rollup(db: Session, batch_size: int = 5000) -> int:
+    """
+    Fold search history written since the last run into the hourly rollups
+
+    Rows are read in id order after a watermark kept in stat_counters. Each
+    batch stops at the first row younger than
+    settings.search_rollup_settle_seconds, so the watermark never passes a
+    row that is not settled yet. Every worker runs its own history writer,
+    which stamps created_at when a search is queued but gets the id when its
+    batch is flushed, so ids and times are not in the same order. The
+    watermark is advanced with a compare-and-set, so if two workers run at
+    once only one of them commits. Returns the number of rows processed.
+    """
+    processed = 0
+    while True:
+        watermark_row = db.get(StatCounter, ROLLUP_WATERMARK)
+        watermark = watermark_row.value if watermark_row else 0
+        settled_before = (get_jst_now() - timedelta(seconds=settings.search_rollup_settle_seconds)).replace(tzinfo=None)
+
+        rows = db.query(
+            SearchHistory.id,
+            SearchHistory.created_at,
+            SearchHistory.results_count,
+            SearchHistory.response_time_ms,
+            SearchHistory.cached
+        ).filter(
+            SearchHistory.id > watermark
+        ).order_by(SearchHistory.id).limit(batch_size).all()
+        more = len(rows) == batch_size
+
+        # A lower id may be younger than a higher one: stop before the first unsettled row
+        for index, row in enumerate(rows):
+            if row.created_at >= settled_before:
+                rows = rows[:index]
+                more = False
+                break
+        if not rows:
+            db.rollback()
+            return processed
+
+        new_watermark = rows[-1].id
+        if watermark_row is None:
+            db.add(StatCounter(name=ROLLUP_WATERMARK, value=new_watermark))
+            db.flush()
+        else:
+            claimed = db.query(StatCounter).filter(
+                StatCounter.name == ROLLUP_WATERMARK,
+                StatCounter.value == watermark
+            ).update({StatCounter.value: new_watermark}, synchronize_session=False)
+            if not claimed:
+                db.rollback()  # Another worker rolled these rows up
+                return processed
+
+        by_hour: Dict[datetime, List[Any]] = {}
+        for row in rows:
+            by_hour.setdefault(_hour_of(row.created_at), []).append(row)
+
+        for hour, hour_rows in by_hour.items():
+            rollup = db.get(SearchRollupHourly, hour, with_for_update=True)
+            if rollup is None:
+                rollup = SearchRollupHourly(
+                    hour=hour,
+                    search_count=0,
+                    zero_result_count=0,
+                    cached_count=0,
+                    response_time_ms_sum=0
+                )
+                db.add(rollup)
+
+            histogram = list(rollup.latency_histogram or _empty_histogram())
+            for row in hour_rows:
+                histogram[latency_bucket(row.response_time_ms)] += 1
+
+            rollup.search_count += len(hour_rows)
+            rollup.zero_result_count += sum(1 for row in hour_rows if not row.results_count)
+            rollup.cached_count += sum(1 for row in hour_rows if row.cached)
+            rollup.response_time_ms_sum += sum(row.response_time_ms or 0 for row in hour_rows)
+            rollup.latency_histogram = histogram
+            rollup.p50_ms = histogram_percentile(histogram, 0.50)
+            rollup.p95_ms = histogram_percentile(histogram, 0.95)
+            rollup.p99_ms = histogram_percentile(histogram, 0.99)
+
+        db.commit()
+        processed += len(rows)
+        if not more:
+            return processed
+
+
+def get_search_timeseries(db: Session, hours: int = 24) -> Dict[str, Any]:
+    """Hourly search counts and latency percentiles for the last `hours` hours, plus a summary"""
+    since = _hour_of(get_jst_now()) - timedelta(hours=hours - 1)
+    rollups = db.query(SearchRollupHourly).filter(
+        SearchRollupHourly.hour >= since
+    ).order_by(SearchRollupHourly.hour).all()
+
+    total_histogram = _empty_histogram()
+    buckets = []
+    for rollup in rollups:
+        histogram = rollup.latency_histogram or _empty_histogram()
+        total_histogram = [a + b for a, b in zip(total_histogram, histogram)]
+        buckets.append({
+            "hour": rollup.hour.isoformat(),
+            "searches": rollup.search_count,
+            "zero_results": rollup.zero_result_count,
+            "cached": rollup.cached_count,
+            "avg_response_time_ms": round(rollup.response_time_ms_sum / rollup.search_count, 1) if rollup.search_count else 0.0,
+            "p50_ms": rollup.p50_ms,
+            "p95_ms": rollup.p95_ms,
+            "p99_ms": rollup.p99_ms
+        })
+
+    searches = sum(rollup.search_count for rollup in rollups)
+    response_time_sum = sum(rollup.response_time_ms_sum for rollup in rollups)
+    return {
+        "hours": hours,
+        "buckets": buckets,
+        "summary": {
+            "searches": searches,
+            "zero_results": sum(rollup.zero_result_count for rollup in rollups),
+            "cached": sum(rollup.cached_count for rollup in rollups),
+            "avg_response_time_ms": round(response_time_sum / searches, 1) if searches else 0.0,
+            "p50_ms": histogram_percentile(total_histogram, 0.50),
+            "p95_ms": histogram_percentile(total_histogram, 0.95),
+            "p99_ms": histogram_percentile(total_histogram, 0.99)
+        },
+        "latency_histogram": {
+            "bounds_ms": LATENCY_BUCKETS_MS,
+            "counts": total_histogram
+        }
+    }
+
+
+class SearchRollupJob:
+    """Run run_search_rollup every `interval` seconds in a background thread"""
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or settings.search_rollup_interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.rows = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="search-rollup", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 10.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def run_once(self) -> int:
+        db = SessionLocal()
+        try:
+            rows = run_search_rollup(db)
+            self.runs += 1
+            self.rows += rows
+            self.last_error = None
+            return rows
+        except Exception as e:
+            db.rollback()
+            self.last_error = str(e)
+            print(f"Search rollup failed: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+
+@lru_cache()
+def get_search_rollup_job() -> SearchRollupJob:
+    return SearchRollupJob()
@@ -1,8 +1,11 @@
 import json
 import time
-from typing import List, Dict, Any, Optional
-from openai import AzureOpenAI
+from typing import List, Dict, Any, Optional, AsyncIterator, BinaryIO
+import aiohttp
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
     SearchIndex,
@@ -17,38 +20,153 @@ from azure.search.documents.indexes.models import (
     SemanticSearch,
 )
 from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
 from azure.core.credentials import AzureKeyCredential
 from azure.core.exceptions import ServiceResponseError
+from azure.core.pipeline.transport import AioHttpTransport
 from datetime import datetime, timedelta
 from config import get_settings
+from .cache import get_embedding_cache
+from .metrics import observe_dependency
+from .rate_limit import (
+    BACKGROUND, INTERACTIVE, acall_with_quota, call_with_quota, estimate_chat_tokens, estimate_embedding_tokens
+)
 
 settings = get_settings()
 
+DEFAULT_SYSTEM_PROMPT = """あなたはユニテックフーズの食品開発ナレッジ検索アシスタントです。
+過去の検証記録や配合データに基づいて、開発者の質問に回答してください。
+
+回答のルール:
+1. 検索結果に基づいた事実のみを回答してください
+2. 関連する過去の案件があれば、その内容を簡潔に説明してください
+3. 配合や製造手順の情報があれば、具体的に提示してください
+4. 情報がない場合は「該当する過去データが見つかりませんでした」と正直に回答してください
+5. 専門用語（離水、老化、テクスチャ等）はそのまま使用してください"""
+
+
+def build_rag_messages(
+    query: str,
+    context: str,
+    system_prompt: Optional[str] = None
+) -> List[Dict[str, str]]:
+    """Build chat messages for a RAG answer"""
+    return [
+        {"role": "system", "content": system_prompt or DEFAULT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"""以下の検索結果に基づいて質問に回答してください。
+
+検索結果:
+{context}
+
+質問: {query}
+
+回答:"""}
+    ]
+
+
+def format_search_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert an Azure AI Search hit to the dict used by SearchService"""
+    return {
+        "id": result["id"],
+        "document_id": result["document_id"],
+        "content": result["content"],
+        "filename": result.get("title", ""),
+        "application": None,
+        "issue": None,
+        "ingredient": None,
+        "customer": None,
+        "trial_id": None,
+        "sheet_name": None,
+        "chunk_index": result.get("chunk_index"),
+        "score": result["@search.score"],
+        "reranker_score": result.get("@search.reranker_score")
+    }
+
+
+def hybrid_search_kwargs(
+    query: str,
+    embedding: List[float],
+    top_k: int,
+    filters: Optional[str]
+) -> Dict[str, Any]:
+    """Arguments for SearchClient.search shared by the sync and async services"""
+    from azure.search.documents.models import VectorizedQuery
+
+    vector_query = VectorizedQuery(
+        vector=embedding,
+        k_nearest_neighbors=top_k,
+        fields="content_vector"
+    )
+
+    return {
+        "search_text": query,
+        "vector_queries": [vector_query],
+        "select": ["id", "document_id", "content", "title", "chunk_index", "metadata"],
+        "top": top_k,
+        "filter": filters,
+        "query_type": "semantic",
+        "semantic_configuration_name": "my-semantic-config"
+    }
+
 
 class AzureOpenAIService:
-    def __init__(self):
+    """
+    Blocking Azure OpenAI client, used by ingestion and maintenance scripts
+
+    Calls go through the deployment's client-side quota at `priority`
+    (background by default) and are retried on throttling; the SDK's own
+    retries are disabled so backoff is handled in one place.
+    """
+
+    def __init__(self, priority: str = BACKGROUND):
+        self.priority = priority
         self.client = AzureOpenAI(
             azure_endpoint=settings.azure_openai_endpoint,
             api_key=settings.azure_openai_api_key,
-            api_version=settings.azure_openai_api_version
+            api_version=settings.azure_openai_api_version,
+            max_retries=0
         )
 
+    @observe_dependency("openai", "embedding")
     def get_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using Azure OpenAI"""
-        response = self.client.embeddings.create(
-            input=text,
-            model=settings.azure_openai_embedding_deployment
+        response = call_with_quota(
+            settings.azure_openai_embedding_deployment,
+            estimate_embedding_tokens([text]),
+            self.priority,
+            lambda: self.client.embeddings.create(
+                input=text,
+                model=settings.azure_openai_embedding_deployment
+            )
         )
         return response.data[0].embedding
 
+    def get_query_embedding(self, query: str) -> List[float]:
+        """Generate embedding for a search query, served from the query embedding cache when possible"""
+        if not settings.embedding_cache_enabled:
+            return self.get_embedding(query)
+
+        return get_embedding_cache().get_or_compute(
+            query,
+            settings.azure_openai_embedding_deployment,
+            self.get_embedding
+        )
+
+    @observe_dependency("openai", "embedding_batch")
     def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts"""
-        response = self.client.embeddings.create(
-            input=texts,
-            model=settings.azure_openai_embedding_deployment
+        """Generate embeddings for multiple texts (returned in input order)"""
+        response = call_with_quota(
+            settings.azure_openai_embedding_deployment,
+            estimate_embedding_tokens(texts),
+            self.priority,
+            lambda: self.client.embeddings.create(
+                input=texts,
+                model=settings.azure_openai_embedding_deployment
+            )
         )
-        return [item.embedding for item in response.data]
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
+    @observe_dependency("openai", "chat")
     def generate_response(
         self,
         query: str,
@@ -56,34 +174,18 @@ class AzureOpenAIService:
         system_prompt: Optional[str] = None
     ) -> str:
         """Generate RAG response using Azure OpenAI"""
-        if system_prompt is None:
-            system_prompt = """あなたはユニテックフーズの食品開発ナレッジ検索アシスタントです。
-過去の検証記録や配合データに基づいて、開発者の質問に回答してください。
-
-回答のルール:
-1. 検索結果に基づいた事実のみを回答してください
-2. 関連する過去の案件があれば、その内容を簡潔に説明してください
-3. 配合や製造手順の情報があれば、具体的に提示してください
-4. 情報がない場合は「該当する過去データが見つかりませんでした」と正直に回答してください
-5. 専門用語（離水、老化、テクスチャ等）はそのまま使用してください"""
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"""以下の検索結果に基づいて質問に回答してください。
-
-検索結果:
-{context}
-
-質問: {query}
-
-回答:"""}
-        ]
-
-        response = self.client.chat.completions.create(
-            model=settings.azure_openai_deployment_name,
-            messages=messages,
-            temperature=0.3,
-            max_tokens=1000
+        messages = build_rag_messages(query, context, system_prompt)
+
+        response = call_with_quota(
+            settings.azure_openai_deployment_name,
+            estimate_chat_tokens(messages, 1000),
+            self.priority,
+            lambda: self.client.chat.completions.create(
+                model=settings.azure_openai_deployment_name,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=1000
+            )
         )
 
         return response.choices[0].message.content
@@ -102,6 +204,7 @@ class AzureSearchService:
             credential=self.credential
         )
 
+    @observe_dependency("search", "create_index")
     def create_index(self):
         """Create the search index with vector search capabilities"""
         fields = [
@@ -161,15 +264,42 @@ class AzureSearchService:
         self.index_client.create_or_update_index(index)
         return index
 
+    @observe_dependency("search", "upload")
     def upload_documents(self, documents: List[Dict[str, Any]]):
         """Upload documents to the search index"""
         self.search_client.upload_documents(documents)
 
+    @observe_dependency("search", "merge")
+    def merge_documents(self, documents: List[Dict[str, Any]]):
+        """Update fields of existing documents in the search index (the vector is kept)"""
+        self.search_client.merge_documents(documents)
+
+    @observe_dependency("search", "delete")
     def delete_documents(self, document_ids: List[str]):
         """Delete documents from the search index"""
-        docs_to_delete = [{"id": doc_id} for doc_id in document_ids]
-        self.search_client.delete_documents(docs_to_delete)
+        # Azure AI Search accepts at most 1000 actions per batch
+        for start in range(0, len(document_ids), 1000):
+            docs_to_delete = [{"id": doc_id} for doc_id in document_ids[start:start + 1000]]
+            self.search_client.delete_documents(docs_to_delete)
+
+    @observe_dependency("search", "get_vectors")
+    def get_vectors(self, document_ids: List[str]) -> Dict[str, List[float]]:
+        """Stored content vectors by search id (ids missing from the index are left out)"""
+        vectors = {}
+        for start in range(0, len(document_ids), 500):
+            batch = document_ids[start:start + 500]
+            results = self.search_client.search(
+                search_text="*",
+                filter=f"search.in(id, '{','.join(batch)}', ',')",
+                select=["id", "content_vector"],
+                top=len(batch)
+            )
+            for result in results:
+                if result.get("content_vector"):
+                    vectors[result["id"]] = result["content_vector"]
+        return vectors
 
+    @observe_dependency("search", "query")
     def search(
         self,
         query: str,
@@ -178,43 +308,166 @@ class AzureSearchService:
         filters: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """Perform hybrid search (text + vector)"""
-        from azure.search.documents.models import VectorizedQuery
+        results = self.search_client.search(**hybrid_search_kwargs(query, embedding, top_k, filters))
+
+        return [format_search_result(result) for result in results]
+
+
+class AsyncAzureOpenAIService:
+    """
+    Non-blocking variant of AzureOpenAIService for the search request path
+
+    Uses AsyncAzureOpenAI over a shared httpx connection pool so a slow
+    completion does not block the event loop. Calls take the deployment's
+    client-side quota at interactive priority, ahead of ingestion.
+    """
+
+    def __init__(self, priority: str = INTERACTIVE):
+        self.priority = priority
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.azure_http_max_connections,
+                max_keepalive_connections=settings.azure_http_max_keepalive
+            ),
+            timeout=settings.azure_http_timeout_seconds
+        )
+        self.client = AsyncAzureOpenAI(
+            azure_endpoint=settings.azure_openai_endpoint,
+            api_key=settings.azure_openai_api_key,
+            api_version=settings.azure_openai_api_version,
+            http_client=self.http_client,
+            max_retries=0
+        )
 
-        vector_query = VectorizedQuery(
-            vector=embedding,
-            k_nearest_neighbors=top_k,
-            fields="content_vector"
+    @observe_dependency("openai", "embedding")
+    async def get_embedding(self, text: str) -> List[float]:
+        """Generate embedding for text using Azure OpenAI"""
+        response = await acall_with_quota(
+            settings.azure_openai_embedding_deployment,
+            estimate_embedding_tokens([text]),
+            self.priority,
+            lambda: self.client.embeddings.create(
+                input=text,
+                model=settings.azure_openai_embedding_deployment
+            )
         )
+        return response.data[0].embedding
+
+    async def get_query_embedding(self, query: str) -> List[float]:
+        """Generate embedding for a search query, served from the query embedding cache when possible"""
+        if not settings.embedding_cache_enabled:
+            return await self.get_embedding(query)
 
-        results = self.search_client.search(
-            search_text=query,
-            vector_queries=[vector_query],
-            select=["id", "document_id", "content", "title", "chunk_index", "metadata"],
-            top=top_k,
-            filter=filters,
-            query_type="semantic",
-            semantic_configuration_name="my-semantic-config"
+        return await get_embedding_cache().aget_or_compute(
+            query,
+            settings.azure_openai_embedding_deployment,
+            self.get_embedding
         )
 
-        search_results = []
-        for result in results:
-            search_results.append({
-                "id": result["id"],
-                "document_id": result["document_id"],
-                "content": result["content"],
-                "filename": result.get("title", ""),
-                "application": None,
-                "issue": None,
-                "ingredient": None,
-                "customer": None,
-                "trial_id": None,
-                "sheet_name": None,
-                "chunk_index": result.get("chunk_index"),
-                "score": result["@search.score"],
-                "reranker_score": result.get("@search.reranker_score")
-            })
-
-        return search_results
+    @observe_dependency("openai", "chat")
+    async def generate_response(
+        self,
+        query: str,
+        context: str,
+        system_prompt: Optional[str] = None
+    ) -> str:
+        """Generate RAG response using Azure OpenAI"""
+        messages = build_rag_messages(query, context, system_prompt)
+        response = await acall_with_quota(
+            settings.azure_openai_deployment_name,
+            estimate_chat_tokens(messages, 1000),
+            self.priority,
+            lambda: self.client.chat.completions.create(
+                model=settings.azure_openai_deployment_name,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=1000
+            )
+        )
+
+        return response.choices[0].message.content
+
+    @observe_dependency("openai", "chat_stream")
+    async def stream_response(
+        self,
+        query: str,
+        context: str,
+        system_prompt: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Yield RAG response text as the completion produces it"""
+        messages = build_rag_messages(query, context, system_prompt)
+        stream = await acall_with_quota(
+            settings.azure_openai_deployment_name,
+            estimate_chat_tokens(messages, 1000),
+            self.priority,
+            lambda: self.client.chat.completions.create(
+                model=settings.azure_openai_deployment_name,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=1000,
+                stream=True
+            )
+        )
+
+        async for chunk in stream:
+            # Azure sends a leading chunk without choices (content filter results)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def close(self):
+        await self.client.close()
+
+
+class AsyncAzureSearchService:
+    """
+    Non-blocking variant of AzureSearchService.search
+
+    The aiohttp session (and its connection pool) must be created inside the
+    running event loop, so the client is built on first use.
+    """
+
+    def __init__(self):
+        self.credential = AzureKeyCredential(settings.azure_search_api_key)
+        self._session = None
+        self._search_client = None
+
+    def _get_search_client(self) -> AsyncSearchClient:
+        if self._search_client is None:
+            connector = aiohttp.TCPConnector(
+                limit=settings.azure_http_max_connections,
+                keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._search_client = AsyncSearchClient(
+                endpoint=settings.azure_search_endpoint,
+                index_name=settings.azure_search_index_name,
+                credential=self.credential,
+                transport=AioHttpTransport(session=self._session, session_owner=False),
+                connection_timeout=settings.azure_http_timeout_seconds,
+                read_timeout=settings.azure_http_timeout_seconds
+            )
+        return self._search_client
+
+    @observe_dependency("search", "query")
+    async def search(
+        self,
+        query: str,
+        embedding: List[float],
+        top_k: int = 10,
+        filters: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Perform hybrid search (text + vector)"""
+        search_client = self._get_search_client()
+        results = await search_client.search(**hybrid_search_kwargs(query, embedding, top_k, filters))
+
+        return [format_search_result(result) async for result in results]
+
+    async def close(self):
+        if self._search_client is not None:
+            await self._search_client.close()
+            await self._session.close()
+            self._search_client = None
+            self._session = None
 
 
 class AzureBlobService:
@@ -229,6 +482,7 @@ class AzureBlobService:
         # Extract account name and key from connection string
         self._parse_connection_string()
 
+    @observe_dependency("blob", "upload")
     def upload_file(self, file_content: bytes, blob_name: str) -> str:
         """Upload file to Azure Blob Storage with retry logic"""
         blob_client = self.blob_service_client.get_blob_client(
@@ -256,6 +510,7 @@ class AzureBlobService:
                     print(f"Upload failed after {max_retries} attempts")
                     raise
 
+    @observe_dependency("blob", "download")
     def download_file(self, blob_name: str) -> bytes:
         """Download file from Azure Blob Storage"""
         blob_client = self.blob_service_client.get_blob_client(
@@ -264,6 +519,16 @@ class AzureBlobService:
         )
         return blob_client.download_blob().readall()
 
+    @observe_dependency("blob", "download")
+    def download_to_file(self, blob_name: str, file_obj: BinaryIO):
+        """Download a blob into an open file, fetching ranges in parallel"""
+        blob_client = self.blob_service_client.get_blob_client(
+            container=self.container_name,
+            blob=blob_name
+        )
+        blob_client.download_blob(max_concurrency=settings.blob_transfer_concurrency).readinto(file_obj)
+
+    @observe_dependency("blob", "delete")
     def delete_file(self, blob_name: str):
         """Delete file from Azure Blob Storage"""
         blob_client = self.blob_service_client.get_blob_client(
@@ -315,3 +580,51 @@ class AzureBlobService:
         )
         
         return f"{blob_client.url}?{sas_token}"
+
+
+class AsyncAzureBlobService:
+    """
+    Non-blocking blob upload for the upload endpoint
+
+    Uploads stream from the spooled request file: the SDK stages blocks of
+    `blob_upload_block_bytes` with up to `blob_transfer_concurrency` in
+    flight and commits the block list, so memory use stays bounded by the
+    blocks in transit rather than the file size. Built on first use, inside
+    the running event loop.
+    """
+
+    def __init__(self):
+        self._client = None
+
+    def _get_client(self) -> AsyncBlobServiceClient:
+        if self._client is None:
+            self._client = AsyncBlobServiceClient.from_connection_string(
+                settings.azure_storage_connection_string,
+                max_block_size=settings.blob_upload_block_bytes,
+                max_single_put_size=settings.blob_upload_block_bytes,
+                connection_timeout=300,
+                read_timeout=300
+            )
+        return self._client
+
+    @observe_dependency("blob", "upload")
+    async def upload_file(self, file_obj: BinaryIO, blob_name: str, length: int) -> str:
+        """Upload an open file from its start; returns the blob URL"""
+        blob_client = self._get_client().get_blob_client(
+            container=settings.azure_storage_container_name,
+            blob=blob_name
+        )
+        file_obj.seek(0)
+        await blob_client.upload_blob(
+            file_obj,
+            length=length,
+            overwrite=True,
+            max_concurrency=settings.blob_transfer_concurrency,
+            timeout=300
+        )
+        return blob_client.url
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
@@ -0,0 +1,472 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from models import Document, IndexGeneration
+from .metrics import CACHE_ENTRIES, CACHE_HIT_RATIO, CACHE_REQUESTS, REGISTRY
+
+settings = get_settings()
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query for use as a cache key
+
+    NFKC folds full-width alphanumerics to half-width and half-width katakana
+    to full-width, and turns the ideographic space into a normal space, so
+    「ＰＡＮ　離水」 and 「PAN 離水」 share one entry.
+    """
+    normalized = unicodedata.normalize("NFKC", query)
+    return _WHITESPACE_RE.sub(" ", normalized).strip()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings
+
+    Tier 1 is an in-process LRU. Tier 2 is an optional SQLite file that every
+    uvicorn worker on the host can share and that survives restarts. Keys are
+    the normalized query plus the embedding deployment name, so switching
+    deployments never returns vectors from a different model.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float,
+        disk_path: str = "",
+        disk_ttl_seconds: float = 0
+    ):
+        self.memory = LRUCache(max_size, ttl_seconds)
+        self.disk_path = disk_path
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self._lock = threading.Lock()
+        self._local = threading.local()  # One SQLite connection per thread
+
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_errors = 0
+        self.computed = 0
+        self.compute_time_ms = 0.0
+
+        if self.disk_path:
+            self._init_disk()
+
+    def get_or_compute(
+        self,
+        query: str,
+        deployment: str,
+        compute: Callable[[str], List[float]]
+    ) -> List[float]:
+        """Return the cached embedding for query, calling compute(normalized_query) on a miss"""
+        key, embedding = self.lookup(query, deployment)
+        if embedding is not None:
+            return embedding
+
+        start = time.perf_counter()
+        embedding = compute(key[1])
+        self.store(key, embedding, (time.perf_counter() - start) * 1000)
+        return embedding
+
+    async def aget_or_compute(
+        self,
+        query: str,
+        deployment: str,
+        compute: Callable[[str], Awaitable[List[float]]]
+    ) -> List[float]:
+        """Async variant of get_or_compute; the disk tier is read and written off the event loop"""
+        key, embedding = self.lookup(query, deployment, disk=False)
+        if embedding is not None:
+            return embedding
+        if self.disk_path:
+            embedding = await asyncio.to_thread(self._disk_lookup, key)
+            if embedding is not None:
+                return embedding
+
+        start = time.perf_counter()
+        embedding = await compute(key[1])
+        self.store(key, embedding, (time.perf_counter() - start) * 1000, disk=False)
+        if self.disk_path:
+            await asyncio.to_thread(self._disk_set, key, embedding)
+        return embedding
+
+    def lookup(self, query: str, deployment: str, disk: bool = True) -> Tuple[tuple, Optional[List[float]]]:
+        """Return (key, embedding or None), checking memory first and then disk"""
+        key = (deployment, normalize_query(query))
+
+        embedding = self.memory.get(key)
+        if embedding is not None:
+            return key, embedding
+
+        if disk and self.disk_path:
+            return key, self._disk_lookup(key)
+
+        return key, None
+
+    def store(self, key: tuple, embedding: List[float], compute_ms: float = 0.0, disk: bool = True):
+        """Record a freshly computed embedding in both tiers"""
+        with self._lock:
+            self.computed += 1
+            self.compute_time_ms += compute_ms
+
+        self.memory.set(key, embedding)
+        if disk and self.disk_path:
+            self._disk_set(key, embedding)
+
+    def clear(self):
+        """Drop both tiers"""
+        self.memory.clear()
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM query_embeddings")
+            except sqlite3.Error as e:
+                print(f"Embedding cache clear failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        memory_stats = self.memory.stats()
+        with self._lock:
+            avg_compute_ms = self.compute_time_ms / self.computed if self.computed else 0.0
+            saved_calls = memory_stats["hits"] + self.disk_hits
+            return {
+                "memory": memory_stats,
+                "disk": {
+                    "enabled": bool(self.disk_path),
+                    "hits": self.disk_hits,
+                    "misses": self.disk_misses,
+                    "errors": self.disk_errors
+                },
+                "computed": self.computed,
+                "avg_compute_ms": round(avg_compute_ms, 1),
+                "saved_calls": saved_calls,
+                "estimated_saved_ms": round(saved_calls * avg_compute_ms, 1)
+            }
+
+    # ---- disk tier -------------------------------------------------------
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """This thread's connection, inside a transaction; it is reopened after an error"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=5)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._local.conn = conn
+        try:
+            with conn:
+                yield conn
+        except sqlite3.Error:
+            self._local.conn = None
+            conn.close()
+            raise
+
+    def _init_disk(self):
+        try:
+            directory = os.path.dirname(os.path.abspath(self.disk_path))
+            os.makedirs(directory, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                    " key TEXT PRIMARY KEY,"
+                    " embedding BLOB NOT NULL,"
+                    " created_at REAL NOT NULL)"
+                )
+        except (sqlite3.Error, OSError) as e:
+            print(f"Embedding cache disk tier disabled: {e}")
+            self.disk_path = ""
+
+    @staticmethod
+    def _disk_key(key: tuple) -> str:
+        deployment, normalized = key
+        return hashlib.sha256(f"{deployment}\x1f{normalized}".encode("utf-8")).hexdigest()
+
+    def _disk_lookup(self, key: tuple) -> Optional[List[float]]:
+        """Read key from disk, promoting a hit to the memory tier"""
+        embedding = self._disk_get(key)
+        if embedding is not None:
+            self.memory.set(key, embedding)
+        return embedding
+
+    def _disk_get(self, key: tuple) -> Optional[List[float]]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT embedding, created_at FROM query_embeddings WHERE key = ?",
+                    (self._disk_key(key),)
+                ).fetchone()
+                if row and self.disk_ttl_seconds and row[1] + self.disk_ttl_seconds < time.time():
+                    conn.execute("DELETE FROM query_embeddings WHERE key = ?", (self._disk_key(key),))
+                    row = None
+        except sqlite3.Error as e:
+            with self._lock:
+                self.disk_errors += 1
+            print(f"Embedding cache read failed: {e}")
+            return None
+
+        with self._lock:
+            if row is None:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+
+        vector = array("f")
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def _disk_set(self, key: tuple, embedding: List[float]):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, embedding, created_at) VALUES (?, ?, ?)",
+                    (self._disk_key(key), array("f", embedding).tobytes(), time.time())
+                )
+        except sqlite3.Error as e:
+            with self._lock:
+                self.disk_errors += 1
+            print(f"Embedding cache write failed: {e}")
+
+
+class ResponseCache(LRUCache):
+    """
+    Cache of final search payloads (AI response + formatted results)
+
+    Keys include the index generation, so every upload, reprocess or delete
+    makes older entries unreachable; they then age out of the LRU.
+    """
+
+    @staticmethod
+    def make_key(
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        top_k: int,
+        generation: int
+    ) -> tuple:
+        active_filters = {k: v for k, v in (filters or {}).items() if v}
+        filters_key = json.dumps(active_filters, ensure_ascii=False, sort_keys=True)
+        return (generation, normalize_query(query), filters_key, top_k)
+
+
+DOCUMENT_METADATA_FIELDS = ("application", "issue", "ingredient", "customer", "trial_id", "status", "blob_url")
+
+
+class DocumentMetadataCache:
+    """
+    Write-through cache of the Document columns search results need
+
+    Misses are loaded with a single IN (...) query per search. Upload,
+    reprocess and delete update or drop entries in this process; other
+    workers notice the change through the index generation and start over.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.entries = LRUCache(max_size, ttl_seconds)
+        self.generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def get_many(
+        self,
+        db: Session,
+        document_ids: Iterable[int],
+        generation: Optional[int] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """Metadata for each existing document id (ids missing from MySQL are omitted)"""
+        if generation is not None:
+            with self._lock:
+                if generation != self.generation:
+                    self.entries.clear()
+                    self.generation = generation
+
+        found = {}
+        missing = []
+        for document_id in set(document_ids):
+            metadata = self.entries.get(document_id)
+            if metadata is None:
+                missing.append(document_id)
+            else:
+                found[document_id] = metadata
+
+        if missing:
+            columns = [getattr(Document, field) for field in DOCUMENT_METADATA_FIELDS]
+            rows = db.query(Document.id, *columns).filter(Document.id.in_(missing)).all()
+            with self._lock:
+                self.queries += 1
+            for row in rows:
+                metadata = {field: getattr(row, field) for field in DOCUMENT_METADATA_FIELDS}
+                self.entries.set(row.id, metadata)
+                found[row.id] = metadata
+
+        return found
+
+    def put(self, doc: Document):
+        """Write-through update after a Document row changed"""
+        self.entries.set(doc.id, {field: getattr(doc, field) for field in DOCUMENT_METADATA_FIELDS})
+
+    def invalidate(self, document_id: int):
+        self.entries.delete(document_id)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.entries.stats()
+        stats["queries"] = self.queries
+        return stats
+
+
+SEARCH_INDEX_GENERATION = "search_index"
+FACETS_GENERATION = "facets"
+
+
+def get_generation(db: Session, name: str) -> int:
+    """Current value of a named generation counter"""
+    row = db.get(IndexGeneration, name)
+    return row.generation if row else 0
+
+
+def bump_generation(db: Session, name: str, commit: bool = True) -> int:
+    """Advance a named generation counter so every worker drops its cached copy"""
+    updated = db.query(IndexGeneration).filter(
+        IndexGeneration.name == name
+    ).update(
+        {IndexGeneration.generation: IndexGeneration.generation + 1},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(IndexGeneration(name=name, generation=1))
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return get_generation(db, name)
+
+
+def get_index_generation(db: Session) -> int:
+    """Current generation of the searchable corpus"""
+    return get_generation(db, SEARCH_INDEX_GENERATION)
+
+
+def bump_index_generation(db: Session) -> int:
+    """Invalidate search caches in every worker by advancing the corpus generation"""
+    return bump_generation(db, SEARCH_INDEX_GENERATION)
+
+
+def _collect_cache_metrics():
+    caches = {
+        "embedding": get_embedding_cache().stats()["memory"],
+        "response": get_response_cache().stats(),
+        "document_metadata": get_document_metadata_cache().stats()
+    }
+    for name, stats in caches.items():
+        CACHE_REQUESTS.set_total(stats["hits"], cache=name, result="hit")
+        CACHE_REQUESTS.set_total(stats["misses"], cache=name, result="miss")
+        CACHE_HIT_RATIO.set(stats["hit_ratio"], cache=name)
+        CACHE_ENTRIES.set(stats["size"], cache=name)
+
+
+REGISTRY.add_collector(_collect_cache_metrics)
+
+
+@lru_cache()
+def get_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache(
+        max_size=settings.embedding_cache_size,
+        ttl_seconds=settings.embedding_cache_ttl_seconds,
+        disk_path=settings.embedding_cache_path,
+        disk_ttl_seconds=settings.embedding_cache_disk_ttl_seconds
+    )
+
+
+@lru_cache()
+def get_response_cache() -> ResponseCache:
+    return ResponseCache(
+        max_size=settings.response_cache_size,
+        ttl_seconds=settings.response_cache_ttl_seconds
+    )
+
+
+@lru_cache()
+def get_document_metadata_cache() -> DocumentMetadataCache:
+    return DocumentMetadataCache(
+        max_size=settings.document_metadata_cache_size,
+        ttl_seconds=settings.document_metadata_cache_ttl_seconds
+    )
@@ -0,0 +1,80 @@
+import hashlib
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, NamedTuple, Set, Tuple
+
+from models import DocumentChunk
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkPlan(NamedTuple):
+    """How to turn a document's indexed chunks into a new chunk list"""
+    kept: List[Tuple[DocumentChunk, int]]  # Existing chunk and its new position
+    added: List[int]  # Positions in the new list that need embedding and upload
+    removed: List[DocumentChunk]  # Existing chunk rows to delete
+
+    def stale_search_ids(self) -> List[str]:
+        """Search ids of removed rows that no kept row still uses"""
+        live = {chunk.search_id for chunk, _ in self.kept}
+        stale = []
+        for chunk in self.removed:
+            if chunk.search_id and chunk.search_id not in live and chunk.search_id not in stale:
+                stale.append(chunk.search_id)
+        return stale
+
+
+def plan_chunk_changes(existing: List[DocumentChunk], chunks: List[str]) -> ChunkPlan:
+    """
+    Match new chunk texts to existing chunks by content hash
+
+    Repeated texts are matched in order. Existing chunks without a search
+    id were never indexed and are always replaced. Older reprocessing runs
+    could leave several rows sharing one search id; only the first of them
+    can be kept, so one index entry never backs two rows.
+    """
+    available: Dict[str, Deque[DocumentChunk]] = defaultdict(deque)
+    seen: Set[str] = set()
+    for chunk in sorted(existing, key=lambda c: c.chunk_index):
+        if chunk.search_id and chunk.search_id not in seen:
+            seen.add(chunk.search_id)
+            available[chunk.content_hash or chunk_hash(chunk.content)].append(chunk)
+
+    kept = []
+    added = []
+    matched = set()
+    for i, text in enumerate(chunks):
+        candidates = available.get(chunk_hash(text))
+        if candidates:
+            chunk = candidates.popleft()
+            kept.append((chunk, i))
+            matched.add(id(chunk))
+        else:
+            added.append(i)
+
+    removed = [chunk for chunk in existing if id(chunk) not in matched]
+    return ChunkPlan(kept, added, removed)
+
+
+def new_search_ids(document_id: int, existing: List[DocumentChunk], hashes: List[str]) -> List[str]:
+    """
+    Search ids for new chunks with the given content hashes, in order
+
+    Derived from the content, so a retried run overwrites what a failed run
+    uploaded instead of leaving orphans. No id is shared with a current row
+    (legacy positional ids included) or with another new chunk, so an upload
+    never overwrites a live entry and undoing it cannot remove one.
+    """
+    used = {chunk.search_id for chunk in existing if chunk.search_id}
+    search_ids = []
+    for content_hash in hashes:
+        base = f"{document_id}_{content_hash[:16]}"
+        search_id = base
+        n = 1
+        while search_id in used:
+            search_id = f"{base}_{n}"
+            n += 1
+        used.add(search_id)
+        search_ids.append(search_id)
+    return search_ids
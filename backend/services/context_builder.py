@@ -0,0 +1,89 @@
+import math
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from config import get_settings
+
+settings = get_settings()
+
+
+class TokenCounter:
+    """
+    Count and truncate text in model tokens
+
+    Uses tiktoken when its encoding can be loaded. tiktoken downloads encoding
+    files on first use, so in an offline environment this falls back to a
+    conservative estimate of one token per 3 UTF-8 bytes (about one per
+    Japanese character, which over-counts English a little).
+    """
+
+    def __init__(self, encoding_name: str):
+        self.encoding_name = encoding_name
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            print(f"Warning: tiktoken encoding '{encoding_name}' unavailable, estimating tokens: {e}")
+            self._encoding = None
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text.encode("utf-8")) / 3)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of text that fits in max_tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            return self._encoding.decode(tokens[:max_tokens])
+        return text.encode("utf-8")[:max_tokens * 3].decode("utf-8", errors="ignore")
+
+
+@lru_cache()
+def get_token_counter(encoding_name: str = None) -> TokenCounter:
+    return TokenCounter(encoding_name or settings.context_token_encoding)
+
+
+def merge_overlap(previous: str, following: str, max_overlap: int) -> str:
+    """
+    Join two consecutive chunks of one document, dropping the text they share
+
+    DocumentProcessor.chunk_text starts each chunk chunk_overlap characters
+    before the previous one ended (then strips whitespace), so the longest
+    suffix of `previous` that is also a prefix of `following` is that overlap.
+    """
+    limit = min(len(previous), len(following), max_overlap)
+    for size in range(limit, 0, -1):
+        if previous.endswith(following[:size]):
+            return previous + following[size:]
+    return previous + "\n" + following
+
+
+def stitch_chunks(chunks: List[Dict[str, Any]], max_overlap: int = None) -> str:
+    """
+    Content of one document's chunks in document order
+
+    Adjacent chunks (consecutive chunk_index) are merged without their
+    overlap; gaps between non-adjacent chunks are marked with "…".
+    """
+    if max_overlap is None:
+        max_overlap = settings.chunk_overlap + 16  # chunk_text strips whitespace around the overlap
+
+    ordered = sorted(chunks, key=lambda c: c.get("chunk_index") or 0)
+    text = ordered[0]["content"]
+    for previous, chunk in zip(ordered, ordered[1:]):
+        if (chunk.get("chunk_index") or 0) - (previous.get("chunk_index") or 0) == 1:
+            text = merge_overlap(text, chunk["content"], max_overlap)
+        else:
+            text += "\n…\n" + chunk["content"]
+    return text
@@ -0,0 +1,39 @@
+import hashlib
+from typing import BinaryIO, Optional
+
+from sqlalchemy.orm import Session
+
+from models import Document
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def hash_file(file_obj: BinaryIO) -> str:
+    """SHA-256 of an open file, read in blocks from its start (the position is reset afterwards)"""
+    file_obj.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file_obj.read(HASH_BLOCK_BYTES), b""):
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def find_processed_duplicate(db: Session, content_hash: Optional[str], exclude_id: int = None) -> Optional[Document]:
+    """Oldest completed document with the same file content, whose results can be reused"""
+    if not content_hash:
+        return None
+    query = db.query(Document).filter(
+        Document.content_hash == content_hash,
+        Document.status == "completed"
+    )
+    if exclude_id is not None:
+        query = query.filter(Document.id != exclude_id)
+    return query.order_by(Document.id).first()
+
+
+def blob_shared(db: Session, doc: Document) -> bool:
+    """Whether another document points at the same stored file (deduplicated uploads)"""
+    return db.query(Document.id).filter(
+        Document.filename == doc.filename,
+        Document.id != doc.id
+    ).first() is not None
@@ -1,7 +1,7 @@
 import re
 import os
 import io
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Union
 from pathlib import Path
 
 from docx import Document as DocxDocument
@@ -79,8 +79,13 @@ class DocumentProcessor:
 
         return metadata
 
-    def extract_text_from_file(self, file_content: bytes, filename: str) -> Tuple[str, Dict[str, Any]]:
-        """Extract text and structured data from a file"""
+    def extract_text_from_file(self, file_content: Union[bytes, str], filename: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Extract text and structured data from a file
+
+        `file_content` is the file itself or the path of a local copy; a
+        path lets the parsers read from disk instead of an in-memory copy.
+        """
         ext = Path(filename).suffix.lower()
 
         if ext in [".xlsx", ".xls"]:
@@ -96,9 +101,14 @@ class DocumentProcessor:
         else:
             raise ValueError(f"Unsupported file format: {ext}")
 
-    def _process_excel(self, file_content: bytes) -> Tuple[str, Dict[str, Any]]:
+    @staticmethod
+    def _open(file_content: Union[bytes, str]):
+        """Parsers accept a path or a file object; wrap raw bytes in one"""
+        return io.BytesIO(file_content) if isinstance(file_content, bytes) else file_content
+
+    def _process_excel(self, file_content: Union[bytes, str]) -> Tuple[str, Dict[str, Any]]:
         """Process Excel file and extract structured data"""
-        workbook = load_workbook(io.BytesIO(file_content), data_only=True)
+        workbook = load_workbook(self._open(file_content), data_only=True)
 
         all_text = []
         structured_data = {
@@ -181,9 +191,9 @@ class DocumentProcessor:
 
         return formulation if formulation["ingredients"] else None
 
-    def _process_word(self, file_content: bytes) -> Tuple[str, Dict[str, Any]]:
+    def _process_word(self, file_content: Union[bytes, str]) -> Tuple[str, Dict[str, Any]]:
         """Process Word document"""
-        doc = DocxDocument(io.BytesIO(file_content))
+        doc = DocxDocument(self._open(file_content))
 
         all_text = []
         structured_data = {
@@ -212,9 +222,9 @@ class DocumentProcessor:
 
         return "\n".join(all_text), structured_data
 
-    def _process_powerpoint(self, file_content: bytes) -> Tuple[str, Dict[str, Any]]:
+    def _process_powerpoint(self, file_content: Union[bytes, str]) -> Tuple[str, Dict[str, Any]]:
         """Process PowerPoint presentation"""
-        prs = Presentation(io.BytesIO(file_content))
+        prs = Presentation(self._open(file_content))
 
         all_text = []
         structured_data = {
@@ -246,9 +256,9 @@ class DocumentProcessor:
 
         return "\n".join(all_text), structured_data
 
-    def _process_pdf(self, file_content: bytes) -> Tuple[str, Dict[str, Any]]:
+    def _process_pdf(self, file_content: Union[bytes, str]) -> Tuple[str, Dict[str, Any]]:
         """Process PDF document"""
-        reader = PdfReader(io.BytesIO(file_content))
+        reader = PdfReader(self._open(file_content))
 
         all_text = []
         structured_data = {
@@ -267,11 +277,11 @@ class DocumentProcessor:
 
         return "\n".join(all_text), structured_data
 
-    def _process_image(self, file_content: bytes) -> Tuple[str, Dict[str, Any]]:
+    def _process_image(self, file_content: Union[bytes, str]) -> Tuple[str, Dict[str, Any]]:
         """Process image file (placeholder for OCR integration)"""
         # For now, just return metadata
         # TODO: Integrate with Azure Document Intelligence for OCR
-        image = Image.open(io.BytesIO(file_content))
+        image = Image.open(self._open(file_content))
 
         metadata = {
             "format": image.format,
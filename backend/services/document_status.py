@@ -0,0 +1,46 @@
+from sqlalchemy.orm import Session
+
+from models import Document
+from .facets import apply_document_facets
+from .stats import document_status_counter, increment_counters
+
+# Documents in this status are searchable and counted in the facets
+SEARCHABLE_STATUS = "completed"
+
+
+def set_document_status(db: Session, doc: Document, status: str):
+    """
+    Change a document's status and keep derived counts in step
+
+    The per-status dashboard counters move from the old status to the new
+    one. Facet counts only include completed documents, so they are adjusted
+    when a document enters or leaves that status. The caller commits.
+    """
+    old_status = doc.status
+    doc.status = status
+    if old_status == status:
+        return
+
+    increment_counters(db, {
+        document_status_counter(old_status): -1,
+        document_status_counter(status): 1
+    })
+
+    if status == SEARCHABLE_STATUS:
+        apply_document_facets(db, doc, 1)
+    elif old_status == SEARCHABLE_STATUS:
+        apply_document_facets(db, doc, -1)
+
+
+def on_document_created(db: Session, doc: Document):
+    """Count a new document (caller commits)"""
+    increment_counters(db, {document_status_counter(doc.status): 1})
+    if doc.status == SEARCHABLE_STATUS:
+        apply_document_facets(db, doc, 1)
+
+
+def on_document_deleted(db: Session, doc: Document):
+    """Remove a document being deleted from derived counts (before db.delete; caller commits)"""
+    increment_counters(db, {document_status_counter(doc.status): -1})
+    if doc.status == SEARCHABLE_STATUS:
+        apply_document_facets(db, doc, -1)
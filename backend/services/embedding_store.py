@@ -0,0 +1,103 @@
+import hashlib
+from array import array
+from typing import Callable, Dict, List, Sequence
+
+from sqlalchemy.exc import IntegrityError
+
+from config import get_settings
+from database import SessionLocal
+from models import ChunkEmbedding
+from .embeddings import embed_texts
+from .metrics import CHUNK_EMBEDDINGS
+
+settings = get_settings()
+
+# Keys per IN (...) lookup
+LOOKUP_BATCH = 500
+
+
+def chunk_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x1f{text}".encode("utf-8")).hexdigest()
+
+
+def _encode(embedding: Sequence[float]) -> bytes:
+    return array("f", embedding).tobytes()
+
+
+def _decode(data: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+def load_embeddings(keys: List[str]) -> Dict[str, List[float]]:
+    """Stored vectors by key (unknown keys are left out)"""
+    found = {}
+    db = SessionLocal()
+    try:
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            rows = db.query(ChunkEmbedding.key, ChunkEmbedding.embedding).filter(
+                ChunkEmbedding.key.in_(keys[start:start + LOOKUP_BATCH])
+            )
+            found.update((key, _decode(data)) for key, data in rows)
+    finally:
+        db.close()
+    return found
+
+
+def save_embeddings(embeddings: Dict[str, List[float]], model: str):
+    """Persist new vectors; keys another worker stored meanwhile are skipped"""
+    if not embeddings:
+        return
+    db = SessionLocal()
+    try:
+        for key, embedding in embeddings.items():
+            try:
+                with db.begin_nested():
+                    db.add(ChunkEmbedding(key=key, model=model, dim=len(embedding), embedding=_encode(embedding)))
+            except IntegrityError:
+                pass  # Same text embedded concurrently by another worker
+        db.commit()
+    finally:
+        db.close()
+
+
+def embed_with_store(embed_batch: Callable[[List[str]], List[List[float]]], texts: List[str]) -> List[List[float]]:
+    """
+    Embeddings for `texts`, in order, calling Azure OpenAI only for text never embedded before
+
+    Vectors are looked up in chunk_embeddings by SHA-256 of the embedding
+    deployment and the exact chunk text; unseen (and de-duplicated) texts
+    go through embed_texts and are stored for next time. Store errors
+    fall back to embedding everything, so ingestion never depends on it.
+    """
+    if not settings.chunk_embedding_store_enabled or not texts:
+        return embed_texts(embed_batch, texts)
+
+    model = settings.azure_openai_embedding_deployment
+    keys = [chunk_key(text, model) for text in texts]
+    try:
+        stored = load_embeddings(list(set(keys)))
+    except Exception as e:
+        print(f"Chunk embedding store unavailable: {e}")
+        return embed_texts(embed_batch, texts)
+
+    unseen = {}
+    for key, text in zip(keys, texts):
+        if key not in stored:
+            unseen.setdefault(key, text)
+
+    if unseen:
+        new = embed_texts(embed_batch, list(unseen.values()))
+        computed = dict(zip(unseen.keys(), new))
+        try:
+            save_embeddings(computed, model)
+        except Exception as e:
+            print(f"Chunk embedding store write failed: {e}")
+        stored.update(computed)
+
+    CHUNK_EMBEDDINGS.inc(len(texts) - len(unseen), source="stored")
+    CHUNK_EMBEDDINGS.inc(len(unseen), source="computed")
+    if len(unseen) < len(texts):
+        print(f"Chunk embeddings: {len(texts) - len(unseen)}/{len(texts)} reused (stored or repeated text)")
+    return [stored[key] for key in keys]
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from config import get_settings
+from .context_builder import TokenCounter, get_token_counter
+
+settings = get_settings()
+
+EmbedBatch = Callable[[List[str]], List[List[float]]]
+
+
+def plan_embedding_batches(
+    texts: List[str],
+    max_inputs: int,
+    max_tokens: int,
+    counter: TokenCounter
+) -> List[List[int]]:
+    """
+    Group consecutive text indices into request-sized batches
+
+    A batch closes when it holds max_inputs texts or adding the next text
+    would exceed max_tokens. A single text over max_tokens gets a batch of
+    its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index, text in enumerate(texts):
+        tokens = counter.count(text)
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def embed_texts(
+    embed_batch: EmbedBatch,
+    texts: List[str],
+    batch_size: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    concurrency: Optional[int] = None
+) -> List[List[float]]:
+    """
+    Embed many texts with few requests, returning vectors in input order
+
+    Texts are grouped by plan_embedding_batches and up to `concurrency`
+    batches are requested at once (embed_batch is a blocking call such as
+    AzureOpenAIService.get_embeddings_batch). Texts over the model's input
+    limit are truncated instead of failing the whole batch.
+    """
+    if not texts:
+        return []
+
+    counter = get_token_counter(settings.embedding_token_encoding)
+    texts = [counter.truncate(text, settings.embedding_max_input_tokens) for text in texts]
+    batches = plan_embedding_batches(
+        texts,
+        batch_size or settings.embedding_batch_size,
+        max_tokens or settings.embedding_batch_max_tokens,
+        counter
+    )
+
+    def run(batch: List[int]) -> List[List[float]]:
+        embeddings = embed_batch([texts[index] for index in batch])
+        if len(embeddings) != len(batch):
+            raise ValueError(f"Embedding batch returned {len(embeddings)} vectors for {len(batch)} inputs")
+        return embeddings
+
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    workers = max(1, min(concurrency or settings.embedding_concurrency, len(batches)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding") as pool:
+        for number, (batch, embeddings) in enumerate(zip(batches, pool.map(run, batches)), 1):
+            for index, embedding in zip(batch, embeddings):
+                results[index] = embedding
+            print(f"Embedded batch {number}/{len(batches)} ({len(batch)} chunks)")
+    return results
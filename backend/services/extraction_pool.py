@@ -0,0 +1,239 @@
+import multiprocessing
+import signal
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Union
+
+from config import get_settings
+from .metrics import EXTRACTION_RESTARTS, EXTRACTION_WORKERS, REGISTRY
+
+try:
+    import resource
+except ImportError:  # Windows: no address-space limit
+    resource = None
+
+settings = get_settings()
+
+
+class ExtractionError(Exception):
+    """Extraction failed, timed out or ran out of memory; the message is stored on the document"""
+
+
+def _worker_main(conn, memory_limit_mb: int):
+    """Child process: extract files received over `conn` until told to stop"""
+    # Ctrl+C reaches the whole process group; the parent decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if resource is not None and memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    from .document_processor import DocumentProcessor
+    processor = DocumentProcessor()
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        except MemoryError:
+            # The file alone did not fit; the rest of it is still in the pipe, so stop here
+            conn.send(("memory", None, None))
+            return
+        if job is None:
+            return
+
+        content, filename = job
+        try:
+            text, structured_data = processor.extract_text_from_file(content, filename)
+            conn.send(("ok", text, structured_data))
+        except MemoryError:
+            conn.send(("memory", None, None))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}", None))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, memory_limit_mb),
+            name="extraction-worker",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self, kill: bool = False):
+        if not kill:
+            try:
+                self.conn.send(None)
+            except OSError:
+                kill = True
+        if kill:
+            self.process.kill()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ExtractionPool:
+    """
+    Child processes running DocumentProcessor.extract_text_from_file
+
+    Keeps CPU-bound parsing off the GIL of the process serving searches.
+    Each file gets a wall-clock timeout and the workers an address-space
+    limit; a worker that times out or dies is killed and replaced, and
+    every worker is recycled after `max_jobs_per_worker` files so leaks
+    in the parsing libraries do not accumulate. Workers start on demand.
+    """
+
+    def __init__(self, workers: int, timeout_seconds: float, memory_limit_mb: int, max_jobs_per_worker: int):
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self.memory_limit_mb = memory_limit_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        # spawn: forking a process that runs threads and holds DB connections is unsafe
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = threading.BoundedSemaphore(workers)
+        self._idle: List[_Worker] = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.completed = 0
+        self.timeouts = 0
+        self.crashes = 0
+
+    def extract(self, content: Union[bytes, str], filename: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Extract text and structured data from a file (bytes or a local path)
+
+        Raises ExtractionError on failure.
+        """
+        with self._slots:
+            worker = self._checkout()
+            try:
+                result = self._run(worker, content, filename)
+            except ExtractionError:
+                self._discard(worker)
+                raise
+            self._checkin(worker, recycle=result[0] == "memory")
+
+        status, text, structured_data = result
+        if status == "memory":
+            EXTRACTION_RESTARTS.inc(reason="memory")
+            raise ExtractionError(self._memory_message())
+        if status == "error":
+            raise ExtractionError(f"テキスト抽出に失敗しました: {text}")
+        with self._lock:
+            self.completed += 1
+        return text, structured_data
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "idle": len(self._idle),
+                "busy": self._busy,
+                "completed": self.completed,
+                "timeouts": self.timeouts,
+                "crashes": self.crashes,
+                "timeout_seconds": self.timeout_seconds,
+                "memory_limit_mb": self.memory_limit_mb
+            }
+
+    def _run(self, worker: _Worker, content: Union[bytes, str], filename: str) -> Tuple[str, Any, Any]:
+        try:
+            worker.conn.send((content, filename))
+            if not worker.conn.poll(self.timeout_seconds):
+                with self._lock:
+                    self.timeouts += 1
+                EXTRACTION_RESTARTS.inc(reason="timeout")
+                print(f"Extraction of {filename} timed out after {self.timeout_seconds:g}s: killing worker {worker.process.pid}")
+                raise ExtractionError(
+                    f"テキスト抽出がタイムアウトしました（{self.timeout_seconds:g}秒）。"
+                    "ファイルが破損しているか、大きすぎる可能性があります"
+                )
+            return worker.conn.recv()
+        except (EOFError, OSError):
+            # The child died mid-file: killed by the OS or crashed in native code
+            with self._lock:
+                self.crashes += 1
+            EXTRACTION_RESTARTS.inc(reason="crashed")
+            print(f"Extraction worker {worker.process.pid} died while processing {filename} (exit code {worker.process.exitcode})")
+            raise ExtractionError(self._memory_message())
+
+    def _memory_message(self) -> str:
+        if self.memory_limit_mb > 0:
+            return f"テキスト抽出プロセスが異常終了しました（メモリ上限 {self.memory_limit_mb}MB を超えた可能性があります）"
+        return "テキスト抽出プロセスが異常終了しました"
+
+    def _checkout(self) -> _Worker:
+        with self._lock:
+            if self._closed:
+                raise ExtractionError("テキスト抽出プロセスは停止しています")
+            self._busy += 1
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return _Worker(self._context, self.memory_limit_mb)
+        except Exception:
+            with self._lock:
+                self._busy -= 1
+            raise
+
+    def _checkin(self, worker: _Worker, recycle: bool = False):
+        worker.jobs += 1
+        if not recycle and worker.jobs >= self.max_jobs_per_worker:
+            EXTRACTION_RESTARTS.inc(reason="recycled")
+            recycle = True
+        with self._lock:
+            self._busy -= 1
+            if not recycle and not self._closed:
+                self._idle.append(worker)
+                return
+        worker.stop()
+
+    def _discard(self, worker: _Worker):
+        with self._lock:
+            self._busy -= 1
+        worker.stop(kill=True)
+
+
+@lru_cache()
+def get_extraction_pool() -> ExtractionPool:
+    return ExtractionPool(
+        workers=settings.extraction_workers,
+        timeout_seconds=settings.extraction_timeout_seconds,
+        memory_limit_mb=settings.extraction_memory_limit_mb,
+        max_jobs_per_worker=settings.extraction_max_jobs_per_worker
+    )
+
+
+def extract_text(content: Union[bytes, str], filename: str) -> Tuple[str, Dict[str, Any]]:
+    """Extract a file in the process pool, or in-process when EXTRACTION_POOL_ENABLED is off"""
+    if not settings.extraction_pool_enabled:
+        from .document_processor import DocumentProcessor
+        return DocumentProcessor().extract_text_from_file(content, filename)
+    return get_extraction_pool().extract(content, filename)
+
+
+def _collect_pool_metrics():
+    if not settings.extraction_pool_enabled:
+        return
+    stats = get_extraction_pool().stats()
+    EXTRACTION_WORKERS.set(stats["idle"], state="idle")
+    EXTRACTION_WORKERS.set(stats["busy"], state="busy")
+
+
+REGISTRY.add_collector(_collect_pool_metrics)
@@ -0,0 +1,163 @@
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from models import Document, FacetValue
+from .cache import FACETS_GENERATION, bump_generation, get_generation
+
+settings = get_settings()
+
+# Facet type (as returned by /api/search/facets) -> Document column
+FACET_FIELDS = {
+    "applications": "application",
+    "issues": "issue",
+    "ingredients": "ingredient"
+}
+
+
+def apply_document_facets(db: Session, doc: Document, delta: int):
+    """
+    Add (delta=1) or remove (delta=-1) a document's values from the facet counts
+
+    Runs inside the caller's transaction and bumps the facets generation; the
+    caller commits.
+    """
+    changed = False
+    for facet_type, field in FACET_FIELDS.items():
+        value = getattr(doc, field)
+        if not value:
+            continue
+        changed = True
+
+        updated = db.query(FacetValue).filter(
+            FacetValue.facet_type == facet_type,
+            FacetValue.value == value
+        ).update(
+            {FacetValue.document_count: FacetValue.document_count + delta},
+            synchronize_session=False
+        )
+        if not updated and delta > 0:
+            try:
+                with db.begin_nested():
+                    db.add(FacetValue(facet_type=facet_type, value=value, document_count=delta))
+            except IntegrityError:
+                # Another worker inserted the value first
+                db.query(FacetValue).filter(
+                    FacetValue.facet_type == facet_type,
+                    FacetValue.value == value
+                ).update(
+                    {FacetValue.document_count: FacetValue.document_count + delta},
+                    synchronize_session=False
+                )
+
+    if changed:
+        db.query(FacetValue).filter(FacetValue.document_count <= 0).delete(synchronize_session=False)
+        bump_generation(db, FACETS_GENERATION, commit=False)
+        _invalidate_after_commit(db)
+
+
+def _invalidate_after_commit(db: Session):
+    """Drop the cached snapshot once db commits, so a read in between cannot cache the old counts again"""
+    db.info["invalidate_facets_after_commit"] = True
+    if not event.contains(db, "after_commit", _on_commit):
+        event.listen(db, "after_commit", _on_commit)
+
+
+def _on_commit(db: Session):
+    if db.info.pop("invalidate_facets_after_commit", False):
+        get_facet_cache().invalidate()
+
+
+def rebuild_facets(db: Session) -> int:
+    """Recount every facet from completed documents (one GROUP BY per facet type)"""
+    db.query(FacetValue).delete(synchronize_session=False)
+    rows = 0
+    for facet_type, field in FACET_FIELDS.items():
+        column = getattr(Document, field)
+        counts = db.query(column, func.count(Document.id)).filter(
+            Document.status == "completed",
+            column.isnot(None),
+            column != ""
+        ).group_by(column).all()
+        for value, count in counts:
+            db.add(FacetValue(facet_type=facet_type, value=value, document_count=count))
+        rows += len(counts)
+
+    bump_generation(db, FACETS_GENERATION, commit=False)
+    db.commit()
+    get_facet_cache().invalidate()
+    return rows
+
+
+def ensure_facets(db: Session):
+    """Populate the facet table on first start against an existing database"""
+    if db.query(FacetValue).first() is not None:
+        return
+    if db.query(Document.id).filter(Document.status == "completed").first() is None:
+        return
+    print(f"Building facet table... ({rebuild_facets(db)} values)")
+
+
+class FacetCache:
+    """
+    In-memory snapshot of the facet table
+
+    The snapshot is tagged with the facets generation, which doubles as its
+    ETag. Other workers' changes are picked up by re-reading the generation
+    at most every check_interval seconds; changes made in this process
+    invalidate the snapshot immediately.
+    """
+
+    def __init__(self, check_interval: float = 5.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Dict[str, Dict[str, int]]] = None
+        self._generation: Optional[int] = None
+        self._checked_at = 0.0
+        self.loads = 0
+
+    def get(self, db: Session) -> Tuple[Dict[str, Dict[str, int]], str]:
+        """Return ({facet type: {value: document count}}, ETag)"""
+        now = time.monotonic()
+        with self._lock:
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                return self._snapshot, self._etag()
+
+        generation = get_generation(db, FACETS_GENERATION)
+        with self._lock:
+            if self._snapshot is None or generation != self._generation:
+                self._snapshot = self._load(db)
+                self._generation = generation
+                self.loads += 1
+            self._checked_at = now
+            return self._snapshot, self._etag()
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _etag(self) -> str:
+        return f'W/"facets-{self._generation}"'
+
+    def _load(self, db: Session) -> Dict[str, Dict[str, int]]:
+        snapshot: Dict[str, Dict[str, int]] = {facet_type: {} for facet_type in FACET_FIELDS}
+        rows = db.query(FacetValue).order_by(
+            FacetValue.facet_type,
+            FacetValue.document_count.desc(),
+            FacetValue.value
+        ).all()
+        for row in rows:
+            if row.facet_type in snapshot:
+                snapshot[row.facet_type][row.value] = row.document_count
+        return snapshot
+
+
+@lru_cache()
+def get_facet_cache() -> FacetCache:
+    return FacetCache(check_interval=settings.facet_cache_check_seconds)
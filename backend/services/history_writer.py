@@ -0,0 +1,170 @@
+import queue
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from database import SessionLocal
+from models import SearchHistory, get_jst_now
+from config import get_settings
+from .stats import SEARCH_COUNT, SEARCH_RESPONSE_TIME_SUM, increment_counters
+from .metrics import HISTORY_QUEUE_DEPTH, HISTORY_ROWS, REGISTRY
+
+settings = get_settings()
+
+
+class SearchHistoryWriter:
+    """
+    Write SearchHistory rows from a background thread in bulk INSERTs
+
+    Searches only enqueue a row (created_at is stamped at enqueue time); the
+    writer flushes when batch_size rows are waiting or flush_interval seconds
+    have passed, whichever comes first, and updates the dashboard search
+    counters in the same transaction. When the queue is full new rows are
+    dropped and counted instead of slowing searches down.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = None,
+        flush_interval: float = None,
+        max_queue_size: int = None
+    ):
+        self.batch_size = batch_size or settings.search_history_batch_size
+        self.flush_interval = flush_interval or settings.search_history_flush_interval_seconds
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(
+            maxsize=max_queue_size or settings.search_history_queue_size
+        )
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="search-history-writer", daemon=True)
+            self._thread.start()
+
+    def submit(
+        self,
+        user_id: int,
+        query: str,
+        results_count: int,
+        top_score: float,
+        response_time_ms: int,
+        cached: bool = False,
+        stage_timings: Optional[Dict[str, float]] = None
+    ) -> bool:
+        """Queue one history row; returns False if it had to be dropped"""
+        if self._thread is None:
+            self.start()
+
+        row = {
+            "user_id": user_id,
+            "query": query,
+            "results_count": results_count,
+            "top_result_score": top_score,
+            "response_time_ms": response_time_ms,
+            "cached": cached,
+            "stage_timings": stage_timings,
+            "created_at": get_jst_now()
+        }
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def close(self, timeout: float = 10.0):
+        """Stop the writer after flushing everything already queued"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout)
+        if thread.is_alive():
+            print(f"Search history writer: {self._queue.qsize()} rows still queued at shutdown")
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "flushes": self.flushes,
+                "batch_size": self.batch_size,
+                "flush_interval_seconds": self.flush_interval,
+                "running": self._thread is not None and self._thread.is_alive()
+            }
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            elif self._stop.is_set():
+                return
+
+    def _collect(self) -> List[Dict[str, Any]]:
+        """Wait for up to batch_size rows or until flush_interval has passed"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if self._stop.is_set():
+                remaining = 0  # Draining: take what is queued without waiting
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[Dict[str, Any]]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(SearchHistory), batch)
+            increment_counters(db, {
+                SEARCH_COUNT: len(batch),
+                SEARCH_RESPONSE_TIME_SUM: sum(row["response_time_ms"] or 0 for row in batch)
+            })
+            db.commit()
+            with self._lock:
+                self.written += len(batch)
+                self.flushes += 1
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self.failed += len(batch)
+            print(f"Search history writer: failed to write {len(batch)} rows: {e}")
+        finally:
+            db.close()
+
+
+def _collect_history_writer_metrics():
+    stats = get_search_history_writer().stats()
+    HISTORY_QUEUE_DEPTH.set(stats["queued"])
+    for outcome in ("written", "dropped", "failed"):
+        HISTORY_ROWS.set_total(stats[outcome], outcome=outcome)
+
+
+REGISTRY.add_collector(_collect_history_writer_metrics)
+
+
+@lru_cache()
+def get_search_history_writer() -> SearchHistoryWriter:
+    return SearchHistoryWriter()
@@ -0,0 +1,278 @@
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import get_settings
+from database import SessionLocal
+from models import Document, DocumentChunk, get_jst_now
+from .azure_services import AzureBlobService, AzureOpenAIService
+from .cache import bump_index_generation, get_document_metadata_cache
+from .chunk_diff import chunk_hash, new_search_ids, plan_chunk_changes
+from .dedup import find_processed_duplicate
+from .document_processor import DocumentProcessor
+from .document_status import set_document_status
+from .embedding_store import embed_with_store
+from .extraction_pool import extract_text
+from .metrics import INGESTION_ACTIVE, INGESTION_DURATION
+from .search_backend import get_search_backend
+
+settings = get_settings()
+
+doc_processor = DocumentProcessor()
+
+
+def process_document(document_id: int, staged_path: Optional[str] = None, reprocess: bool = False) -> str:
+    """
+    Extract, chunk, embed and index one document
+
+    `staged_path` is a local copy of the upload, used when blob storage
+    is not configured; when it is None the file is downloaded from blob
+    storage to a temporary file. Either way extraction reads from disk.
+    If a completed document has the same content hash, its text, chunks
+    and vectors are reused instead of extracting and embedding again,
+    unless `reprocess` asks for a fresh run.
+
+    Failures are recorded on the document (status "error"); exceptions
+    only escape when even that is impossible, e.g. the database is
+    unreachable. Returns the outcome: "completed", "error" or "missing".
+    """
+    db = SessionLocal()
+    temp_path = None
+    uploaded_ids = []
+    ingestion_start = time.perf_counter()
+    outcome = "error"
+    INGESTION_ACTIVE.inc()
+
+    try:
+        doc = db.query(Document).filter(Document.id == document_id).first()
+        if not doc:
+            print(f"Document {document_id} not found")
+            outcome = "missing"
+            return outcome
+
+        print(f"Processing document {document_id}: {doc.original_filename}")
+        set_document_status(db, doc, "processing")
+        db.commit()
+
+        # An identical file already processed: reuse its text, chunks and vectors
+        source = None if reprocess else find_processed_duplicate(db, doc.content_hash, exclude_id=doc.id)
+        source_search_ids = None
+        if source is not None:
+            print(f"Document {document_id} has the same content as document {source.id}: reusing its results")
+            text, structured_data = source.extracted_text, source.structured_data
+            doc.extracted_text = text
+            doc.structured_data = structured_data
+            if not doc.blob_url and source.blob_url:
+                doc.filename, doc.blob_url = source.filename, source.blob_url
+            source_chunks = sorted(source.chunks, key=lambda c: c.chunk_index)
+            chunks = [c.content for c in source_chunks]
+            source_search_ids = [c.search_id for c in source_chunks]
+        else:
+            path = staged_path
+            if path is None:
+                print(f"Downloading {doc.filename} from blob storage...")
+                temp_path = path = _download_to_temp_file(doc.filename)
+
+            # Extract text and structured data
+            print(f"Extracting text from {doc.original_filename}...")
+            text, structured_data = extract_text(path, doc.original_filename)
+            doc.extracted_text = text
+            doc.structured_data = structured_data
+            print(f"Extracted {len(text)} characters")
+
+            # Chunk text
+            print("Chunking text...")
+            chunks = doc_processor.chunk_text(text)
+            print(f"Created {len(chunks)} chunks")
+
+        # Keep the extraction results even if indexing fails
+        db.commit()
+
+        # Generate embeddings and index
+        try:
+            print("Generating embeddings and indexing...")
+
+            if not settings.azure_openai_api_key:
+                raise ValueError("Azure OpenAI API キーが設定されていません。.env ファイルを確認してください。")
+
+            if settings.search_backend == "azure" and not settings.azure_search_api_key:
+                raise ValueError("Azure Search API キーが設定されていません。.env ファイルを確認してください。")
+
+            openai_service = AzureOpenAIService()
+            search_index = get_search_backend()
+
+            # Compare with the chunks already indexed: only new text is embedded and uploaded
+            existing = list(doc.chunks)
+            plan = plan_chunk_changes(existing, chunks)
+            print(f"Chunks: {len(plan.added)} added, {len(plan.kept)} unchanged, {len(plan.removed)} removed")
+
+            embeddings = _embed_chunks(
+                openai_service,
+                search_index,
+                [chunks[i] for i in plan.added],
+                [source_search_ids[i] for i in plan.added] if source_search_ids else None
+            )
+
+            # Ids unique among the current rows and this run's chunks, so no upload overwrites a live entry
+            hashes = [chunk_hash(chunks[i]) for i in plan.added]
+            search_ids = new_search_ids(doc.id, existing, hashes)
+            search_docs = []
+            for i, embedding, content_hash, search_id in zip(plan.added, embeddings, hashes, search_ids):
+                chunk = chunks[i]
+
+                # Create chunk record
+                chunk_record = DocumentChunk(
+                    document_id=doc.id,
+                    chunk_index=i,
+                    content=chunk,
+                    content_hash=content_hash,
+                    sheet_name=None,  # TODO: Extract from structured_data
+                    search_id=search_id
+                )
+                db.add(chunk_record)
+
+                # Prepare search document (matching actual index schema)
+                # Prepare metadata JSON with additional fields
+                metadata_dict = {
+                    "application": doc.application,
+                    "issue": doc.issue,
+                    "ingredient": doc.ingredient,
+                    "customer": doc.customer,
+                    "trial_id": doc.trial_id,
+                    "sheet_name": chunk_record.sheet_name
+                }
+
+                search_doc = {
+                    "id": search_id,
+                    "document_id": str(doc.id),  # Convert to string to match schema
+                    "content": chunk,
+                    "title": doc.original_filename,  # Use "title" field instead of "filename"
+                    "chunk_index": i,
+                    "metadata": json.dumps(metadata_dict, ensure_ascii=False),  # Store additional fields as JSON
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "content_vector": embedding
+                }
+                search_docs.append(search_doc)
+
+            # Unchanged chunks that moved only get their position updated (adjacent chunks are merged by index)
+            moved = []
+            for chunk_record, i in plan.kept:
+                if chunk_record.content_hash is None:
+                    chunk_record.content_hash = chunk_hash(chunk_record.content)
+                if chunk_record.chunk_index != i:
+                    chunk_record.chunk_index = i
+                    moved.append({"id": chunk_record.search_id, "chunk_index": i})
+
+            if search_docs:
+                print(f"Uploading {len(search_docs)} documents to search index...")
+                uploaded_ids = [search_doc["id"] for search_doc in search_docs]
+                search_index.upload_documents(search_docs)
+            if moved:
+                search_index.merge_documents(moved)
+
+            # Rows that shared a kept chunk's search id are dropped without touching the index
+            removed_ids = plan.stale_search_ids()
+            if removed_ids:
+                print(f"Deleting {len(removed_ids)} stale documents from search index...")
+                search_index.delete_documents(removed_ids)
+            for chunk_record in plan.removed:
+                db.delete(chunk_record)
+
+            # The document may have been deleted while it was indexed; the row lock
+            # keeps it from going away until this commit
+            if db.query(Document.id).filter(Document.id == doc.id).with_for_update().first() is None:
+                print(f"Document {document_id} was deleted during processing")
+                db.rollback()
+                outcome = "missing"
+                return outcome
+
+            doc.indexed_at = get_jst_now()
+            set_document_status(db, doc, "completed")
+            db.commit()
+            outcome = "completed"
+            print(f"Document {document_id} processing completed successfully")
+
+        except Exception as e:
+            print(f"Indexing failed: {e}")
+            import traceback
+            traceback.print_exc()
+            # Keep the chunk rows matching what the last successful run indexed
+            # (the chunks this run uploaded are removed from the index below)
+            db.rollback()
+            set_document_status(db, doc, "error")
+            doc.error_message = str(e)
+            db.commit()
+
+        get_document_metadata_cache().put(doc)
+        return outcome
+
+    except Exception as e:
+        print(f"Document processing failed: {e}")
+        import traceback
+        traceback.print_exc()
+        db.rollback()
+        doc = db.query(Document).filter(Document.id == document_id).first()
+        if doc:
+            set_document_status(db, doc, "error")
+            doc.error_message = str(e)
+            db.commit()
+            get_document_metadata_cache().put(doc)
+        return outcome
+    finally:
+        # Unless this run completed, the chunks it uploaded have no row: take them back
+        if outcome != "completed" and uploaded_ids:
+            try:
+                get_search_backend().delete_documents(uploaded_ids)
+            except Exception as e:
+                print(f"Removing {len(uploaded_ids)} uploaded chunks from the search index failed: {e}")
+        # The searchable corpus may have changed: invalidate cached search responses
+        try:
+            bump_index_generation(db)
+        except Exception as e:
+            print(f"Index generation update failed: {e}")
+        db.close()
+        if temp_path:
+            os.unlink(temp_path)
+        INGESTION_ACTIVE.dec()
+        INGESTION_DURATION.observe(time.perf_counter() - ingestion_start, outcome=outcome)
+
+
+def _embed_chunks(openai_service, search_index, chunks, source_search_ids=None):
+    """
+    Embeddings for `chunks`, in order
+
+    Vectors still stored in the index under `source_search_ids` (the chunks
+    of an identical document) are reused; the rest come from the chunk
+    embedding store, or Azure OpenAI for text never embedded before.
+    """
+    embeddings = [None] * len(chunks)
+    if source_search_ids:
+        try:
+            stored = search_index.get_vectors(source_search_ids)
+        except Exception as e:
+            print(f"Stored vectors unavailable, embedding again: {e}")
+            stored = {}
+        embeddings = [stored.get(search_id) for search_id in source_search_ids]
+        print(f"Reused {sum(e is not None for e in embeddings)}/{len(chunks)} stored vectors")
+
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        new = embed_with_store(openai_service.get_embeddings_batch, [chunks[i] for i in missing])
+        for i, embedding in zip(missing, new):
+            embeddings[i] = embedding
+    return embeddings
+
+
+def _download_to_temp_file(blob_name: str) -> str:
+    """Download a blob to a temporary file (kept on disk, not in memory); returns its path"""
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(blob_name)[1], prefix="ingest-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            AzureBlobService().download_to_file(blob_name, f)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
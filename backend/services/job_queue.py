@@ -0,0 +1,477 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from database import SessionLocal
+from models import Document, IngestionJob, get_jst_now
+from .cache import get_document_metadata_cache
+from .document_status import set_document_status
+from .extraction_pool import get_extraction_pool
+from .metrics import INGESTION_JOBS, REGISTRY
+from .uploads import remove_staged_upload
+
+settings = get_settings()
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+JOB_STATUSES = (QUEUED, RUNNING, COMPLETED, FAILED)
+
+LEASE_EXPIRED_MESSAGE = "処理がタイムアウトしました（ワーカーが応答しないまま最大試行回数に達しました）"
+
+
+def _now() -> datetime:
+    return get_jst_now().replace(tzinfo=None)
+
+
+def enqueue_document(
+    db: Session,
+    document_id: int,
+    staged_path: Optional[str] = None,
+    reprocess: bool = False
+) -> IngestionJob:
+    """
+    Queue processing of a document (caller commits)
+
+    `staged_path` is a local copy of the upload (see uploads.stage_upload),
+    removed once the job finishes; None makes the worker download the file
+    from blob storage. `reprocess`
+    extracts again even if an identical file was already processed. A job
+    still waiting for the same document is reused rather than duplicated.
+    """
+    job = db.query(IngestionJob).filter(
+        IngestionJob.document_id == document_id,
+        IngestionJob.status == QUEUED
+    ).first()
+    if job is None:
+        job = IngestionJob(
+            document_id=document_id,
+            status=QUEUED,
+            attempts=0,
+            max_attempts=settings.ingestion_max_attempts,
+            run_after=_now(),
+            created_at=_now()
+        )
+        db.add(job)
+    if staged_path is not None:
+        remove_staged_upload(job.staged_path)
+        job.staged_path = staged_path
+    job.reprocess = bool(job.reprocess) or reprocess
+    return job
+
+
+def _supports_skip_locked(db: Session) -> bool:
+    # SQLite has no row locks; claims there rely on the conditional UPDATE alone
+    return db.get_bind().dialect.name in ("mysql", "postgresql")
+
+
+def claim_job(db: Session, owner: str) -> Optional[int]:
+    """
+    Lease the oldest runnable job to `owner`; returns its id or None
+
+    Runnable jobs are queued ones whose run_after has passed and running ones
+    whose lease expired (their worker died). On MySQL the candidate row is
+    read with SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers pick
+    different jobs; everywhere the claim itself is a conditional UPDATE on
+    (status, attempts), so a job is never leased twice. A document with a
+    live job is skipped so it is never processed by two workers at once.
+    """
+    while True:
+        now = _now()
+        busy_documents = [
+            document_id for (document_id,) in db.query(IngestionJob.document_id).filter(
+                IngestionJob.status == RUNNING,
+                IngestionJob.lease_expires_at >= now
+            )
+        ]
+
+        query = db.query(
+            IngestionJob.id,
+            IngestionJob.document_id,
+            IngestionJob.status,
+            IngestionJob.attempts,
+            IngestionJob.max_attempts
+        ).filter(
+            or_(
+                and_(IngestionJob.status == QUEUED, IngestionJob.run_after <= now),
+                and_(IngestionJob.status == RUNNING, IngestionJob.lease_expires_at < now)
+            )
+        )
+        if busy_documents:
+            query = query.filter(IngestionJob.document_id.notin_(busy_documents))
+        query = query.order_by(IngestionJob.id).limit(1)
+        if _supports_skip_locked(db):
+            query = query.with_for_update(skip_locked=True)
+
+        row = query.first()
+        if row is None:
+            db.rollback()
+            return None
+
+        if row.status == RUNNING and row.attempts >= row.max_attempts:
+            staged_path = _fail(db, row.id, row.document_id, LEASE_EXPIRED_MESSAGE)
+            db.commit()
+            remove_staged_upload(staged_path)
+            continue
+
+        claimed = db.query(IngestionJob).filter(
+            IngestionJob.id == row.id,
+            IngestionJob.status == row.status,
+            IngestionJob.attempts == row.attempts
+        ).update({
+            IngestionJob.status: RUNNING,
+            IngestionJob.attempts: row.attempts + 1,
+            IngestionJob.lease_owner: owner,
+            IngestionJob.lease_expires_at: now + timedelta(seconds=settings.ingestion_lease_seconds),
+            IngestionJob.heartbeat_at: now,
+            IngestionJob.started_at: now
+        }, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            continue  # Another worker got it first
+
+        if row.status == RUNNING:
+            print(f"Ingestion job {row.id}: lease expired, retrying (attempt {row.attempts + 1}/{row.max_attempts})")
+        return row.id
+
+
+def extend_leases(db: Session, owner: str, job_ids: List[int]) -> Set[int]:
+    """Heartbeat: push back the leases `owner` holds; returns the ids it still holds"""
+    if not job_ids:
+        return set()
+    now = _now()
+    db.query(IngestionJob).filter(
+        IngestionJob.id.in_(job_ids),
+        IngestionJob.lease_owner == owner,
+        IngestionJob.status == RUNNING
+    ).update({
+        IngestionJob.lease_expires_at: now + timedelta(seconds=settings.ingestion_lease_seconds),
+        IngestionJob.heartbeat_at: now
+    }, synchronize_session=False)
+    db.commit()
+    return {
+        job_id for (job_id,) in db.query(IngestionJob.id).filter(
+            IngestionJob.id.in_(job_ids),
+            IngestionJob.lease_owner == owner,
+            IngestionJob.status == RUNNING
+        )
+    }
+
+
+def complete_job(db: Session, job_id: int, owner: str, outcome: str) -> bool:
+    """
+    Finish a job after process_document returned
+
+    Processing failures were already recorded on the document, so the job
+    is marked failed without a retry. Returns False if the lease was lost.
+    """
+    job = db.get(IngestionJob, job_id)
+    if job is None or job.status != RUNNING or job.lease_owner != owner:
+        db.rollback()
+        return False
+
+    job.status = FAILED if outcome == "error" else COMPLETED
+    if job.status == FAILED:
+        doc = db.get(Document, job.document_id)
+        job.last_error = doc.error_message if doc else None
+    job.finished_at = _now()
+    job.lease_expires_at = None
+    staged_path, job.staged_path = job.staged_path, None
+    db.commit()
+    remove_staged_upload(staged_path)
+    return True
+
+
+def retry_job(db: Session, job_id: int, owner: str, error: str) -> str:
+    """
+    Handle an exception that escaped process_document
+
+    The job is queued again after an exponential backoff, or failed (and
+    its document marked as an error) once max_attempts is reached. Returns
+    the new job status.
+    """
+    job = db.get(IngestionJob, job_id)
+    if job is None or job.status != RUNNING or job.lease_owner != owner:
+        db.rollback()
+        return "lost"
+
+    if job.attempts >= job.max_attempts:
+        staged_path = _fail(db, job.id, job.document_id, error)
+        db.commit()
+        remove_staged_upload(staged_path)
+        return FAILED
+
+    delay = settings.ingestion_retry_backoff_seconds * 2 ** (job.attempts - 1)
+    job.status = QUEUED
+    job.run_after = _now() + timedelta(seconds=delay)
+    job.lease_owner = None
+    job.lease_expires_at = None
+    job.last_error = error
+    db.commit()
+    return QUEUED
+
+
+def release_job(db: Session, job_id: int, owner: str):
+    """Give a running job back to the queue (worker shutting down before it finished)"""
+    db.query(IngestionJob).filter(
+        IngestionJob.id == job_id,
+        IngestionJob.lease_owner == owner,
+        IngestionJob.status == RUNNING
+    ).update({
+        IngestionJob.status: QUEUED,
+        IngestionJob.run_after: _now(),
+        IngestionJob.lease_owner: None,
+        IngestionJob.lease_expires_at: None
+    }, synchronize_session=False)
+    db.commit()
+
+
+def purge_finished_jobs(db: Session) -> int:
+    """Delete completed and failed jobs older than settings.ingestion_job_retention_days"""
+    cutoff = _now() - timedelta(days=settings.ingestion_job_retention_days)
+    deleted = db.query(IngestionJob).filter(
+        IngestionJob.status.in_([COMPLETED, FAILED]),
+        IngestionJob.finished_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def get_queue_stats(db: Session) -> Dict[str, Any]:
+    counts = {status: 0 for status in JOB_STATUSES}
+    for status, count in db.query(IngestionJob.status, func.count(IngestionJob.id)).group_by(IngestionJob.status):
+        counts[status] = count
+    oldest = db.query(func.min(IngestionJob.created_at)).filter(IngestionJob.status == QUEUED).scalar()
+    return {
+        "jobs": counts,
+        "oldest_queued_seconds": round((_now() - oldest).total_seconds(), 1) if oldest else None
+    }
+
+
+def _fail(db: Session, job_id: int, document_id: int, error: str) -> Optional[str]:
+    """Mark a job failed (caller commits); returns its staged upload, to remove after the commit"""
+    now = _now()
+    staged_path = db.query(IngestionJob.staged_path).filter(IngestionJob.id == job_id).scalar()
+    db.query(IngestionJob).filter(IngestionJob.id == job_id).update({
+        IngestionJob.status: FAILED,
+        IngestionJob.last_error: error,
+        IngestionJob.finished_at: now,
+        IngestionJob.lease_expires_at: None,
+        IngestionJob.staged_path: None
+    }, synchronize_session=False)
+
+    doc = db.get(Document, document_id)
+    if doc is not None and doc.status != "completed":
+        set_document_status(db, doc, "error")
+        doc.error_message = error
+        db.flush()
+        get_document_metadata_cache().put(doc)
+    return staged_path
+
+
+class IngestionWorkerPool:
+    """
+    Threads that claim and run ingestion jobs, plus one heartbeat thread
+
+    Used by worker.py and, unless INGESTION_EMBEDDED_WORKERS=0, inside the
+    API process. close() stops claiming, waits for jobs in flight and hands
+    back any still running at the timeout so another worker picks them up.
+    """
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._active: Set[int] = set()
+        self._lock = threading.Lock()
+        self.concurrency = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self, concurrency: int = None):
+        with self._lock:
+            if self._threads:
+                return
+            self.concurrency = concurrency or settings.ingestion_worker_concurrency
+            self._stop.clear()
+            self._closed.clear()
+            self._threads = [
+                threading.Thread(target=self._work, name=f"ingestion-worker-{index}", daemon=True)
+                for index in range(self.concurrency)
+            ]
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="ingestion-heartbeat", daemon=True)
+        for thread in self._threads:
+            thread.start()
+        self._heartbeat_thread.start()
+        print(f"Ingestion workers started: {self.concurrency} threads ({self.owner})")
+
+    def wake(self):
+        """Check the queue now instead of at the next poll"""
+        self._wake.set()
+
+    def close(self, timeout: float = None):
+        """Stop claiming jobs and drain the ones in flight"""
+        if not self._threads:
+            return
+        timeout = settings.ingestion_shutdown_timeout_seconds if timeout is None else timeout
+        self._stop.set()
+        self._wake.set()
+
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        with self._lock:
+            unfinished = list(self._active)
+        for job_id in unfinished:
+            print(f"Ingestion job {job_id} still running at shutdown: returning it to the queue")
+            db = SessionLocal()
+            try:
+                release_job(db, job_id, self.owner)
+            except Exception as e:
+                print(f"Failed to release ingestion job {job_id}: {e}")
+            finally:
+                db.close()
+
+        self._closed.set()
+        self._heartbeat_thread.join(5)
+        self._threads = []
+        self._heartbeat_thread = None
+
+        if settings.extraction_pool_enabled:
+            get_extraction_pool().close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "owner": self.owner,
+                "concurrency": self.concurrency,
+                "running": bool(self._threads) and not self._stop.is_set(),
+                "active_jobs": sorted(self._active),
+                "completed": self.completed,
+                "failed": self.failed,
+                "retried": self.retried
+            }
+
+    def _work(self):
+        from .ingestion import process_document
+
+        while not self._stop.is_set():
+            job_id = self._claim()
+            if job_id is None:
+                self._wake.wait(settings.ingestion_poll_seconds)
+                self._wake.clear()
+                continue
+
+            with self._lock:
+                self._active.add(job_id)
+            try:
+                db = SessionLocal()
+                try:
+                    job = db.get(IngestionJob, job_id)
+                    document_id, staged_path, reprocess = job.document_id, job.staged_path, bool(job.reprocess)
+                finally:
+                    db.close()
+
+                outcome = process_document(document_id, staged_path, reprocess=reprocess)
+                self._finish(job_id, outcome)
+            except Exception as e:
+                print(f"Ingestion job {job_id} failed: {e}")
+                self._retry(job_id, str(e))
+            finally:
+                with self._lock:
+                    self._active.discard(job_id)
+
+    def _claim(self) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            return claim_job(db, self.owner)
+        except Exception as e:
+            db.rollback()
+            print(f"Ingestion job claim failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _finish(self, job_id: int, outcome: str):
+        db = SessionLocal()
+        try:
+            if not complete_job(db, job_id, self.owner, outcome):
+                print(f"Ingestion job {job_id}: lease lost before completion")
+                return
+            with self._lock:
+                if outcome == "error":
+                    self.failed += 1
+                else:
+                    self.completed += 1
+        finally:
+            db.close()
+
+    def _retry(self, job_id: int, error: str):
+        db = SessionLocal()
+        try:
+            status = retry_job(db, job_id, self.owner, error)
+            with self._lock:
+                if status == QUEUED:
+                    self.retried += 1
+                elif status == FAILED:
+                    self.failed += 1
+        except Exception as e:
+            db.rollback()
+            print(f"Ingestion job {job_id}: could not record failure ({e}); its lease will expire")
+        finally:
+            db.close()
+
+    def _heartbeat(self):
+        # Keeps running while close() drains, until the workers have stopped
+        last_purge = 0.0
+        while not self._closed.wait(settings.ingestion_heartbeat_seconds):
+            with self._lock:
+                active = list(self._active)
+            db = SessionLocal()
+            try:
+                held = extend_leases(db, self.owner, active)
+                for job_id in set(active) - held:
+                    print(f"Ingestion job {job_id}: lease lost (another worker may retry it)")
+                if time.monotonic() - last_purge > 3600:
+                    purged = purge_finished_jobs(db)
+                    if purged:
+                        print(f"Purged {purged} finished ingestion jobs")
+                    last_purge = time.monotonic()
+            except Exception as e:
+                db.rollback()
+                print(f"Ingestion heartbeat failed: {e}")
+            finally:
+                db.close()
+
+
+def _collect_job_metrics():
+    db = SessionLocal()
+    try:
+        stats = get_queue_stats(db)
+    finally:
+        db.close()
+    for status, count in stats["jobs"].items():
+        INGESTION_JOBS.set(count, status=status)
+
+
+REGISTRY.add_collector(_collect_job_metrics)
+
+
+@lru_cache()
+def get_ingestion_worker_pool() -> IngestionWorkerPool:
+    return IngestionWorkerPool()
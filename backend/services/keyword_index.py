@@ -0,0 +1,348 @@
+import json
+import math
+import os
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_ASCII_WORD_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+_CJK_RUN_RE = re.compile(r"[^\W\d_a-z]+")
+
+
+def tokenize(text: str, ngram_sizes: Sequence[int] = (2, 3)) -> List[str]:
+    """
+    Tokenize text for a Japanese keyword index
+
+    Japanese has no spaces, so runs of kana/kanji are cut into overlapping
+    character n-grams (bi-grams and tri-grams by default): 「離水防止」 becomes
+    離水, 水防, 防止, 離水防, 水防止. Runs of ASCII letters and digits are kept
+    as whole words (PAN, 0.3, ID4567). Text is NFKC-normalized and lowercased
+    first, so full-width and half-width forms match.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+
+    tokens = _ASCII_WORD_RE.findall(text)
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) < min(ngram_sizes):
+            tokens.append(run)
+            continue
+        for n in ngram_sizes:
+            tokens.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over integer document ids
+
+    Postings are compact parallel arrays of doc ids (int32) and term
+    frequencies (uint16). A saved index is reloaded with memory-mapped numpy
+    arrays (the base segment); documents added afterwards go to small
+    in-memory array('i')/array('H') postings (the delta). save() writes only
+    the delta and the tombstones since the base was written, so a write
+    costs time proportional to the change, not the corpus; the base is
+    rewritten when saving under a new prefix (compaction) or once the delta
+    grows past DELTA_MERGE_RATIO of the base. Doc ids must be added in
+    increasing order.
+    """
+
+    # Merge the delta into the base once it holds this share of the base's documents
+    DELTA_MERGE_RATIO = 0.1
+    DELTA_MERGE_MIN_DOCS = 1000
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        self.base_terms: Dict[str, int] = {}
+        self.base_offsets = np.zeros(1, dtype=np.int64)
+        self.base_docs = np.zeros(0, dtype=np.int32)
+        self.base_tfs = np.zeros(0, dtype=np.uint16)
+        self.delta: Dict[str, Tuple[array, array]] = {}
+
+        self.doc_lengths = array("i")
+        self.deleted = bytearray()
+        self.active_docs = 0
+        self.active_length = 0
+
+        # What the files under saved_prefix hold as the base segment
+        self.saved_prefix: Optional[str] = None
+        self.base_count = 0  # Documents in the saved base
+        self.base_deletes: List[int] = []  # Base documents deleted since the base was saved
+
+    def __len__(self) -> int:
+        return self.active_docs
+
+    # ---- updates ---------------------------------------------------------
+
+    def add(self, doc_id: int, text: str):
+        """Index text under doc_id (must be >= every id added before)"""
+        if doc_id < len(self.doc_lengths):
+            raise ValueError(f"Doc ids must increase (got {doc_id}, next is {len(self.doc_lengths)})")
+
+        while len(self.doc_lengths) < doc_id:
+            # Ids skipped by the caller (e.g. rows without text) count as deleted
+            self.doc_lengths.append(0)
+            self.deleted.append(1)
+
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            docs, tfs = self.delta.setdefault(term, (array("i"), array("H")))
+            docs.append(doc_id)
+            tfs.append(min(tf, 65535))
+
+        self.doc_lengths.append(len(tokens))
+        self.deleted.append(0)
+        self.active_docs += 1
+        self.active_length += len(tokens)
+
+    def delete(self, doc_id: int):
+        """Tombstone a document (postings are dropped by remap)"""
+        if doc_id >= len(self.deleted) or self.deleted[doc_id]:
+            return
+        self.deleted[doc_id] = 1
+        self.active_docs -= 1
+        self.active_length -= self.doc_lengths[doc_id]
+        if doc_id < self.base_count:
+            self.base_deletes.append(doc_id)
+
+    def remap(self, mapping: np.ndarray) -> "BM25Index":
+        """
+        Return a copy with doc ids renumbered through mapping (old id -> new id,
+        -1 to drop); used when the owning store compacts its rows
+        """
+        index = BM25Index(self.k1, self.b)
+        size = int(mapping.max()) + 1 if len(mapping) and mapping.max() >= 0 else 0
+        lengths = np.zeros(size, dtype=np.int32)
+        kept = mapping >= 0
+        lengths[mapping[kept]] = np.frombuffer(self.doc_lengths, dtype=np.int32)[:len(mapping)][kept]
+
+        terms, offsets, doc_chunks, tf_chunks = {}, [0], [], []
+        for term in self._all_terms():
+            docs, tfs = self.postings(term)
+            in_range = docs < len(mapping)
+            new_docs = mapping[docs[in_range]]
+            keep = new_docs >= 0
+            if not keep.any():
+                continue
+            terms[term] = len(terms)
+            doc_chunks.append(new_docs[keep].astype(np.int32))
+            tf_chunks.append(tfs[in_range][keep])
+            offsets.append(offsets[-1] + int(keep.sum()))
+
+        index._set_base(terms, offsets, doc_chunks, tf_chunks)
+        index.doc_lengths = array("i", lengths.tolist())
+        index.deleted = bytearray(size)
+        index.active_docs = size
+        index.active_length = int(lengths.sum())
+        return index
+
+    # ---- queries ---------------------------------------------------------
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Doc ids and term frequencies for term (base segment + delta)"""
+        docs, tfs = [], []
+        position = self.base_terms.get(term)
+        if position is not None:
+            start, end = self.base_offsets[position], self.base_offsets[position + 1]
+            docs.append(self.base_docs[start:end])
+            tfs.append(self.base_tfs[start:end])
+        if term in self.delta:
+            delta_docs, delta_tfs = self.delta[term]
+            docs.append(np.frombuffer(delta_docs, dtype=np.int32))
+            tfs.append(np.frombuffer(delta_tfs, dtype=np.uint16))
+
+        if not docs:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16)
+        if len(docs) == 1:
+            return np.asarray(docs[0]), np.asarray(tfs[0])
+        return np.concatenate(docs), np.concatenate(tfs)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every doc id for query (deleted docs score 0)"""
+        num_docs = len(self.doc_lengths)
+        scores = np.zeros(num_docs, dtype=np.float32)
+        if self.active_docs == 0:
+            return scores
+
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.int32).astype(np.float32)
+        avg_length = max(self.active_length / self.active_docs, 1.0)
+        norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+
+        for term in set(tokenize(query)):
+            docs, tfs = self.postings(term)
+            if len(docs) == 0:
+                continue
+            idf = math.log(1 + (self.active_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            tfs = tfs.astype(np.float32)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        scores[np.frombuffer(bytes(self.deleted), dtype=np.uint8).astype(bool)] = 0
+        return scores
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """Top (doc id, score) pairs, optionally restricted to the allowed doc ids"""
+        scores = self.scores(query)
+        if allowed is not None:
+            mask = np.zeros(len(scores), dtype=bool)
+            mask[allowed[allowed < len(scores)]] = True
+            scores[~mask] = 0
+
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) == 0:
+            return []
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in matched]
+
+    # ---- persistence -----------------------------------------------------
+
+    def save(self, prefix: str):
+        """
+        Persist the index under prefix
+
+        Writes only the delta segment ({prefix}.delta.npz) when the base
+        files under prefix are current; otherwise merges base and delta into
+        new {prefix}.*.npy files plus {prefix}.json.
+        """
+        delta_docs = len(self.doc_lengths) - self.base_count
+        if prefix != self.saved_prefix or delta_docs > max(self.DELTA_MERGE_MIN_DOCS, self.base_count * self.DELTA_MERGE_RATIO):
+            self._save_base(prefix)
+        else:
+            self._save_delta(prefix)
+
+    def _save_base(self, prefix: str):
+        terms, offsets, doc_chunks, tf_chunks = {}, [0], [], []
+        for term in self._all_terms():
+            docs, tfs = self.postings(term)
+            terms[term] = len(terms)
+            doc_chunks.append(docs)
+            tf_chunks.append(tfs)
+            offsets.append(offsets[-1] + len(docs))
+
+        docs = np.concatenate(doc_chunks).astype(np.int32) if doc_chunks else np.zeros(0, dtype=np.int32)
+        tfs = np.concatenate(tf_chunks).astype(np.uint16) if tf_chunks else np.zeros(0, dtype=np.uint16)
+        arrays = {
+            "offsets": np.asarray(offsets, dtype=np.int64),
+            "docs": docs,
+            "tfs": tfs,
+            "lengths": np.frombuffer(self.doc_lengths, dtype=np.int32),
+            "deleted": np.frombuffer(bytes(self.deleted), dtype=np.uint8)
+        }
+        for name, values in arrays.items():
+            # Replace rather than overwrite: other workers may have the old file mapped
+            np.save(f"{prefix}.{name}.tmp.npy", values)
+            os.replace(f"{prefix}.{name}.tmp.npy", f"{prefix}.{name}.npy")
+
+        header = {"k1": self.k1, "b": self.b, "terms": list(terms)}
+        tmp_path = f"{prefix}.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False)
+        os.replace(tmp_path, f"{prefix}.json")
+
+        # The merged arrays become the new base segment, so the old delta is obsolete
+        if os.path.exists(f"{prefix}.delta.npz"):
+            os.remove(f"{prefix}.delta.npz")
+        self._set_base(terms, offsets, [docs], [tfs])
+        self.saved_prefix = prefix
+        self.base_count = len(self.doc_lengths)
+        self.base_deletes = []
+
+    def _save_delta(self, prefix: str):
+        terms, offsets = [], [0]
+        for term, (docs, _) in self.delta.items():
+            terms.append(term)
+            offsets.append(offsets[-1] + len(docs))
+        arrays = {
+            # The delta only applies on top of a base of this many documents
+            "base_count": np.asarray([self.base_count], dtype=np.int64),
+            "terms": np.asarray(terms, dtype=str),
+            "offsets": np.asarray(offsets, dtype=np.int64),
+            "docs": np.frombuffer(b"".join(docs.tobytes() for docs, _ in self.delta.values()), dtype=np.int32),
+            "tfs": np.frombuffer(b"".join(tfs.tobytes() for _, tfs in self.delta.values()), dtype=np.uint16),
+            "lengths": np.frombuffer(self.doc_lengths, dtype=np.int32)[self.base_count:],
+            "deleted": np.frombuffer(bytes(self.deleted[self.base_count:]), dtype=np.uint8),
+            "base_deletes": np.asarray(self.base_deletes, dtype=np.int32)
+        }
+        # One file replaced atomically, so a reader never sees half a delta
+        with open(f"{prefix}.delta.tmp.npz", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(f"{prefix}.delta.tmp.npz", f"{prefix}.delta.npz")
+
+    @classmethod
+    def load(cls, prefix: str) -> "BM25Index":
+        with open(f"{prefix}.json", encoding="utf-8") as f:
+            header = json.load(f)
+
+        index = cls(header["k1"], header["b"])
+        index.base_terms = {term: i for i, term in enumerate(header["terms"])}
+        index.base_offsets = np.load(f"{prefix}.offsets.npy")
+        index.base_docs = np.load(f"{prefix}.docs.npy", mmap_mode="r")
+        index.base_tfs = np.load(f"{prefix}.tfs.npy", mmap_mode="r")
+
+        lengths = np.load(f"{prefix}.lengths.npy")
+        deleted = np.load(f"{prefix}.deleted.npy")
+        index.saved_prefix = prefix
+        index.base_count = len(lengths)
+
+        if os.path.exists(f"{prefix}.delta.npz"):
+            with np.load(f"{prefix}.delta.npz") as delta:
+                # A delta left from before the last base rewrite no longer applies
+                if int(delta["base_count"][0]) == index.base_count:
+                    offsets, docs, tfs = delta["offsets"], delta["docs"], delta["tfs"]
+                    for i, term in enumerate(delta["terms"].tolist()):
+                        start, end = offsets[i], offsets[i + 1]
+                        index.delta[term] = (array("i", docs[start:end].tobytes()), array("H", tfs[start:end].tobytes()))
+                    deleted = deleted.copy()
+                    deleted[delta["base_deletes"]] = 1
+                    index.base_deletes = delta["base_deletes"].tolist()
+                    lengths = np.concatenate([lengths, delta["lengths"]])
+                    deleted = np.concatenate([deleted, delta["deleted"]])
+
+        index.doc_lengths = array("i", lengths.astype(np.int32).tobytes())
+        index.deleted = bytearray(deleted.astype(np.uint8).tobytes())
+        active = deleted == 0
+        index.active_docs = int(active.sum())
+        index.active_length = int(lengths[active].sum())
+        return index
+
+    @staticmethod
+    def files(prefix: str) -> List[str]:
+        return [f"{prefix}.json", f"{prefix}.delta.npz"] + [
+            f"{prefix}.{name}.npy" for name in ("offsets", "docs", "tfs", "lengths", "deleted")
+        ]
+
+    def _all_terms(self) -> Iterable[str]:
+        yield from self.base_terms
+        yield from (term for term in self.delta if term not in self.base_terms)
+
+    def _set_base(self, terms: Dict[str, int], offsets: List[int], doc_chunks: List[np.ndarray], tf_chunks: List[np.ndarray]):
+        self.base_terms = terms
+        self.base_offsets = np.asarray(offsets, dtype=np.int64)
+        self.base_docs = np.concatenate(doc_chunks).astype(np.int32) if doc_chunks else np.zeros(0, dtype=np.int32)
+        self.base_tfs = np.concatenate(tf_chunks).astype(np.uint16) if tf_chunks else np.zeros(0, dtype=np.uint16)
+        self.delta = {}
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Fuse ranked id lists with RRF: score(d) = sum over lists of 1 / (k + rank)
+
+    The same fusion Azure AI Search uses for hybrid queries, so fused scores
+    are on a comparable (small) scale.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
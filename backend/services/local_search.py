@@ -0,0 +1,848 @@
+import asyncio
+import heapq
+import json
+import math
+import os
+import random
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from models import Document, DocumentChunk
+from .azure_services import format_search_result
+from .keyword_index import BM25Index, reciprocal_rank_fusion
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+settings = get_settings()
+
+FILTERABLE_FIELDS = ("application", "issue", "ingredient", "customer", "trial_id")
+
+_FILTER_RE = re.compile(r"(\w+)\s+eq\s+'((?:[^']|'')*)'")
+
+
+def parse_filter(filters: Optional[str]) -> Dict[str, str]:
+    """Parse the `field eq 'value' and ...` OData subset built by SearchService"""
+    if not filters:
+        return {}
+    return {field: value.replace("''", "'") for field, value in _FILTER_RE.findall(filters)}
+
+
+class VectorStore:
+    """
+    Unit-normalized vectors in a growable memory-mapped file
+
+    float32 keeps vectors as-is. int8 stores each vector scaled to [-127, 127]
+    plus one float32 scale per row: 4x less memory and disk, at the cost of a
+    dequantization step when scoring.
+    """
+
+    def __init__(self, path: str, dim: int, dtype: str, count: int = 0, scales: Optional[np.ndarray] = None):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+        self.path = path
+        self.dim = dim
+        self.dtype = dtype
+        self.count = count
+        self.scales = scales if scales is not None else np.zeros(0, dtype=np.float32)
+        self.capacity = 0
+        self.vectors: Optional[np.memmap] = None
+
+        existing_rows = os.path.getsize(path) // self._row_bytes if os.path.exists(path) else 0
+        self._map(max(existing_rows, count))
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * np.dtype(self.dtype).itemsize
+
+    def _map(self, capacity: int):
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+
+        if capacity == 0:
+            self.capacity = 0
+            return
+
+        with open(self.path, "ab") as f:
+            if f.tell() < capacity * self._row_bytes:
+                f.truncate(capacity * self._row_bytes)
+
+        self.vectors = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        self.capacity = capacity
+
+    def append(self, vectors: np.ndarray) -> range:
+        """Normalize and append vectors, returning their row numbers"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        start = self.count
+        end = start + len(vectors)
+        if end > self.capacity:
+            self._map(max(1024, self.capacity * 2, end))
+
+        if self.dtype == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            self.vectors[start:end] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self.scales = np.concatenate([self.scales, scales.astype(np.float32)])
+        else:
+            self.vectors[start:end] = vectors
+
+        self.count = end
+        return range(start, end)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity between a normalized query and the given rows (all rows by default)"""
+        if self.count == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        if self.dtype == "float32":
+            vectors = self.vectors[:self.count] if rows is None else self.vectors[rows]
+            return np.asarray(vectors @ query)
+
+        # Dequantize in blocks to bound the float32 temporary
+        if rows is None:
+            rows = np.arange(self.count)
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), 4096):
+            block = rows[start:start + 4096]
+            scores[start:start + 4096] = (self.vectors[block].astype(np.float32) @ query) * self.scales[block]
+        return scores
+
+    def distances(self, query: np.ndarray, rows: List[int]) -> np.ndarray:
+        return 1.0 - self.scores(query, np.asarray(rows, dtype=np.int64))
+
+    def vector(self, row: int) -> np.ndarray:
+        if self.dtype == "int8":
+            return self.vectors[row].astype(np.float32) * self.scales[row]
+        return np.asarray(self.vectors[row])
+
+    def flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+
+    def truncate(self):
+        """Cut the file back to `count` rows, dropping rows of a write that did not finish"""
+        self._map(0)
+        with open(self.path, "r+b") as f:
+            f.truncate(self.count * self._row_bytes)
+        self._map(self.count)
+
+
+class HnswGraph:
+    """
+    Hierarchical navigable small-world graph over the rows of a VectorStore
+
+    Rows must be added in order. Deleted rows stay in the graph as routing
+    nodes and are filtered out by the caller; compaction rebuilds the graph.
+    """
+
+    def __init__(self, m: int = 16, ef_construction: int = 100, seed: int = 42):
+        self.m = m
+        self.m0 = m * 2
+        self.ef_construction = ef_construction
+        self.level_mult = 1 / math.log(m)
+        self.levels: List[int] = []
+        self.links: List[Dict[int, List[int]]] = []
+        self.entry_point = -1
+        self.max_level = -1
+        self._rng = random.Random(seed)
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def add(self, store: VectorStore, rows: Iterable[int]):
+        for row in rows:
+            self._insert(store, row)
+
+    def search(self, store: VectorStore, query: np.ndarray, k: int, ef: int) -> List[Tuple[float, int]]:
+        """Approximate nearest rows as (distance, row), closest first"""
+        if self.entry_point < 0:
+            return []
+
+        entry = [self.entry_point]
+        for level in range(self.max_level, 0, -1):
+            entry = [self._search_layer(store, query, entry, 1, level)[0][1]]
+        return self._search_layer(store, query, entry, max(ef, k), 0)
+
+    def _insert(self, store: VectorStore, row: int):
+        if row != len(self.levels):
+            raise ValueError(f"HNSW rows must be added in order (expected {len(self.levels)}, got {row})")
+
+        query = store.vector(row)
+        level = int(-math.log(1.0 - self._rng.random()) * self.level_mult)
+        self.levels.append(level)
+        while len(self.links) <= level:
+            self.links.append({})
+
+        if self.entry_point < 0:
+            for l in range(level + 1):
+                self.links[l][row] = []
+            self.entry_point = row
+            self.max_level = level
+            return
+
+        entry = [self.entry_point]
+        for l in range(self.max_level, level, -1):
+            entry = [self._search_layer(store, query, entry, 1, l)[0][1]]
+
+        for l in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(store, query, entry, self.ef_construction, l)
+            max_links = self.m0 if l == 0 else self.m
+            neighbors = [r for _, r in candidates[:self.m]]
+            self.links[l][row] = neighbors
+
+            for neighbor in neighbors:
+                neighbor_links = self.links[l][neighbor]
+                neighbor_links.append(row)
+                if len(neighbor_links) > max_links:
+                    dist = store.distances(store.vector(neighbor), neighbor_links)
+                    self.links[l][neighbor] = [neighbor_links[i] for i in np.argsort(dist)[:max_links]]
+
+            entry = [r for _, r in candidates]
+
+        for l in range(self.max_level + 1, level + 1):
+            self.links[l][row] = []
+        if level > self.max_level:
+            self.entry_point = row
+            self.max_level = level
+
+    def _search_layer(
+        self,
+        store: VectorStore,
+        query: np.ndarray,
+        entry_points: List[int],
+        ef: int,
+        level: int
+    ) -> List[Tuple[float, int]]:
+        visited = set(entry_points)
+        entry_dist = store.distances(query, entry_points).tolist()
+        candidates = list(zip(entry_dist, entry_points))
+        heapq.heapify(candidates)
+        results = [(-d, r) for d, r in candidates]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        layer = self.links[level]
+        while candidates:
+            dist, row = heapq.heappop(candidates)
+            if dist > -results[0][0]:
+                break
+
+            neighbors = [n for n in layer.get(row, ()) if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+
+            for d, n in zip(store.distances(query, neighbors).tolist(), neighbors):
+                if len(results) < ef or d < -results[0][0]:
+                    heapq.heappush(candidates, (d, n))
+                    heapq.heappush(results, (-d, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted((-d, r) for d, r in results)
+
+    def save(self, path: str):
+        arrays = {
+            "levels": np.asarray(self.levels, dtype=np.int8),
+            "header": np.asarray([self.m, self.ef_construction, self.entry_point, self.max_level], dtype=np.int64)
+        }
+        for level, layer in enumerate(self.links):
+            width = self.m0 if level == 0 else self.m
+            nodes = np.fromiter(layer.keys(), dtype=np.int32, count=len(layer))
+            links = np.full((len(layer), width), -1, dtype=np.int32)
+            for i, neighbors in enumerate(layer.values()):
+                links[i, :len(neighbors)] = neighbors
+            arrays[f"nodes_{level}"] = nodes
+            arrays[f"links_{level}"] = links
+
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "HnswGraph":
+        with np.load(path) as data:
+            m, ef_construction, entry_point, max_level = data["header"].tolist()
+            graph = cls(m=m, ef_construction=ef_construction)
+            graph.levels = data["levels"].tolist()
+            graph.entry_point = entry_point
+            graph.max_level = max_level
+            level = 0
+            while f"nodes_{level}" in data:
+                nodes = data[f"nodes_{level}"].tolist()
+                links = data[f"links_{level}"]
+                graph.links.append({
+                    node: [n for n in row if n >= 0]
+                    for node, row in zip(nodes, links.tolist())
+                })
+                level += 1
+        return graph
+
+
+class LocalVectorSearchService:
+    """
+    Embedded vector search engine with the same interface as AzureSearchService
+
+    Layout of index_dir (file names carry a generation so compaction never
+    rewrites a file another worker has mapped):
+      manifest.json        dim, dtype, row count, current file names
+      vectors-N.bin        memory-mapped vectors (float32 or int8)
+      scales-N.npy         per-row scales (int8 only)
+      records-N.jsonl      one search document (without its vector) per row
+      deleted-N.npy        tombstones
+      hnsw-N.npz           HNSW graph, once the corpus passes hnsw_threshold
+      bm25-N.*             BM25 keyword index over the same rows (base + delta segment)
+
+    search() runs vector search, BM25 keyword search, or both fused with
+    reciprocal rank fusion, depending on settings.local_search_mode.
+
+    Workers reload when manifest.json changes, so every uvicorn worker serves
+    documents indexed by any of them. Writes from several processes (API
+    workers and worker.py) are serialized with an exclusive lock on
+    index.lock, and each writer reloads first so it appends after the
+    rows the previous one saved.
+    """
+
+    def __init__(
+        self,
+        index_dir: Optional[str] = None,
+        dtype: Optional[str] = None,
+        hnsw_threshold: Optional[int] = None
+    ):
+        self.index_dir = index_dir or settings.local_index_dir
+        self.dtype = dtype or settings.local_index_dtype
+        self.hnsw_threshold = settings.local_hnsw_threshold if hnsw_threshold is None else hnsw_threshold
+        self._lock = threading.RLock()
+        self._write_depth = 0
+        self._lock_file = None
+        self._reset()
+        self._load()
+
+    # ---- AzureSearchService interface ------------------------------------
+
+    def create_index(self):
+        """Create the index directory (the store itself is created on first upload)"""
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def upload_documents(self, documents: List[Dict[str, Any]]):
+        """Add or replace documents (each must carry content_vector)"""
+        if not documents:
+            return
+
+        with self._writing():
+            vectors = np.asarray([doc["content_vector"] for doc in documents], dtype=np.float32)
+            if self.store is None:
+                os.makedirs(self.index_dir, exist_ok=True)
+                self.store = VectorStore(self._path("vectors", "bin"), vectors.shape[1], self.dtype)
+            elif vectors.shape[1] != self.store.dim:
+                raise ValueError(f"Embedding dimension mismatch: index={self.store.dim}, documents={vectors.shape[1]}")
+
+            # Uploading an existing id replaces it, as in Azure AI Search
+            for doc in documents:
+                row = self.id_to_row.get(doc["id"])
+                if row is not None:
+                    self._mark_deleted(row)
+
+            rows = self.store.append(vectors)
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(rows), dtype=bool)])
+            with open(self._path("records", "jsonl"), "a", encoding="utf-8") as f:
+                for row, doc in zip(rows, documents):
+                    record = {k: v for k, v in doc.items() if k != "content_vector"}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    self._add_record(row, record)
+                    self.keyword_index.add(row, record.get("content") or "")
+
+            if self.graph is not None:
+                self.graph.add(self.store, rows)
+            elif self.active_count >= self.hnsw_threshold:
+                self._build_graph()
+
+            self._save()
+
+    def delete_documents(self, document_ids: List[str]):
+        """Delete documents by search id"""
+        with self._writing():
+            for doc_id in document_ids:
+                row = self.id_to_row.get(doc_id)
+                if row is not None:
+                    self._mark_deleted(row)
+
+            if self.store is None:
+                return
+            if self.store.count >= 1000 and self.deleted.sum() > self.store.count * 0.25:
+                self._compact()
+            else:
+                self._save()
+
+    def merge_documents(self, documents: List[Dict[str, Any]]):
+        """Update fields of existing documents, keeping their vectors (unknown ids are skipped)"""
+        with self._writing():
+            merged = []
+            for doc in documents:
+                row = self.id_to_row.get(doc["id"])
+                if row is None:
+                    continue
+                merged.append({**self.records[row], **doc, "content_vector": self.store.vector(row).tolist()})
+            self.upload_documents(merged)
+
+    def get_vectors(self, document_ids: List[str]) -> Dict[str, List[float]]:
+        """Stored (normalized) vectors by search id (ids missing from the index are left out)"""
+        with self._lock:
+            self._reload_if_changed()
+            return {
+                doc_id: self.store.vector(self.id_to_row[doc_id]).tolist()
+                for doc_id in document_ids
+                if doc_id in self.id_to_row
+            }
+
+    def search(
+        self,
+        query: str,
+        embedding: List[float],
+        top_k: int = 10,
+        filters: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Vector, keyword or hybrid (RRF) search depending on settings.local_search_mode"""
+        with self._lock:
+            self._reload_if_changed()
+            if self.store is None or self.active_count == 0:
+                return []
+
+            filter_values = parse_filter(filters)
+            mode = settings.local_search_mode
+            if mode == "vector":
+                hits = self.vector_search(embedding, top_k, filter_values)
+            elif mode == "keyword":
+                hits = self.keyword_search(query, top_k, filter_values)
+            else:
+                hits = self.hybrid_search(query, embedding, top_k, filter_values)
+            return [format_search_result({**self.records[row], "@search.score": score}) for row, score in hits]
+
+    # ---- engine ----------------------------------------------------------
+
+    @property
+    def active_count(self) -> int:
+        return len(self.id_to_row)
+
+    def vector_search(
+        self,
+        embedding: List[float],
+        top_k: int,
+        filters: Optional[Dict[str, str]] = None
+    ) -> List[Tuple[int, float]]:
+        """Return (row, cosine score) pairs, best first"""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        candidate_rows = self._filter_rows(filters) if filters else None
+        if candidate_rows is not None and len(candidate_rows) == 0:
+            return []
+
+        # The graph pays off only when the candidate set is large
+        use_graph = self.graph is not None and (candidate_rows is None or len(candidate_rows) > self.hnsw_threshold)
+        if use_graph:
+            allowed = set(candidate_rows.tolist()) if candidate_rows is not None else None
+            ef = max(settings.local_hnsw_ef_search, top_k * 4)
+            hits = []
+            for dist, row in self.graph.search(self.store, query, top_k, ef):
+                if self.deleted[row] or (allowed is not None and row not in allowed):
+                    continue
+                hits.append((row, 1.0 - dist))
+                if len(hits) == top_k:
+                    return hits
+            # Too many tombstones/filtered rows near the query: fall back to exact search
+
+        if candidate_rows is None:
+            scores = self.store.scores(query)
+            scores[self.deleted[:len(scores)]] = -np.inf
+            rows = np.arange(len(scores))
+        else:
+            rows = candidate_rows
+            scores = self.store.scores(query, rows)
+
+        k = min(top_k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def keyword_search(
+        self,
+        query: str,
+        top_k: int,
+        filters: Optional[Dict[str, str]] = None
+    ) -> List[Tuple[int, float]]:
+        """Return (row, BM25 score) pairs, best first"""
+        allowed = self._filter_rows(filters) if filters else None
+        if allowed is not None and len(allowed) == 0:
+            return []
+        return self.keyword_index.search(query, top_k, allowed)
+
+    def hybrid_search(
+        self,
+        query: str,
+        embedding: List[float],
+        top_k: int,
+        filters: Optional[Dict[str, str]] = None
+    ) -> List[Tuple[int, float]]:
+        """Fuse vector and keyword rankings with reciprocal rank fusion"""
+        depth = max(top_k * 5, 50)
+        vector_rows = [row for row, _ in self.vector_search(embedding, depth, filters)]
+        keyword_rows = [row for row, _ in self.keyword_search(query, depth, filters)]
+        return reciprocal_rank_fusion([vector_rows, keyword_rows], k=settings.local_rrf_k)[:top_k]
+
+    def rebuild_from_chunks(
+        self,
+        db: Session,
+        embed_batch: Callable[[List[str]], List[List[float]]],
+        batch_size: int = 16
+    ) -> int:
+        """Rebuild the index from DocumentChunk rows of completed documents"""
+        rows = db.query(DocumentChunk, Document).join(
+            Document, DocumentChunk.document_id == Document.id
+        ).filter(
+            Document.status == "completed"
+        ).order_by(DocumentChunk.document_id, DocumentChunk.chunk_index).all()
+
+        with self._writing():
+            next_generation = self.file_generation + 1
+            self._reset()
+            self.file_generation = next_generation
+
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                embeddings = embed_batch([chunk.content for chunk, _ in batch])
+                self.upload_documents([
+                    build_search_document(doc, chunk, embedding)
+                    for (chunk, doc), embedding in zip(batch, embeddings)
+                ])
+                print(f"Local index: {min(start + batch_size, len(rows))}/{len(rows)} chunks")
+
+            self._remove_files(keep_generation=next_generation if rows else None)
+
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rows": self.store.count if self.store else 0,
+                "active": self.active_count,
+                "dtype": self.dtype,
+                "dim": self.store.dim if self.store else None,
+                "hnsw": self.graph is not None,
+                "keyword_docs": len(self.keyword_index)
+            }
+
+    # ---- internals -------------------------------------------------------
+
+    @contextmanager
+    def _writing(self):
+        """
+        Exclusive write access across threads and processes (reentrant)
+
+        The outermost caller takes the file lock, reloads whatever another
+        process saved meanwhile and drops rows left by an interrupted write.
+        """
+        with self._lock:
+            if self._write_depth == 0:
+                os.makedirs(self.index_dir, exist_ok=True)
+                self._lock_file = open(os.path.join(self.index_dir, "index.lock"), "a")
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+                try:
+                    self._reload_if_changed()
+                    self._discard_unfinished_write()
+                except BaseException:
+                    self._unlock()
+                    raise
+            self._write_depth += 1
+            try:
+                yield
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._unlock()
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def _discard_unfinished_write(self):
+        """Truncate records and vectors past the saved row count, so new rows line up again"""
+        if self._records_end is None or self.store is None:
+            return
+        records_path = self._path("records", "jsonl")
+        if os.path.getsize(records_path) > self._records_end:
+            print(f"Local index: discarding rows past {self.store.count} left by an unfinished write")
+            with open(records_path, "r+b") as f:
+                f.truncate(self._records_end)
+            self.store.truncate()
+
+    def _reset(self):
+        self.store: Optional[VectorStore] = None
+        self.graph: Optional[HnswGraph] = None
+        self.keyword_index = BM25Index()
+        self.records: List[Optional[Dict[str, Any]]] = []
+        self.deleted = np.zeros(0, dtype=bool)
+        self.id_to_row: Dict[str, int] = {}
+        self.field_index: Dict[str, Dict[str, Set[int]]] = {field: {} for field in FILTERABLE_FIELDS}
+        self.file_generation = 0
+        self._manifest_stamp = None
+        self._records_end: Optional[int] = None  # Byte length of the saved rows in records-N.jsonl
+
+    def _path(self, name: str, ext: str, generation: Optional[int] = None) -> str:
+        generation = self.file_generation if generation is None else generation
+        return os.path.join(self.index_dir, f"{name}-{generation}.{ext}")
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.index_dir, "manifest.json")
+
+    def _add_record(self, row: int, record: Dict[str, Any]):
+        while len(self.records) <= row:
+            self.records.append(None)
+        self.records[row] = record
+        self.id_to_row[record["id"]] = row
+
+        for field, value in _filter_values(record).items():
+            self.field_index[field].setdefault(value, set()).add(row)
+
+    def _mark_deleted(self, row: int):
+        record = self.records[row]
+        self.deleted[row] = True
+        if self.id_to_row.get(record["id"]) == row:
+            del self.id_to_row[record["id"]]
+        self.keyword_index.delete(row)
+        for field, value in _filter_values(record).items():
+            self.field_index[field].get(value, set()).discard(row)
+
+    def _filter_rows(self, filters: Dict[str, str]) -> np.ndarray:
+        selected = None
+        for field, value in filters.items():
+            rows = self.field_index.get(field, {}).get(value, set())
+            selected = set(rows) if selected is None else selected & rows
+        return np.fromiter(sorted(selected or ()), dtype=np.int64)
+
+    def _build_graph(self):
+        print(f"Local index: building HNSW graph over {self.store.count} rows...")
+        self.graph = HnswGraph(m=settings.local_hnsw_m, ef_construction=settings.local_hnsw_ef_construction)
+        self.graph.add(self.store, range(self.store.count))
+
+    def _compact(self):
+        """Rewrite the store without tombstones under a new file generation"""
+        live_rows = np.flatnonzero(~self.deleted[:self.store.count])
+        old_store = self.store
+        old_records = self.records
+        old_files = self._current_files()
+
+        mapping = np.full(old_store.count, -1, dtype=np.int64)
+        mapping[live_rows] = np.arange(len(live_rows))
+        keyword_index = self.keyword_index.remap(mapping)
+
+        self.file_generation += 1
+        self.store = VectorStore(self._path("vectors", "bin"), old_store.dim, self.dtype)
+        self.records = []
+        self.deleted = np.zeros(0, dtype=bool)
+        self.id_to_row = {}
+        self.field_index = {field: {} for field in FILTERABLE_FIELDS}
+        self.graph = None
+
+        for start in range(0, len(live_rows), 4096):
+            rows = live_rows[start:start + 4096]
+            self.store.append(np.stack([old_store.vector(int(r)) for r in rows]))
+        self.deleted = np.zeros(self.store.count, dtype=bool)
+        with open(self._path("records", "jsonl"), "w", encoding="utf-8") as f:
+            for new_row, old_row in enumerate(live_rows):
+                record = old_records[int(old_row)]
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._add_record(new_row, record)
+        self.keyword_index = keyword_index
+
+        if self.active_count >= self.hnsw_threshold:
+            self._build_graph()
+
+        self._save()
+        for path in old_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _current_files(self) -> List[str]:
+        return [
+            self._path("vectors", "bin"),
+            self._path("scales", "npy"),
+            self._path("records", "jsonl"),
+            self._path("deleted", "npy"),
+            self._path("hnsw", "npz")
+        ] + BM25Index.files(self._keyword_prefix)
+
+    @property
+    def _keyword_prefix(self) -> str:
+        return os.path.join(self.index_dir, f"bm25-{self.file_generation}")
+
+    def _remove_files(self, keep_generation: Optional[int] = None):
+        """Remove index files of every generation except keep_generation (all files when None)"""
+        if not os.path.isdir(self.index_dir):
+            return
+        for name in os.listdir(self.index_dir):
+            match = re.match(r"(vectors|scales|records|deleted|hnsw|bm25)-(\d+)\.", name)
+            if match and int(match.group(2)) == keep_generation:
+                continue
+            if match or (name == "manifest.json" and keep_generation is None):
+                os.remove(os.path.join(self.index_dir, name))
+
+    def _save(self):
+        self.store.flush()
+        if self.dtype == "int8":
+            np.save(self._path("scales", "npy"), self.store.scales)
+        np.save(self._path("deleted", "npy"), self.deleted)
+        if self.graph is not None:
+            self.graph.save(self._path("hnsw", "npz"))
+        self.keyword_index.save(self._keyword_prefix)
+
+        manifest = {
+            "version": 1,
+            "dim": self.store.dim,
+            "dtype": self.dtype,
+            "count": self.store.count,
+            "file_generation": self.file_generation,
+            "hnsw": self.graph is not None
+        }
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path)
+        self._manifest_stamp = _file_stamp(self._manifest_path)
+        self._records_end = os.path.getsize(self._path("records", "jsonl"))
+
+    def _load(self):
+        if not os.path.exists(self._manifest_path):
+            return
+
+        with open(self._manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._manifest_stamp = _file_stamp(self._manifest_path)
+
+        self.dtype = manifest["dtype"]
+        self.file_generation = manifest["file_generation"]
+        count = manifest["count"]
+
+        scales = np.load(self._path("scales", "npy"))[:count] if self.dtype == "int8" else None
+        self.store = VectorStore(self._path("vectors", "bin"), manifest["dim"], self.dtype, count, scales)
+        self.deleted = np.load(self._path("deleted", "npy"))[:count]
+
+        keyword_loaded = False
+        if os.path.exists(f"{self._keyword_prefix}.json"):
+            self.keyword_index = BM25Index.load(self._keyword_prefix)
+            keyword_loaded = len(self.keyword_index.doc_lengths) == count
+            if not keyword_loaded:
+                self.keyword_index = BM25Index()  # Out of step with the vectors: rebuilt from the records below
+
+        self._records_end = 0
+        with open(self._path("records", "jsonl"), "rb") as f:
+            for row, line in enumerate(f):
+                if row >= count:
+                    break  # Written by an upload that did not finish; truncated by the next writer
+                self._records_end += len(line)
+                record = json.loads(line)
+                self._add_record(row, record)
+                if not keyword_loaded:
+                    self.keyword_index.add(row, record.get("content") or "")
+        for row in np.flatnonzero(self.deleted):
+            self._mark_deleted(int(row))
+
+        if manifest.get("hnsw") and os.path.exists(self._path("hnsw", "npz")):
+            self.graph = HnswGraph.load(self._path("hnsw", "npz"))
+
+    def _reload_if_changed(self):
+        try:
+            stamp = _file_stamp(self._manifest_path)
+        except FileNotFoundError:
+            return
+        if stamp != self._manifest_stamp:
+            self._reset()
+            self._load()
+
+
+def _file_stamp(path: str) -> Tuple[int, int]:
+    """
+    Changes whenever the manifest is replaced
+
+    mtime alone is not enough: file times are only as fine as the kernel
+    clock tick, so two saves in a row can share one. Every save writes a
+    new file and renames it over the old one, so the inode changes too.
+    """
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _filter_values(record: Dict[str, Any]) -> Dict[str, str]:
+    metadata = record.get("metadata") or "{}"
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata)
+    return {field: metadata[field] for field in FILTERABLE_FIELDS if metadata.get(field)}
+
+
+def build_search_document(doc: Document, chunk: DocumentChunk, embedding: List[float]) -> Dict[str, Any]:
+    """Search index document for a chunk (same schema as ingestion.process_document uploads)"""
+    metadata_dict = {
+        "application": doc.application,
+        "issue": doc.issue,
+        "ingredient": doc.ingredient,
+        "customer": doc.customer,
+        "trial_id": doc.trial_id,
+        "sheet_name": chunk.sheet_name
+    }
+    return {
+        "id": chunk.search_id or f"{doc.id}_{chunk.chunk_index}",
+        "document_id": str(doc.id),
+        "content": chunk.content,
+        "title": doc.original_filename,
+        "chunk_index": chunk.chunk_index,
+        "metadata": json.dumps(metadata_dict, ensure_ascii=False),
+        "created_at": chunk.created_at.isoformat() if chunk.created_at else None,
+        "content_vector": embedding
+    }
+
+
+class AsyncLocalSearchService:
+    """Awaitable facade so SearchService can use the local engine like AsyncAzureSearchService"""
+
+    def __init__(self, local: LocalVectorSearchService):
+        self.local = local
+
+    async def search(
+        self,
+        query: str,
+        embedding: List[float],
+        top_k: int = 10,
+        filters: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        # Waits on the index lock while a write is in progress, so never on the event loop
+        return await asyncio.to_thread(self.local.search, query, embedding, top_k, filters)
+
+    async def close(self):
+        pass
+
+
+@lru_cache()
+def get_local_search_service() -> LocalVectorSearchService:
+    return LocalVectorSearchService()
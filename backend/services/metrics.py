@@ -0,0 +1,344 @@
+import asyncio
+import bisect
+import functools
+import inspect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Default latency buckets in seconds (Azure calls and LLM completions run long)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Mirror a total that is counted elsewhere (set by scrape-time collectors)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}_total", self._labels(key), value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count of observations"""
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 3)
+            values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = [(key, list(values)) for key, values in self._values.items()]
+        for key, values in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, values[-2]
+            yield f"{self.name}_count", labels, values[-1]
+
+
+class Registry:
+    """
+    In-process metric registry rendered in the Prometheus text format
+
+    Metrics are updated where events happen. Collectors are callbacks run at
+    scrape time that copy values kept elsewhere (cache statistics, the
+    dashboard counter table) into registered metrics.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} already registered as {existing.type_name}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---- API ------------------------------------------------------------------
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests", "HTTP requests by route template and status code", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response starts", ("method", "route")
+)
+
+# ---- Azure dependencies ---------------------------------------------------
+
+DEPENDENCY_DURATION = REGISTRY.histogram(
+    "azure_dependency_duration_seconds", "Azure call latency", ("service", "operation")
+)
+DEPENDENCY_ERRORS = REGISTRY.counter(
+    "azure_dependency_errors", "Azure calls that raised", ("service", "operation")
+)
+OPENAI_QUOTA_WAIT = REGISTRY.histogram(
+    "openai_quota_wait_seconds",
+    "Time a call waited for client-side Azure OpenAI quota",
+    ("deployment", "priority"),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+OPENAI_QUOTA_AVAILABLE = REGISTRY.gauge(
+    "openai_quota_available", "Tokens and requests left in the client-side bucket", ("deployment", "bucket")
+)
+OPENAI_THROTTLED = REGISTRY.counter("openai_throttled", "Azure OpenAI 429 responses", ("deployment",))
+OPENAI_RETRIES = REGISTRY.counter(
+    "openai_retries", "Azure OpenAI calls retried by reason", ("deployment", "reason")
+)
+OPENAI_BACKOFF = REGISTRY.histogram(
+    "openai_backoff_seconds",
+    "Delay before retrying an Azure OpenAI call",
+    ("deployment",),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
+# ---- Search ---------------------------------------------------------------
+
+SEARCH_STAGE_DURATION = REGISTRY.histogram(
+    "search_stage_duration_seconds", "Search latency per stage", ("stage",)
+)
+SEARCHES = REGISTRY.counter("searches", "Searches served", ("cached",))
+HISTORY_QUEUE_DEPTH = REGISTRY.gauge("search_history_queue_depth", "Search history rows waiting to be written")
+HISTORY_ROWS = REGISTRY.counter("search_history_rows", "Search history rows by outcome", ("outcome",))
+
+# ---- Caches (mirrored from their stats() at scrape time) -------------------
+
+CACHE_REQUESTS = REGISTRY.counter("cache_requests", "Cache lookups by result", ("cache", "result"))
+CACHE_HIT_RATIO = REGISTRY.gauge("cache_hit_ratio", "Cache hit ratio since start", ("cache",))
+CACHE_ENTRIES = REGISTRY.gauge("cache_entries", "Entries held in memory", ("cache",))
+
+# ---- Ingestion ------------------------------------------------------------
+
+DOCUMENTS = REGISTRY.gauge("documents", "Documents by processing status", ("status",))
+INGESTION_QUEUE_DEPTH = REGISTRY.gauge("ingestion_queue_depth", "Documents waiting to be processed")
+INGESTION_JOBS = REGISTRY.gauge("ingestion_jobs", "Ingestion jobs in the durable queue by status", ("status",))
+INGESTION_ACTIVE = REGISTRY.gauge("ingestion_tasks_active", "Documents being processed in this process")
+INGESTION_DURATION = REGISTRY.histogram(
+    "ingestion_duration_seconds",
+    "Document processing time by outcome",
+    ("outcome",),
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+CHUNK_EMBEDDINGS = REGISTRY.counter(
+    "chunk_embeddings", "Chunk embeddings at ingestion by source (stored vector or new API call)", ("source",)
+)
+EXTRACTION_WORKERS = REGISTRY.gauge("extraction_workers", "Text extraction worker processes by state", ("state",))
+EXTRACTION_RESTARTS = REGISTRY.counter(
+    "extraction_worker_restarts", "Extraction worker processes replaced, by reason", ("reason",)
+)
+
+
+def observe_dependency(service: str, operation: str):
+    """
+    Decorator recording duration and errors of an Azure call
+
+    Works on plain and async functions; async generators (streaming
+    completions) are timed until the stream is exhausted.
+    """
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def stream_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    async for item in fn(*args, **kwargs):
+                        yield item
+                except Exception:
+                    DEPENDENCY_ERRORS.inc(service=service, operation=operation)
+                    raise
+                finally:
+                    DEPENDENCY_DURATION.observe(time.perf_counter() - start, service=service, operation=operation)
+            return stream_wrapper
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    DEPENDENCY_ERRORS.inc(service=service, operation=operation)
+                    raise
+                finally:
+                    DEPENDENCY_DURATION.observe(time.perf_counter() - start, service=service, operation=operation)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                DEPENDENCY_ERRORS.inc(service=service, operation=operation)
+                raise
+            finally:
+                DEPENDENCY_DURATION.observe(time.perf_counter() - start, service=service, operation=operation)
+        return wrapper
+
+    return decorator
+
+
+def observe_search(timings: Dict[str, Any], cached: bool):
+    """Record one search's StageTimer timings"""
+    SEARCHES.inc(cached=str(cached).lower())
+    for key, value in timings.items():
+        if key.endswith("_ms") and key not in ("results_ms", "first_token_ms"):
+            SEARCH_STAGE_DURATION.observe(value / 1000, stage=key[:-3])
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,276 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import openai
+
+from config import get_settings
+from .context_builder import get_token_counter
+from .metrics import (
+    OPENAI_BACKOFF, OPENAI_QUOTA_AVAILABLE, OPENAI_QUOTA_WAIT, OPENAI_RETRIES, OPENAI_THROTTLED, REGISTRY
+)
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+# Search requests a user is waiting for, and background work (document ingestion, reindexing)
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Azure enforces quotas over short windows, so a bucket holds 10 seconds' worth
+BURST_SECONDS = 10.0
+
+# Longest single sleep while waiting, so a waiter re-checks priority and penalties
+MAX_POLL_SECONDS = 1.0
+
+RETRIABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """Continuously refilled bucket; the level may go negative after an oversized take"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while leaving `reserve` in the bucket"""
+        needed = min(amount + reserve, self.capacity) - self.level
+        return needed / self.rate if needed > 0 else 0.0
+
+
+class RateLimiter:
+    """
+    Token and request buckets for one Azure OpenAI deployment
+
+    Shared by threads (ingestion) and the event loop (search). Interactive
+    calls may use the whole quota; background calls leave `reserve` of it
+    untouched and step aside while an interactive call is waiting. A 429
+    from Azure pauses every caller until its Retry-After has passed.
+    """
+
+    def __init__(self, deployment: str, tpm: int, rpm: int, reserve: float):
+        self.deployment = deployment
+        self.tokens = TokenBucket(tpm)
+        self.requests = TokenBucket(rpm or max(1, tpm * 6 // 1000))
+        self.reserve = reserve
+        self.blocked_until = 0.0
+        self._waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: int, priority: str) -> float:
+        """Take quota for one call; returns 0 on success, else seconds to wait before retrying"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+
+            background = priority != INTERACTIVE
+            if background and self._waiting[INTERACTIVE]:
+                return 0.05
+
+            self.tokens.refill(now)
+            self.requests.refill(now)
+            wait = max(
+                self.tokens.wait_time(tokens, self.reserve * self.tokens.capacity if background else 0.0),
+                self.requests.wait_time(1, self.reserve * self.requests.capacity if background else 0.0)
+            )
+            if wait > 0:
+                return wait
+
+            self.tokens.level -= tokens
+            self.requests.level -= 1
+            return 0.0
+
+    def acquire(self, tokens: int, priority: str) -> float:
+        """Block until quota is available; returns the seconds waited"""
+        started = time.monotonic()
+        self._enter(priority)
+        try:
+            while True:
+                wait = self.try_acquire(tokens, priority)
+                if not wait:
+                    break
+                time.sleep(min(wait, MAX_POLL_SECONDS))
+        finally:
+            self._leave(priority)
+        return self._observe_wait(started, priority)
+
+    async def acquire_async(self, tokens: int, priority: str) -> float:
+        """acquire() for the event loop"""
+        started = time.monotonic()
+        self._enter(priority)
+        try:
+            while True:
+                wait = self.try_acquire(tokens, priority)
+                if not wait:
+                    break
+                await asyncio.sleep(min(wait, MAX_POLL_SECONDS))
+        finally:
+            self._leave(priority)
+        return self._observe_wait(started, priority)
+
+    def penalize(self, seconds: float):
+        """Hold every caller back for `seconds` (after a 429)"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens.refill(now)
+            self.requests.refill(now)
+            return {
+                "deployment": self.deployment,
+                "tokens_available": round(self.tokens.level),
+                "tokens_capacity": round(self.tokens.capacity),
+                "requests_available": round(self.requests.level, 1),
+                "requests_capacity": round(self.requests.capacity, 1),
+                "blocked_seconds": round(max(0.0, self.blocked_until - now), 1),
+                "waiting": dict(self._waiting)
+            }
+
+    def _enter(self, priority: str):
+        with self._lock:
+            self._waiting[priority] = self._waiting.get(priority, 0) + 1
+
+    def _leave(self, priority: str):
+        with self._lock:
+            self._waiting[priority] -= 1
+
+    def _observe_wait(self, started: float, priority: str) -> float:
+        waited = time.monotonic() - started
+        OPENAI_QUOTA_WAIT.observe(waited, deployment=self.deployment, priority=priority)
+        return waited
+
+
+@lru_cache()
+def get_rate_limiter(deployment: str) -> Optional[RateLimiter]:
+    """Limiter for a deployment, or None when client-side limiting is off for it"""
+    if not settings.openai_rate_limit_enabled:
+        return None
+    if deployment == settings.azure_openai_embedding_deployment:
+        tpm, rpm = settings.azure_openai_embedding_tpm, settings.azure_openai_embedding_rpm
+    else:
+        tpm, rpm = settings.azure_openai_chat_tpm, settings.azure_openai_chat_rpm
+    if tpm <= 0:
+        return None
+    return RateLimiter(deployment, tpm, rpm, settings.openai_interactive_reserve)
+
+
+def estimate_embedding_tokens(texts: List[str]) -> int:
+    counter = get_token_counter(settings.embedding_token_encoding)
+    return sum(counter.count(text) for text in texts)
+
+
+def estimate_chat_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """Prompt tokens plus max_tokens, which is how Azure charges a completion against TPM"""
+    counter = get_token_counter()
+    return sum(counter.count(message["content"]) + 4 for message in messages) + max_tokens
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay requested by the server (retry-after-ms, or retry-after in seconds or as an HTTP date)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff_seconds(attempt: int, retry_after: Optional[float]) -> float:
+    """
+    Delay before retry number `attempt` (0-based)
+
+    Exponential backoff with jitter (half fixed, half random); a server
+    Retry-After is honored as the minimum, plus a little jitter so throttled
+    workers do not all return at the same instant.
+    """
+    delay = min(settings.openai_backoff_max_seconds, settings.openai_backoff_base_seconds * 2 ** attempt)
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, settings.openai_backoff_base_seconds))
+    return delay
+
+
+def _retry_delay(limiter: Optional[RateLimiter], deployment: str, attempt: int, error: Exception) -> float:
+    reason = "throttled" if isinstance(error, openai.RateLimitError) else type(error).__name__
+    retry_after = retry_after_seconds(error)
+    delay = backoff_seconds(attempt, retry_after)
+    if isinstance(error, openai.RateLimitError):
+        OPENAI_THROTTLED.inc(deployment=deployment)
+        if limiter is not None:
+            limiter.penalize(delay)
+    OPENAI_RETRIES.inc(deployment=deployment, reason=reason)
+    OPENAI_BACKOFF.observe(delay, deployment=deployment)
+    print(f"Azure OpenAI {deployment}: {reason}, retry {attempt + 1}/{settings.openai_max_retries} in {delay:.1f}s")
+    return delay
+
+
+def call_with_quota(deployment: str, tokens: int, priority: str, call: Callable[[], T]) -> T:
+    """Run a blocking Azure OpenAI call within the deployment's quota, retrying throttling and transient errors"""
+    limiter = get_rate_limiter(deployment)
+    for attempt in range(settings.openai_max_retries + 1):
+        if limiter is not None:
+            limiter.acquire(tokens, priority)
+        try:
+            return call()
+        except RETRIABLE_ERRORS as e:
+            if attempt >= settings.openai_max_retries:
+                raise
+            time.sleep(_retry_delay(limiter, deployment, attempt, e))
+
+
+async def acall_with_quota(deployment: str, tokens: int, priority: str, call: Callable[[], Awaitable[T]]) -> T:
+    """call_with_quota for awaitable calls"""
+    limiter = get_rate_limiter(deployment)
+    for attempt in range(settings.openai_max_retries + 1):
+        if limiter is not None:
+            await limiter.acquire_async(tokens, priority)
+        try:
+            return await call()
+        except RETRIABLE_ERRORS as e:
+            if attempt >= settings.openai_max_retries:
+                raise
+            await asyncio.sleep(_retry_delay(limiter, deployment, attempt, e))
+
+
+def _collect_quota_metrics():
+    for deployment in {settings.azure_openai_deployment_name, settings.azure_openai_embedding_deployment}:
+        limiter = get_rate_limiter(deployment)
+        if limiter is None:
+            continue
+        stats = limiter.stats()
+        OPENAI_QUOTA_AVAILABLE.set(stats["tokens_available"], deployment=deployment, bucket="tokens")
+        OPENAI_QUOTA_AVAILABLE.set(stats["requests_available"], deployment=deployment, bucket="requests")
+
+
+REGISTRY.add_collector(_collect_quota_metrics)
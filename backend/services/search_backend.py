@@ -0,0 +1,20 @@
+from config import get_settings
+from .azure_services import AzureSearchService, AsyncAzureSearchService
+
+settings = get_settings()
+
+
+def get_search_backend():
+    """Search index used for indexing and deletion, selected by settings.search_backend"""
+    if settings.search_backend == "local":
+        from .local_search import get_local_search_service
+        return get_local_search_service()
+    return AzureSearchService()
+
+
+def get_async_search_backend():
+    """Awaitable search index used on the request path, selected by settings.search_backend"""
+    if settings.search_backend == "local":
+        from .local_search import AsyncLocalSearchService, get_local_search_service
+        return AsyncLocalSearchService(get_local_search_service())
+    return AsyncAzureSearchService()
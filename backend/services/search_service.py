@@ -1,29 +1,70 @@
+import asyncio
 import time
-from typing import List, Dict, Any, Optional
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 from datetime import datetime
 from sqlalchemy.orm import Session
 
-from models import Document, DocumentChunk, SearchHistory
-from .azure_services import AzureOpenAIService, AzureSearchService
+from models import DocumentChunk, SearchHistory
+from .azure_services import AsyncAzureOpenAIService
+from .search_backend import get_async_search_backend
+from .cache import get_response_cache, get_document_metadata_cache, get_index_generation
+from .history_writer import get_search_history_writer
+from .context_builder import get_token_counter, stitch_chunks
+from .facets import get_facet_cache
+from .metrics import observe_search
 from config import get_settings
 
 settings = get_settings()
 
+NO_RESULTS_MESSAGE = "申し訳ございません。該当する過去データが見つかりませんでした。検索キーワードを変えてお試しください。"
+
+
+class StageTimer:
+    """
+    Per-stage latency of one search, measured with a monotonic clock
+
+    stage() records a duration as "<name>_ms"; mark() records the time since
+    the search started (e.g. first_token_ms for streaming).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[f"{name}_ms"] = round((time.perf_counter() - stage_start) * 1000, 1)
+
+    def mark(self, name: str):
+        self.timings[f"{name}_ms"] = self.elapsed_ms()
+
+    def elapsed_ms(self) -> int:
+        return int((time.perf_counter() - self.started) * 1000)
+
 
 class SearchService:
     """Service for performing RAG-based search"""
 
     def __init__(self):
-        self.openai_service = AzureOpenAIService()
-        self.search_service = AzureSearchService()
+        self.openai_service = AsyncAzureOpenAIService()
+        self.search_service = get_async_search_backend()
+        self.response_cache = get_response_cache()
+        self.metadata_cache = get_document_metadata_cache()
+        self.history_writer = get_search_history_writer()
 
-    def search(
+    async def search(
         self,
         query: str,
         db: Session,
         user_id: Optional[int] = None,
         top_k: int = None,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        debug: bool = False
     ) -> Dict[str, Any]:
         """
         Perform RAG search and generate response
@@ -34,64 +75,251 @@ class SearchService:
             user_id: Optional user ID for history tracking
             top_k: Number of results to return
             filters: Optional filters (application, issue, ingredient)
+            debug: Include the per-stage latency breakdown in the result
 
         Returns:
             Search results with AI-generated response
+
+        Azure calls are awaited and the (short) database calls run in a worker
+        thread, so a slow completion never blocks other requests.
         """
-        start_time = time.time()
+        timer = StageTimer()
 
         if top_k is None:
             top_k = settings.search_top_k
 
-        # Generate embedding for query
-        query_embedding = self.openai_service.get_embedding(query)
-
-        # Build filter string
-        filter_str = self._build_filter_string(filters) if filters else None
+        # Serve repeated questions from the response cache (skips Azure entirely)
+        with timer.stage("cache_lookup"):
+            generation = await self._run_db(db, get_index_generation, db)
+            cache_key, cached = self._lookup_cached_response(query, filters, top_k, generation)
+        if cached is not None:
+            response_time_ms = self._finish(timer, user_id, query, cached, cached=True)
+            return {
+                "query": query,
+                "response": cached["response"],
+                "results": cached["results"],
+                "total_results": cached["total_results"],
+                "response_time_ms": response_time_ms,
+                "cached": True,
+                "debug": {"timings": timer.timings} if debug else None
+            }
 
-        # Perform hybrid search
-        search_results = self.search_service.search(
-            query=query,
-            embedding=query_embedding,
-            top_k=top_k,
-            filters=filter_str
-        )
+        search_results, documents = await self._retrieve(timer, query, db, top_k, filters, generation)
 
         # Build context from search results
-        context = self._build_context(search_results, db)
+        with timer.stage("context"):
+            context, context_tokens = self._build_context(search_results, documents)
 
         # Generate AI response
         ai_response = ""
-        if context:
-            ai_response = self.openai_service.generate_response(query, context)
-        else:
-            ai_response = "申し訳ございません。該当する過去データが見つかりませんでした。検索キーワードを変えてお試しください。"
+        with timer.stage("llm"):
+            if context:
+                ai_response = await self.openai_service.generate_response(query, context)
+            else:
+                ai_response = NO_RESULTS_MESSAGE
+
+        with timer.stage("format"):
+            payload = {
+                "response": ai_response,
+                "results": self._format_results(search_results, documents),
+                "total_results": len(search_results),
+                "top_score": search_results[0]["score"] if search_results else 0
+            }
+        response_time_ms = self._finish(timer, user_id, query, payload, cache_key=cache_key)
 
-        # Calculate response time
-        response_time_ms = int((time.time() - start_time) * 1000)
+        return {
+            "query": query,
+            "response": payload["response"],
+            "results": payload["results"],
+            "total_results": payload["total_results"],
+            "response_time_ms": response_time_ms,
+            "cached": False,
+            "context_tokens": context_tokens,
+            "debug": {"timings": timer.timings} if debug else None
+        }
 
-        # Record search history
-        if user_id:
-            self._record_search_history(
-                db=db,
-                user_id=user_id,
-                query=query,
-                results_count=len(search_results),
-                top_score=search_results[0]["score"] if search_results else 0,
-                response_time_ms=response_time_ms
-            )
+    async def search_stream(
+        self,
+        query: str,
+        db: Session,
+        user_id: Optional[int] = None,
+        top_k: int = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming variant of search
 
-        # Format results for response
-        formatted_results = self._format_results(search_results, db)
+        Yields (event, data) pairs: "results" as soon as retrieval is done,
+        one "token" per piece of the answer as the completion produces it,
+        then "done" with the per-stage timings.
+        """
+        timer = StageTimer()
 
-        return {
+        if top_k is None:
+            top_k = settings.search_top_k
+
+        with timer.stage("cache_lookup"):
+            generation = await self._run_db(db, get_index_generation, db)
+            cache_key, cached = self._lookup_cached_response(query, filters, top_k, generation)
+        if cached is not None:
+            yield "results", {
+                "query": query,
+                "results": cached["results"],
+                "total_results": cached["total_results"],
+                "cached": True
+            }
+            yield "token", {"content": cached["response"]}
+            response_time_ms = self._finish(timer, user_id, query, cached, cached=True)
+            yield "done", {"response_time_ms": response_time_ms, "cached": True, "timings": timer.timings}
+            return
+
+        search_results, documents = await self._retrieve(timer, query, db, top_k, filters, generation)
+        with timer.stage("format"):
+            formatted_results = self._format_results(search_results, documents)
+
+        timer.mark("results")
+        yield "results", {
             "query": query,
-            "response": ai_response,
             "results": formatted_results,
             "total_results": len(search_results),
-            "response_time_ms": response_time_ms
+            "cached": False
         }
 
+        with timer.stage("context"):
+            context, context_tokens = self._build_context(search_results, documents)
+        timer.timings["context_tokens"] = context_tokens
+
+        answer_parts = []
+        if context:
+            with timer.stage("llm"):
+                async for token in self.openai_service.stream_response(query, context):
+                    if not answer_parts:
+                        timer.mark("first_token")
+                    answer_parts.append(token)
+                    yield "token", {"content": token}
+        else:
+            answer_parts.append(NO_RESULTS_MESSAGE)
+            yield "token", {"content": NO_RESULTS_MESSAGE}
+
+        payload = {
+            "response": "".join(answer_parts),
+            "results": formatted_results,
+            "total_results": len(search_results),
+            "top_score": search_results[0]["score"] if search_results else 0
+        }
+        response_time_ms = self._finish(timer, user_id, query, payload, cache_key=cache_key)
+
+        yield "done", {"response_time_ms": response_time_ms, "cached": False, "timings": timer.timings}
+
+    def _lookup_cached_response(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        top_k: int,
+        generation: int
+    ) -> Tuple[Optional[tuple], Optional[Dict[str, Any]]]:
+        """Return (cache key, cached payload or None); the key is None when caching is disabled"""
+        if not settings.response_cache_enabled:
+            return None, None
+
+        cache_key = self.response_cache.make_key(query, filters, top_k, generation)
+        return cache_key, self.response_cache.get(cache_key)
+
+    async def _retrieve(
+        self,
+        timer: "StageTimer",
+        query: str,
+        db: Session,
+        top_k: int,
+        filters: Optional[Dict[str, Any]],
+        generation: int
+    ) -> Tuple[List[Dict[str, Any]], Dict[int, Dict[str, Any]]]:
+        """Embed the query, run hybrid search and load document metadata for the hits"""
+        # Generate embedding for query
+        with timer.stage("embedding"):
+            query_embedding = await self.openai_service.get_query_embedding(query)
+
+        # Build filter string
+        filter_str = self._build_filter_string(filters) if filters else None
+
+        # Perform hybrid search
+        with timer.stage("search"):
+            search_results = await self.search_service.search(
+                query=query,
+                embedding=query_embedding,
+                top_k=top_k,
+                filters=filter_str
+            )
+
+        # Load document metadata once for all hits (MySQL is the source of truth)
+        with timer.stage("documents"):
+            documents = await self._run_db(
+                db,
+                self.metadata_cache.get_many,
+                db,
+                [int(r["document_id"]) for r in search_results],
+                generation
+            )
+
+        return search_results, documents
+
+    def _finish(
+        self,
+        timer: "StageTimer",
+        user_id: Optional[int],
+        query: str,
+        payload: Dict[str, Any],
+        cache_key: Optional[tuple] = None,
+        cached: bool = False
+    ) -> int:
+        """
+        Queue search history and store a fresh payload in the response cache
+
+        Returns the response time in ms. The history row carries the stage
+        timings measured so far; history_ms and total_ms are added after.
+        """
+        response_time_ms = timer.elapsed_ms()
+        with timer.stage("history"):
+            if user_id:
+                self._record_search_history(
+                    user_id=user_id,
+                    query=query,
+                    results_count=payload["total_results"],
+                    top_score=payload["top_score"],
+                    response_time_ms=response_time_ms,
+                    cached=cached,
+                    stage_timings=dict(timer.timings)
+                )
+
+            if cache_key is not None:
+                self.response_cache.set(cache_key, payload)
+
+        timer.timings["total_ms"] = timer.elapsed_ms()
+        observe_search(timer.timings, cached)
+        return response_time_ms
+
+    async def _run_db(self, db: Session, fn, /, *args, **kwargs):
+        """
+        Run a short database call in a worker thread
+
+        The transaction is ended afterwards so the pooled connection is not
+        held while the request awaits Azure; otherwise a few hundred in-flight
+        searches would exhaust the SQLAlchemy pool.
+        """
+        def call():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                db.rollback()  # Reads only: just releases the connection
+
+        return await asyncio.to_thread(call)
+
+    async def close(self):
+        """Flush queued search history and release pooled HTTP connections"""
+        await asyncio.to_thread(self.history_writer.close)
+        await self.openai_service.close()
+        await self.search_service.close()
+
     def _build_filter_string(self, filters: Dict[str, Any]) -> str:
         """Build OData filter string for Azure AI Search"""
         conditions = []
@@ -110,63 +338,126 @@ class SearchService:
 
         return " and ".join(conditions) if conditions else None
 
-    def _build_context(self, search_results: List[Dict[str, Any]], db: Session) -> str:
-        """Build context string from search results for RAG"""
-        context_parts = []
+    def _build_context(
+        self,
+        search_results: List[Dict[str, Any]],
+        documents: Dict[int, Dict[str, Any]]
+    ) -> Tuple[str, int]:
+        """
+        Build context string from search results for RAG
 
-        for i, result in enumerate(search_results[:5], 1):  # Top 5 for context
-            # Get document info from MySQL (source of truth for metadata)
-            doc = db.query(Document).filter(Document.id == int(result["document_id"])).first()
+        Results are taken in score order until settings.context_token_budget
+        is used up. Chunks of the same document are grouped into one case and
+        adjacent chunks are stitched without their chunk_overlap text. The
+        last case that does not fit is truncated rather than dropped.
+
+        Returns:
+            (context, tokens used)
+        """
+        counter = get_token_counter()
+        budget = settings.context_token_budget
 
-            context = f"""
---- 案件 {i} ---
-ファイル名: {result['filename']}
-アプリケーション: {doc.application if doc and doc.application else '不明'}
-課題: {doc.issue if doc and doc.issue else '不明'}
-使用原料: {doc.ingredient if doc and doc.ingredient else '不明'}
-関連度スコア: {result['score']:.2f}
+        groups: Dict[int, List[Dict[str, Any]]] = {}  # document_id -> chunks, in score order of first hit
+        group_tokens: Dict[int, int] = {}
+        truncated: Dict[int, str] = {}
+        seen_ids = set()
+        used = 0
+
+        for result in search_results:
+            if result["id"] in seen_ids:
+                continue
+            document_id = int(result["document_id"])
+            if document_id in truncated:
+                continue
+
+            chunks = groups.get(document_id, []) + [result]
+            number = list(groups).index(document_id) + 1 if document_id in groups else len(groups) + 1
+            block = self._render_context_block(number, chunks, documents)
+            tokens = counter.count(block)
+            remaining = budget - used + group_tokens.get(document_id, 0)
+
+            if tokens <= remaining:
+                groups[document_id] = chunks
+                group_tokens[document_id] = tokens
+            elif document_id not in groups and remaining >= settings.context_min_block_tokens:
+                # Fit what we can of the next case; nothing after it will fit
+                header_tokens = counter.count(self._render_context_block(len(groups) + 1, [], documents, result))
+                content = counter.truncate(result["content"], remaining - header_tokens)
+                groups[document_id] = [dict(result, content=content)]
+                truncated[document_id] = content
+                group_tokens[document_id] = counter.count(
+                    self._render_context_block(len(groups), groups[document_id], documents)
+                )
+            else:
+                continue
+
+            seen_ids.add(result["id"])
+            used = sum(group_tokens.values())
+
+        context_parts = [
+            self._render_context_block(i, chunks, documents)
+            for i, chunks in enumerate(groups.values(), 1)
+        ]
+        context = "\n".join(context_parts)
+        return context, counter.count(context)
+
+    def _render_context_block(
+        self,
+        number: int,
+        chunks: List[Dict[str, Any]],
+        documents: Dict[int, Dict[str, Any]],
+        first: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """One case of the RAG context: document metadata plus stitched chunk text"""
+        first = first or chunks[0]
+        doc = documents.get(int(first["document_id"])) or {}
+        content = stitch_chunks(chunks) if chunks else ""
+
+        return f"""
+--- 案件 {number} ---
+ファイル名: {first['filename']}
+アプリケーション: {doc.get('application') or '不明'}
+課題: {doc.get('issue') or '不明'}
+使用原料: {doc.get('ingredient') or '不明'}
+関連度スコア: {first['score']:.2f}
 
 内容:
-{result['content'][:1000]}
+{content}
 """
-            context_parts.append(context)
-
-        return "\n".join(context_parts)
 
     def _format_results(
         self,
         search_results: List[Dict[str, Any]],
-        db: Session
+        documents: Dict[int, Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
         """Format search results for API response"""
         formatted = []
 
         for result in search_results:
-            # Get full document info from MySQL (source of truth for metadata)
-            doc = db.query(Document).filter(Document.id == int(result["document_id"])).first()
+            doc = documents.get(int(result["document_id"]))
 
             # Skip documents that are not successfully processed
-            if not doc or doc.status != "completed":
+            if not doc or doc["status"] != "completed":
                 continue
 
             # Skip documents without blob_url (upload failed)
-            if not doc.blob_url:
+            if not doc["blob_url"]:
                 continue
 
             formatted_result = {
                 "id": result["id"],
-                "document_id": result["document_id"],
+                "document_id": int(result["document_id"]),
                 "filename": result["filename"],
-                "application": doc.application,  # Get from MySQL
-                "issue": doc.issue,              # Get from MySQL
-                "ingredient": doc.ingredient,    # Get from MySQL
-                "customer": doc.customer,        # Get from MySQL
-                "trial_id": doc.trial_id,        # Get from MySQL
+                "application": doc["application"],  # Get from MySQL
+                "issue": doc["issue"],              # Get from MySQL
+                "ingredient": doc["ingredient"],    # Get from MySQL
+                "customer": doc["customer"],        # Get from MySQL
+                "trial_id": doc["trial_id"],        # Get from MySQL
                 "sheet_name": result.get("sheet_name"),
                 "content_preview": result["content"][:300] + "..." if len(result["content"]) > 300 else result["content"],
                 "score": round(result["score"], 3),
                 "reranker_score": round(result.get("reranker_score", 0), 3) if result.get("reranker_score") else None,
-                "blob_url": doc.blob_url
+                "blob_url": doc["blob_url"]
             }
 
             formatted.append(formatted_result)
@@ -175,23 +466,24 @@ class SearchService:
 
     def _record_search_history(
         self,
-        db: Session,
         user_id: int,
         query: str,
         results_count: int,
         top_score: float,
-        response_time_ms: int
+        response_time_ms: int,
+        cached: bool = False,
+        stage_timings: Optional[Dict[str, float]] = None
     ):
-        """Record search in history"""
-        history = SearchHistory(
+        """Record search in history (queued; written in bulk off the request path)"""
+        self.history_writer.submit(
             user_id=user_id,
             query=query,
             results_count=results_count,
-            top_result_score=top_score,
-            response_time_ms=response_time_ms
+            top_score=top_score,
+            response_time_ms=response_time_ms,
+            cached=cached,
+            stage_timings=stage_timings
         )
-        db.add(history)
-        db.commit()
 
     def get_search_history(
         self,
@@ -212,25 +504,19 @@ class SearchService:
             "results_count": h.results_count,
             "top_result_score": h.top_result_score,
             "response_time_ms": h.response_time_ms,
+            "cached": bool(h.cached),
+            "stage_timings": h.stage_timings,
             "created_at": h.created_at.isoformat()
         } for h in histories]
 
-    def get_facets(self, db: Session) -> Dict[str, List[str]]:
-        """Get available filter options (facets)"""
-        applications = db.query(Document.application).filter(
-            Document.application.isnot(None)
-        ).distinct().all()
-
-        issues = db.query(Document.issue).filter(
-            Document.issue.isnot(None)
-        ).distinct().all()
-
-        ingredients = db.query(Document.ingredient).filter(
-            Document.ingredient.isnot(None)
-        ).distinct().all()
+    def get_facets(self, db: Session) -> Tuple[Dict[str, Any], str]:
+        """
+        Get available filter options (facets) with document counts
 
-        return {
-            "applications": [a[0] for a in applications if a[0]],
-            "issues": [i[0] for i in issues if i[0]],
-            "ingredients": [i[0] for i in ingredients if i[0]]
-        }
+        Served from the in-memory facet snapshot; returns (facets, ETag).
+        Values are ordered by document count, most common first.
+        """
+        snapshot, etag = get_facet_cache().get(db)
+        facets = {facet_type: list(counts) for facet_type, counts in snapshot.items()}
+        facets["counts"] = snapshot
+        return facets, etag
@@ -0,0 +1,140 @@
+from functools import lru_cache
+from typing import Any, Dict
+
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from database import SessionLocal
+from models import Document, SearchHistory, StatCounter, User
+from .cache import LRUCache
+from .metrics import DOCUMENTS, INGESTION_QUEUE_DEPTH, REGISTRY
+
+settings = get_settings()
+
+DOCUMENT_STATUS_PREFIX = "documents.status."
+SEARCH_COUNT = "searches.count"
+SEARCH_RESPONSE_TIME_SUM = "searches.response_time_ms_sum"
+
+
+def document_status_counter(status: str) -> str:
+    return f"{DOCUMENT_STATUS_PREFIX}{status or 'pending'}"
+
+
+def increment_counters(db: Session, deltas: Dict[str, int]):
+    """Add deltas to named counters inside the caller's transaction (caller commits)"""
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        updated = db.query(StatCounter).filter(StatCounter.name == name).update(
+            {StatCounter.value: StatCounter.value + delta},
+            synchronize_session=False
+        )
+        if updated:
+            continue
+        try:
+            with db.begin_nested():
+                db.add(StatCounter(name=name, value=delta))
+        except IntegrityError:
+            # Another worker created the counter first
+            db.query(StatCounter).filter(StatCounter.name == name).update(
+                {StatCounter.value: StatCounter.value + delta},
+                synchronize_session=False
+            )
+    _clear_stats_after_commit(db)
+
+
+def _clear_stats_after_commit(db: Session):
+    """Drop the cached totals once db commits, so a read in between cannot cache the old values again"""
+    db.info["clear_stats_after_commit"] = True
+    if not event.contains(db, "after_commit", _on_commit):
+        event.listen(db, "after_commit", _on_commit)
+
+
+def _on_commit(db: Session):
+    if db.info.pop("clear_stats_after_commit", False):
+        get_system_stats_cache().clear()
+
+
+def rebuild_counters(db: Session):
+    """Recompute every counter from the source tables (one GROUP BY plus one aggregate)"""
+    counters: Dict[str, int] = {}
+    for status, count in db.query(Document.status, func.count(Document.id)).group_by(Document.status):
+        name = document_status_counter(status)
+        counters[name] = counters.get(name, 0) + count
+
+    search_count, response_time_sum = db.query(
+        func.count(SearchHistory.id),
+        func.coalesce(func.sum(SearchHistory.response_time_ms), 0)
+    ).one()
+    counters[SEARCH_COUNT] = search_count
+    counters[SEARCH_RESPONSE_TIME_SUM] = int(response_time_sum)
+
+    db.query(StatCounter).filter(
+        StatCounter.name.like(f"{DOCUMENT_STATUS_PREFIX}%") | StatCounter.name.in_(list(counters))
+    ).delete(synchronize_session=False)
+    for name, value in counters.items():
+        db.add(StatCounter(name=name, value=value))
+    db.commit()
+    get_system_stats_cache().clear()
+
+
+def ensure_counters(db: Session):
+    """Backfill counters once for a database created before they existed"""
+    if db.get(StatCounter, SEARCH_COUNT) is None:
+        print("Building dashboard counters...")
+        rebuild_counters(db)
+
+
+def get_system_stats(db: Session) -> Dict[str, Any]:
+    """Dashboard totals from the counter table (cost independent of table sizes)"""
+    cache = get_system_stats_cache()
+    stats = cache.get("system")
+    if stats is not None:
+        return stats
+
+    counters = {name: value for name, value in db.query(StatCounter.name, StatCounter.value)}
+    status_counts = {
+        name[len(DOCUMENT_STATUS_PREFIX):]: value
+        for name, value in counters.items()
+        if name.startswith(DOCUMENT_STATUS_PREFIX)
+    }
+    total_searches = counters.get(SEARCH_COUNT, 0)
+
+    stats = {
+        "total_documents": sum(status_counts.values()),
+        "indexed_documents": status_counts.get("completed", 0),
+        "pending_documents": status_counts.get("pending", 0),
+        "error_documents": status_counts.get("error", 0),
+        "total_users": db.query(func.count(User.id)).scalar(),
+        "total_searches": total_searches,
+        "avg_response_time_ms": counters.get(SEARCH_RESPONSE_TIME_SUM, 0) / total_searches if total_searches else 0.0
+    }
+    cache.set("system", stats)
+    return stats
+
+
+def _collect_document_metrics():
+    db = SessionLocal()
+    try:
+        rows = db.query(StatCounter.name, StatCounter.value).filter(
+            StatCounter.name.like(f"{DOCUMENT_STATUS_PREFIX}%")
+        ).all()
+    finally:
+        db.close()
+
+    for name, value in rows:
+        DOCUMENTS.set(value, status=name[len(DOCUMENT_STATUS_PREFIX):])
+    INGESTION_QUEUE_DEPTH.set(sum(
+        value for name, value in rows
+        if name in (document_status_counter("pending"), document_status_counter("processing"))
+    ))
+
+
+REGISTRY.add_collector(_collect_document_metrics)
+
+
+@lru_cache()
+def get_system_stats_cache() -> LRUCache:
+    return LRUCache(max_size=1, ttl_seconds=settings.system_stats_cache_seconds)
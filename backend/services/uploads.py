@@ -0,0 +1,169 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+import zipfile
+import zlib
+from typing import BinaryIO, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from config import get_settings
+from .dedup import HASH_BLOCK_BYTES
+
+settings = get_settings()
+
+# Multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+ALLOWED_EXTENSIONS = {".xlsx", ".xls", ".docx", ".doc", ".pptx", ".ppt", ".pdf", ".png", ".jpg", ".jpeg"}
+
+# Bit 11 of the general purpose flags: the member name is UTF-8
+ZIP_UTF8_FLAG = 0x800
+
+
+def too_large_message(max_bytes: int) -> str:
+    return f"ファイルサイズが上限（{round(max_bytes / (1024 * 1024), 1):g}MB）を超えています"
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject upload requests larger than `max_bytes` while they stream in
+
+    Starlette spools multipart files to temporary files as they arrive, so
+    without a limit a client could fill the disk before the endpoint runs.
+    A declared Content-Length over the limit is refused before reading;
+    otherwise the body is counted chunk by chunk and parsing is aborted
+    with 413 as soon as it passes the limit.
+    """
+
+    def __init__(self, app, max_bytes: int, paths: Iterable[str]):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or self.max_bytes <= 0
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.max_bytes + MULTIPART_OVERHEAD_BYTES
+        headers = dict(scope["headers"])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            response = JSONResponse({"detail": too_large_message(self.max_bytes)}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=too_large_message(self.max_bytes))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def stage_upload(file_obj: BinaryIO, ext: str) -> str:
+    """
+    Copy an upload to settings.upload_staging_dir for the ingestion worker; returns the path
+
+    Used only without blob storage. The file is copied in blocks, never
+    held in memory, and removed once its job finishes.
+    """
+    os.makedirs(settings.upload_staging_dir, exist_ok=True)
+    path = os.path.abspath(os.path.join(settings.upload_staging_dir, f"{uuid.uuid4()}{ext}"))
+    file_obj.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(file_obj, f, HASH_BLOCK_BYTES)
+    return path
+
+
+def remove_staged_upload(path: Optional[str]):
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Staged upload removal failed: {e}")
+
+
+def upload_size(file: UploadFile) -> int:
+    """Size of an uploaded file without reading it into memory"""
+    if file.size is not None:
+        return file.size
+    position = file.file.tell()
+    file.file.seek(0, 2)
+    size = file.file.tell()
+    file.file.seek(position)
+    return size
+
+
+class ArchiveMemberError(Exception):
+    """An archive member could not be read; the message is reported for that file"""
+
+
+def member_filename(info: zipfile.ZipInfo) -> Optional[str]:
+    """
+    File name of an archive member without its folders
+
+    None for folders and files that are not documents (macOS metadata,
+    hidden files, Office lock files).
+    """
+    if info.is_dir() or info.filename.startswith("__MACOSX/"):
+        return None
+    name = info.filename
+    if not info.flag_bits & ZIP_UTF8_FLAG:
+        # Windows Explorer stores Japanese names in CP932 without the UTF-8 flag
+        try:
+            name = name.encode("cp437").decode("cp932")
+        except UnicodeError:
+            pass
+    name = name.replace("\\", "/").rsplit("/", 1)[-1]
+    if not name or name.startswith((".", "~$")):
+        return None
+    return name
+
+
+def copy_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int) -> Tuple[BinaryIO, int, str]:
+    """
+    Decompress one archive member to a temporary file
+
+    Returns the file (positioned at its start; the caller closes it), its
+    size and its SHA-256. The size in the archive header is not trusted:
+    decompression stops as soon as the member passes `max_bytes`.
+    """
+    temp = tempfile.TemporaryFile()
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with archive.open(info) as member:
+            for block in iter(lambda: member.read(HASH_BLOCK_BYTES), b""):
+                size += len(block)
+                if size > max_bytes > 0:
+                    raise ArchiveMemberError(too_large_message(max_bytes))
+                digest.update(block)
+                temp.write(block)
+        temp.seek(0)
+        return temp, size, digest.hexdigest()
+    except (RuntimeError, NotImplementedError, zipfile.BadZipFile, zlib.error) as e:
+        # Encrypted members, unsupported compression or corrupt data
+        temp.close()
+        raise ArchiveMemberError(f"アーカイブから展開できません: {e}")
+    except BaseException:
+        temp.close()
+        raise
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time: point the app at a throwaway SQLite database first
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+os.environ["MYSQL_HOST"] = ""
+os.environ["SECRET_KEY"] = "test-secret-key"
+# The API module builds its Azure clients at import; they are never called in tests
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test-key")
+os.environ.setdefault("AZURE_SEARCH_API_KEY", "test-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from database import SessionLocal, engine, init_db
+from models import Base
+
+
+@pytest.fixture
+def db():
+    init_db()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
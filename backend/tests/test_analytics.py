@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from models import SearchHistory, SearchRollupHourly, StatCounter, get_jst_now
+from services.analytics import ROLLUP_WATERMARK, run_search_rollup
+
+
+def _history(id, created_at):
+    return SearchHistory(
+        id=id,
+        query="離水防止",
+        results_count=3,
+        response_time_ms=120,
+        created_at=created_at.replace(tzinfo=None)
+    )
+
+
+def _watermark(db):
+    row = db.get(StatCounter, ROLLUP_WATERMARK)
+    return row.value if row else 0
+
+
+def test_rollup_stops_at_unsettled_row_with_lower_id(db):
+    now = get_jst_now()
+    # Another worker's writer flushed id 1 late: it is younger than the settled id 2
+    db.add_all([_history(1, now), _history(2, now - timedelta(minutes=10))])
+    db.commit()
+
+    assert run_search_rollup(db) == 0
+    assert _watermark(db) == 0
+
+    db.get(SearchHistory, 1).created_at = (now - timedelta(minutes=5)).replace(tzinfo=None)
+    db.commit()
+
+    assert run_search_rollup(db) == 2
+    assert _watermark(db) == 2
+    assert sum(r.search_count for r in db.query(SearchRollupHourly)) == 2
+
+
+def test_rollup_continues_across_batches(db):
+    old = get_jst_now() - timedelta(minutes=10)
+    db.add_all([_history(i, old) for i in range(1, 6)] + [_history(6, get_jst_now())])
+    db.commit()
+
+    assert run_search_rollup(db, batch_size=2) == 5
+    assert _watermark(db) == 5
@@ -0,0 +1,111 @@
+import asyncio
+import io
+import os
+import zipfile
+
+import httpx
+import pytest
+
+import main
+from auth import get_admin_user
+from models import Document, IngestionJob
+from services.uploads import ArchiveMemberError, copy_member, member_filename, too_large_message
+
+
+class _Admin:
+    id = 1
+
+
+@pytest.fixture
+def client(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(main.settings, "upload_staging_dir", str(tmp_path / "staging"))
+    monkeypatch.setattr(main.settings, "azure_storage_connection_string", "")
+    main.app.dependency_overrides[get_admin_user] = lambda: _Admin()
+    yield
+    main.app.dependency_overrides.pop(get_admin_user, None)
+
+
+def _bulk_upload(files):
+    async def post():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/documents/bulk-upload", files=[("files", f) for f in files])
+
+    response = asyncio.run(post())
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_member_filename_drops_folders_and_traversal():
+    assert member_filename(zipfile.ZipInfo("../../etc/evil.pdf")) == "evil.pdf"
+    assert member_filename(zipfile.ZipInfo("..\\..\\evil.pdf")) == "evil.pdf"
+    assert member_filename(zipfile.ZipInfo("/abs/a.pdf")) == "a.pdf"
+    assert member_filename(zipfile.ZipInfo("__MACOSX/._a.pdf")) is None
+    assert member_filename(zipfile.ZipInfo("docs/~$a.docx")) is None
+    assert member_filename(zipfile.ZipInfo("docs/")) is None
+
+
+def test_copy_member_stops_at_the_size_limit():
+    # 64 MB of zeros compresses to a few kB: the header size is not what stops it
+    data = _zip({"bomb.pdf": b"\0" * (64 * 1024 * 1024)})
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        with pytest.raises(ArchiveMemberError, match="上限"):
+            copy_member(archive, archive.getinfo("bomb.pdf"), 1024 * 1024)
+
+        member, size, _ = copy_member(archive, archive.getinfo("bomb.pdf"), 0)
+        with member:
+            assert size == 64 * 1024 * 1024
+
+
+def test_bulk_upload_rejects_corrupt_archive_and_oversized_member(client, monkeypatch):
+    monkeypatch.setattr(main.settings, "upload_max_bytes", 1024 * 1024)
+    archive = _zip({"ok.pdf": b"%PDF ok", "big.pdf": b"\0" * (2 * 1024 * 1024)})
+
+    result = _bulk_upload([("bad.zip", b"not a zip archive"), ("docs.zip", archive)])
+
+    assert result["accepted"] == 1
+    assert result["rejected"] == [
+        {"filename": "bad.zip", "reason": "ZIP ファイルを読み込めません"},
+        {"filename": "big.pdf", "reason": too_large_message(1024 * 1024)}
+    ]
+
+
+def test_bulk_upload_stages_traversal_names_inside_the_staging_dir(client, db, tmp_path):
+    result = _bulk_upload([("docs.zip", _zip({"../../evil.pdf": b"%PDF evil"}))])
+
+    assert result["accepted"] == 1
+    doc = db.query(Document).one()
+    assert doc.original_filename == "evil.pdf"
+    job = db.query(IngestionJob).one()
+    assert os.path.dirname(job.staged_path) == str(tmp_path / "staging")
+    assert not (tmp_path.parent / "evil.pdf").exists()
+
+
+def test_bulk_upload_bounds_concurrent_blob_uploads(client, monkeypatch):
+    monkeypatch.setattr(main.settings, "azure_storage_connection_string", "configured")
+    monkeypatch.setattr(main.settings, "bulk_upload_concurrency", 2)
+    active, peak = 0, 0
+
+    async def upload_file(file_obj, blob_name, file_size):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return f"https://blob.example/{blob_name}"
+
+    monkeypatch.setattr(main.blob_uploader, "upload_file", upload_file)
+    archive = _zip({f"doc{i}.pdf": f"%PDF {i}".encode() for i in range(6)})
+
+    result = _bulk_upload([("docs.zip", archive), ("single.pdf", b"%PDF single")])
+
+    assert result["accepted"] == 7
+    assert peak == 2
@@ -0,0 +1,80 @@
+from models import DocumentChunk
+from services.chunk_diff import chunk_hash, new_search_ids, plan_chunk_changes
+
+
+def _chunk(index, content, search_id):
+    return DocumentChunk(chunk_index=index, content=content, search_id=search_id)
+
+
+def test_plan_keeps_moves_adds_and_removes():
+    existing = [_chunk(0, "a", "5_a"), _chunk(1, "b", "5_b"), _chunk(2, "c", "5_c")]
+
+    plan = plan_chunk_changes(existing, ["x", "a", "c"])
+
+    assert [(chunk.search_id, i) for chunk, i in plan.kept] == [("5_a", 1), ("5_c", 2)]
+    assert plan.added == [0]
+    assert [chunk.search_id for chunk in plan.removed] == ["5_b"]
+    assert plan.stale_search_ids() == ["5_b"]
+
+
+def test_plan_matches_repeated_texts_in_order():
+    existing = [_chunk(0, "a", "5_a"), _chunk(1, "a", "5_a_1")]
+
+    plan = plan_chunk_changes(existing, ["b", "a", "a", "a"])
+
+    assert [(chunk.search_id, i) for chunk, i in plan.kept] == [("5_a", 1), ("5_a_1", 2)]
+    assert plan.added == [0, 3]
+    assert plan.removed == []
+
+
+def test_plan_replaces_chunks_never_indexed():
+    existing = [_chunk(0, "a", None)]
+
+    plan = plan_chunk_changes(existing, ["a"])
+
+    assert plan.kept == []
+    assert plan.added == [0]
+    assert plan.removed == existing
+    assert plan.stale_search_ids() == []
+
+
+def test_legacy_duplicate_rows_keep_their_shared_search_id():
+    # Reprocessing before chunk diffs appended a second set of rows with the same ids
+    existing = [_chunk(0, "a", "5_0"), _chunk(1, "b", "5_1"), _chunk(0, "a", "5_0"), _chunk(1, "b", "5_1")]
+
+    plan = plan_chunk_changes(existing, ["a", "b"])
+
+    assert [(chunk.search_id, i) for chunk, i in plan.kept] == [("5_0", 0), ("5_1", 1)]
+    assert plan.added == []
+    assert len(plan.removed) == 2
+    assert not {id(chunk) for chunk in plan.removed} & {id(chunk) for chunk, _ in plan.kept}
+    assert plan.stale_search_ids() == []
+
+
+def test_duplicate_row_is_not_kept_twice():
+    existing = [_chunk(0, "a", "5_0"), _chunk(1, "a", "5_0")]
+
+    plan = plan_chunk_changes(existing, ["a", "a"])
+
+    assert [(chunk.search_id, i) for chunk, i in plan.kept] == [("5_0", 0)]
+    assert plan.added == [1]
+    assert plan.stale_search_ids() == []
+
+
+def test_repeated_text_gets_distinct_search_ids():
+    hashes = [chunk_hash("a"), chunk_hash("a"), chunk_hash("b")]
+
+    search_ids = new_search_ids(5, [], hashes)
+
+    assert len(set(search_ids)) == 3
+    assert search_ids == new_search_ids(5, [], hashes)  # A retry uploads under the same ids
+
+
+def test_new_search_ids_skip_ids_of_current_rows():
+    taken = new_search_ids(5, [], [chunk_hash("a")])[0]
+    existing = [_chunk(0, "a", taken), _chunk(1, "x", "5_1")]
+
+    search_ids = new_search_ids(5, existing, [chunk_hash("a"), chunk_hash("a")])
+
+    assert taken not in search_ids
+    assert len(set(search_ids)) == 2
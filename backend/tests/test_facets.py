@@ -0,0 +1,21 @@
+from models import Document
+from services.facets import apply_document_facets, get_facet_cache
+
+
+def test_facet_cache_invalidated_after_commit(db):
+    cache = get_facet_cache()
+    cache.invalidate()
+    assert cache.get(db)[0]["applications"] == {}
+
+    doc = Document(filename="a.pdf", original_filename="a.pdf", application="PAN", status="completed")
+    db.add(doc)
+    db.flush()
+    apply_document_facets(db, doc, 1)
+    # A reader in another session before the commit caches the old counts again
+    cache._snapshot = {"applications": {}, "issues": {}, "ingredients": {}}
+    db.commit()
+    assert cache.get(db)[0]["applications"] == {"PAN": 1}
+
+    apply_document_facets(db, doc, -1)
+    db.commit()
+    assert cache.get(db)[0]["applications"] == {}
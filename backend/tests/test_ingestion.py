@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import pytest
+
+from database import SessionLocal
+from models import Document, DocumentChunk
+from services import ingestion
+from services.chunk_diff import chunk_hash
+
+
+class FakeIndex:
+    """In-memory search backend; `on_upload` runs after each upload"""
+
+    def __init__(self):
+        self.docs = {}
+        self.on_upload = None
+        self.fail_delete = False
+
+    def upload_documents(self, docs):
+        for doc in docs:
+            self.docs[doc["id"]] = dict(doc)
+        if self.on_upload:
+            self.on_upload()
+
+    def merge_documents(self, docs):
+        for doc in docs:
+            if doc["id"] in self.docs:
+                self.docs[doc["id"]].update(doc)
+
+    def delete_documents(self, ids):
+        if self.fail_delete:
+            self.fail_delete = False
+            raise RuntimeError("index unavailable")
+        for search_id in ids:
+            self.docs.pop(search_id, None)
+
+
+@pytest.fixture
+def index(db, monkeypatch):
+    fake = FakeIndex()
+    monkeypatch.setattr(ingestion.settings, "azure_openai_api_key", "key")
+    monkeypatch.setattr(ingestion.settings, "search_backend", "local")
+    monkeypatch.setattr(ingestion, "AzureOpenAIService", lambda: SimpleNamespace(get_embeddings_batch=None))
+    monkeypatch.setattr(ingestion, "get_search_backend", lambda: fake)
+    monkeypatch.setattr(ingestion, "embed_with_store", lambda embed, texts: [[0.0, 1.0] for _ in texts])
+    monkeypatch.setattr(ingestion, "extract_text", lambda path, filename: ("\n".join(fake.chunks), None))
+    monkeypatch.setattr(ingestion.doc_processor, "chunk_text", lambda text: list(fake.chunks))
+    return fake
+
+
+def _document(db, chunks=()):
+    doc = Document(filename="a.pdf", original_filename="a.pdf", file_type="pdf", status="completed")
+    db.add(doc)
+    db.flush()
+    for i, (text, search_id) in enumerate(chunks):
+        db.add(DocumentChunk(
+            document_id=doc.id, chunk_index=i, content=text, content_hash=chunk_hash(text), search_id=search_id
+        ))
+    db.commit()
+    return doc.id
+
+
+def test_document_deleted_during_indexing_leaves_no_chunks(db, index):
+    document_id = _document(db)
+    index.chunks = ["a", "b"]
+
+    def delete_document():
+        other = SessionLocal()
+        try:
+            other.delete(other.get(Document, document_id))
+            other.commit()
+        finally:
+            other.close()
+
+    index.on_upload = delete_document
+    assert ingestion.process_document(document_id, staged_path="a.pdf", reprocess=True) == "missing"
+    assert index.docs == {}
+    assert db.query(DocumentChunk).count() == 0
+
+
+def test_reprocess_updates_only_changed_chunks(db, index):
+    document_id = _document(db, [("a", "1_a"), ("b", "1_b")])
+    index.docs = {"1_a": {"id": "1_a", "chunk_index": 0}, "1_b": {"id": "1_b", "chunk_index": 1}}
+    index.chunks = ["x", "a"]
+
+    assert ingestion.process_document(document_id, staged_path="a.pdf", reprocess=True) == "completed"
+
+    rows = {row.search_id: row for row in db.query(DocumentChunk)}
+    assert set(rows) == set(index.docs)
+    assert "1_b" not in rows
+    assert rows["1_a"].chunk_index == 1
+    assert index.docs["1_a"]["chunk_index"] == 1
+
+
+def test_failed_reprocess_removes_uploaded_chunks_and_keeps_old_rows(db, index):
+    document_id = _document(db, [("a", "1_a"), ("b", "1_b")])
+    index.docs = {"1_a": {"id": "1_a", "chunk_index": 0}, "1_b": {"id": "1_b", "chunk_index": 1}}
+    index.chunks = ["a", "x"]
+    index.fail_delete = True  # Deleting the stale chunk fails after the new one was uploaded
+
+    assert ingestion.process_document(document_id, staged_path="a.pdf", reprocess=True) == "error"
+
+    assert set(index.docs) == {"1_a", "1_b"}
+    assert {(row.search_id, row.chunk_index) for row in db.query(DocumentChunk)} == {("1_a", 0), ("1_b", 1)}
+    assert db.get(Document, document_id).status == "error"
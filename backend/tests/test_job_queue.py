@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+import pytest
+
+from models import Document, IngestionJob
+from services import job_queue
+from services.job_queue import claim_job, complete_job, enqueue_document, extend_leases
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Queue time that only moves when a test advances it"""
+    now = [job_queue._now()]
+    monkeypatch.setattr(job_queue, "_now", lambda: now[0])
+
+    def advance(seconds):
+        now[0] += timedelta(seconds=seconds)
+
+    return advance
+
+
+def _queued_job(db, max_attempts=3):
+    doc = Document(filename="a.pdf", original_filename="a.pdf", file_type="pdf", status="pending")
+    db.add(doc)
+    db.flush()
+    job = enqueue_document(db, doc.id)
+    job.max_attempts = max_attempts
+    db.commit()
+    return job.id, doc.id
+
+
+def test_live_lease_is_not_claimed_twice(db, clock):
+    job_id, _ = _queued_job(db)
+
+    assert claim_job(db, "w1") == job_id
+    clock(job_queue.settings.ingestion_lease_seconds - 1)
+    assert claim_job(db, "w2") is None
+
+
+def test_expired_lease_is_reclaimed_and_old_owner_rejected(db, clock):
+    job_id, _ = _queued_job(db)
+    assert claim_job(db, "w1") == job_id
+
+    # w1 stops heartbeating; once the lease runs out another worker takes over
+    clock(job_queue.settings.ingestion_lease_seconds + 1)
+    assert claim_job(db, "w2") == job_id
+
+    job = db.get(IngestionJob, job_id)
+    assert (job.lease_owner, job.attempts) == ("w2", 2)
+    assert extend_leases(db, "w1", [job_id]) == set()
+    assert extend_leases(db, "w2", [job_id]) == {job_id}
+    assert not complete_job(db, job_id, "w1", "completed")
+    assert complete_job(db, job_id, "w2", "completed")
+    assert db.get(IngestionJob, job_id).status == job_queue.COMPLETED
+
+
+def test_heartbeat_keeps_the_lease(db, clock):
+    job_id, _ = _queued_job(db)
+    assert claim_job(db, "w1") == job_id
+
+    for _ in range(3):
+        clock(job_queue.settings.ingestion_lease_seconds - 1)
+        assert extend_leases(db, "w1", [job_id]) == {job_id}
+        assert claim_job(db, "w2") is None
+
+
+def test_expired_lease_on_last_attempt_fails_the_document(db, clock):
+    job_id, document_id = _queued_job(db, max_attempts=1)
+    assert claim_job(db, "w1") == job_id
+
+    clock(job_queue.settings.ingestion_lease_seconds + 1)
+    assert claim_job(db, "w2") is None
+
+    db.expire_all()
+    assert db.get(IngestionJob, job_id).status == job_queue.FAILED
+    assert db.get(Document, document_id).status == "error"
@@ -0,0 +1,106 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from services.keyword_index import BM25Index
+
+TEXTS = [
+    "離水防止に PAN を使用した試作",
+    "乳業向けの老化対策",
+    "総菜の離水防止と食感改良",
+    "PAN の老化対策 ID4567",
+    "乳業 離水 試作",
+]
+QUERIES = ["離水防止", "老化対策", "PAN", "乳業 試作", "id4567"]
+
+
+def _index(texts):
+    index = BM25Index()
+    for doc_id, text in enumerate(texts):
+        index.add(doc_id, text)
+    return index
+
+
+def _assert_same(loaded, expected):
+    assert len(loaded) == len(expected)
+    assert bytes(loaded.deleted) == bytes(expected.deleted)
+    for query in QUERIES:
+        np.testing.assert_allclose(loaded.scores(query), expected.scores(query), rtol=1e-6)
+
+
+@pytest.fixture
+def prefix(tmp_path):
+    return str(tmp_path / "bm25")
+
+
+def test_delta_save_keeps_base_files(prefix):
+    index = _index(TEXTS[:3])
+    index.save(prefix)
+    base_mtime = os.stat(f"{prefix}.docs.npy").st_mtime_ns
+
+    index.add(3, TEXTS[3])
+    index.add(4, TEXTS[4])
+    index.save(prefix)
+
+    assert os.path.exists(f"{prefix}.delta.npz")
+    assert os.stat(f"{prefix}.docs.npy").st_mtime_ns == base_mtime
+    _assert_same(BM25Index.load(prefix), _index(TEXTS))
+
+
+def test_reload_after_deletes_in_base_and_delta(prefix):
+    index = _index(TEXTS[:3])
+    index.save(prefix)
+    index.add(3, TEXTS[3])
+    index.add(4, TEXTS[4])
+    index.delete(0)  # Tombstone in the saved base
+    index.delete(3)  # Tombstone in the delta
+    index.save(prefix)
+
+    loaded = BM25Index.load(prefix)
+    _assert_same(loaded, index)
+    assert all(doc_id not in (0, 3) for doc_id, _ in loaded.search("PAN"))
+
+    # Deletes made after a reload are carried by the next delta too
+    loaded.delete(2)
+    loaded.save(prefix)
+    again = BM25Index.load(prefix)
+    _assert_same(again, loaded)
+    assert again.base_deletes == [0, 2]
+
+
+def test_large_delta_merges_into_base(prefix, monkeypatch):
+    monkeypatch.setattr(BM25Index, "DELTA_MERGE_MIN_DOCS", 1)
+    monkeypatch.setattr(BM25Index, "DELTA_MERGE_RATIO", 0.5)
+    index = _index(TEXTS[:2])
+    index.save(prefix)
+    index.delete(1)
+    for doc_id in range(2, 5):
+        index.add(doc_id, TEXTS[doc_id])
+    index.save(prefix)
+
+    assert not os.path.exists(f"{prefix}.delta.npz")
+    assert index.base_count == 5 and index.base_deletes == []
+    loaded = BM25Index.load(prefix)
+    _assert_same(loaded, index)
+    assert loaded.delta == {}
+
+
+def test_delta_of_an_older_base_is_ignored(prefix, tmp_path):
+    index = _index(TEXTS[:3])
+    index.save(prefix)
+    index.add(3, TEXTS[3])
+    index.save(prefix)
+    stale = str(tmp_path / "stale.npz")
+    shutil.copy(f"{prefix}.delta.npz", stale)
+
+    # Compaction rewrites the base; a delta restored from before it must not apply
+    index.save(str(tmp_path / "other"))
+    index.save(prefix)
+    rewritten = BM25Index.load(prefix)
+    shutil.copy(stale, f"{prefix}.delta.npz")
+
+    loaded = BM25Index.load(prefix)
+    _assert_same(loaded, rewritten)
+    assert loaded.delta == {}
@@ -0,0 +1,107 @@
+from email.utils import formatdate
+
+import httpx
+import openai
+import pytest
+
+from services import rate_limit
+from services.rate_limit import BACKGROUND, INTERACTIVE, RateLimiter, call_with_quota, retry_after_seconds
+
+
+class FakeClock:
+    """Stands in for the time module: sleeping advances the clock"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", fake)
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: low)
+    return fake
+
+
+def _limiter(reserve=0.2):
+    # 6000 TPM: 100 tokens a second, 1000 in the bucket; requests are not the bottleneck
+    return RateLimiter("test", tpm=6000, rpm=6000, reserve=reserve)
+
+
+def _throttled(headers):
+    request = httpx.Request("POST", "https://example.openai.azure.com/")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("throttled", response=response, body=None)
+
+
+def test_background_leaves_the_reserve_to_interactive_calls(clock):
+    limiter = _limiter()
+
+    assert limiter.try_acquire(700, BACKGROUND) == 0
+    # 300 left: a background call may not dig into the 200-token reserve
+    assert limiter.try_acquire(200, BACKGROUND) == pytest.approx(1.0)
+    assert limiter.try_acquire(200, INTERACTIVE) == 0
+
+
+def test_background_steps_aside_while_an_interactive_call_waits(clock):
+    limiter = _limiter()
+    limiter._enter(INTERACTIVE)
+
+    assert limiter.try_acquire(1, BACKGROUND) > 0
+
+    limiter._leave(INTERACTIVE)
+    assert limiter.try_acquire(1, BACKGROUND) == 0
+
+
+def test_acquire_waits_for_the_bucket_to_refill(clock):
+    limiter = _limiter()
+    limiter.try_acquire(1000, INTERACTIVE)
+
+    waited = limiter.acquire(250, INTERACTIVE)
+
+    assert waited == pytest.approx(2.5)
+    assert sum(clock.slept) == pytest.approx(2.5)
+    assert all(seconds <= rate_limit.MAX_POLL_SECONDS for seconds in clock.slept)
+
+
+def test_retry_after_header_forms(clock):
+    assert retry_after_seconds(_throttled({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(_throttled({"retry-after": "7"})) == 7.0
+    assert retry_after_seconds(_throttled({"retry-after": formatdate(clock.now + 30, usegmt=True)})) == pytest.approx(30)
+    assert retry_after_seconds(_throttled({})) is None
+
+
+def test_throttled_call_honors_retry_after_and_blocks_other_callers(clock, monkeypatch):
+    limiter = _limiter()
+    monkeypatch.setattr(rate_limit, "get_rate_limiter", lambda deployment: limiter)
+    calls = []
+    blocked = []
+
+    def call():
+        calls.append(clock.now)
+        if len(calls) == 1:
+            raise _throttled({"retry-after": "20"})
+        return "ok"
+
+    def sleep(seconds):
+        # While the 429 penalty runs, every other caller is held back as well
+        blocked.append(limiter.try_acquire(1, INTERACTIVE))
+        FakeClock.sleep(clock, seconds)
+
+    monkeypatch.setattr(clock, "sleep", sleep)
+
+    assert call_with_quota("test", 10, INTERACTIVE, call) == "ok"
+    assert calls[1] - calls[0] >= 20
+    assert blocked[0] >= 20
+    assert limiter.try_acquire(1, INTERACTIVE) == 0
@@ -0,0 +1,16 @@
+from services.stats import SEARCH_COUNT, get_system_stats, get_system_stats_cache, increment_counters
+
+
+def test_stats_cache_cleared_after_commit(db):
+    get_system_stats_cache().clear()
+    assert get_system_stats(db)["total_searches"] == 0
+
+    increment_counters(db, {SEARCH_COUNT: 2})
+    # A dashboard read before the commit must not keep the old totals cached
+    get_system_stats_cache().set("system", {"total_searches": 0})
+    db.commit()
+    assert get_system_stats(db)["total_searches"] == 2
+
+    increment_counters(db, {SEARCH_COUNT: 1})
+    db.commit()
+    assert get_system_stats(db)["total_searches"] == 3
@@ -0,0 +1,52 @@
+"""
+ドキュメント登録ワーカー
+
+ingestion_jobs テーブルに登録されたジョブを取得し、テキスト抽出・チャンク分割・
+埋め込み生成・インデックス登録を行います。APIプロセスとは別にスケールできます。
+
+使い方:
+    python worker.py --concurrency 4
+
+APIプロセス内のワーカーを使わない場合は INGESTION_EMBEDDED_WORKERS=false を設定してください。
+SIGTERM / Ctrl+C を受けると新しいジョブの取得を止め、処理中のジョブの完了を待ってから終了します
+（INGESTION_SHUTDOWN_TIMEOUT_SECONDS を超えたジョブはキューに戻し、他のワーカーが再実行します）。
+"""
+import argparse
+import signal
+import threading
+
+from config import get_settings
+from database import init_db
+from services.job_queue import IngestionWorkerPool
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="ドキュメント登録ワーカー")
+    parser.add_argument("--concurrency", type=int, default=settings.ingestion_worker_concurrency,
+                        help="同時に処理するジョブ数")
+    parser.add_argument("--shutdown-timeout", type=float, default=settings.ingestion_shutdown_timeout_seconds,
+                        help="終了時に処理中のジョブを待つ秒数")
+    args = parser.parse_args()
+
+    init_db()
+
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        print(f">> Signal {signum} received: draining ingestion jobs...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    pool = IngestionWorkerPool()
+    pool.start(args.concurrency)
+    while not stop.wait(1.0):
+        pass
+    pool.close(args.shutdown_timeout)
+    print(f">> Worker stopped: {pool.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -101,6 +101,21 @@ export const uploadDocument = async (file: File) => {
   return response.data;
 };
 
+export const bulkUploadDocuments = async (files: File[]) => {
+  const formData = new FormData();
+  files.forEach((file) => formData.append('files', file));
+
+  const response = await api.post('/documents/bulk-upload', formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+  });
+  return response.data;
+};
+
+export const getUploadBatch = async (batchId: number) => {
+  const response = await api.get(`/documents/batches/${batchId}`);
+  return response.data;
+};
+
 export const getDocuments = async (page?: number, pageSize?: number, status?: string) => {
   const response = await api.get('/documents', {
     params: { page, page_size: pageSize, status },
@@ -14,7 +14,7 @@ import {
 } from 'lucide-react';
 import {
   getDocuments,
-  uploadDocument,
+  bulkUploadDocuments,
   deleteDocument,
   reprocessDocument,
   getSystemStats,
@@ -84,12 +84,11 @@ export default function Admin() {
     setMessage(null);
 
     try {
-      for (const file of acceptedFiles) {
-        await uploadDocument(file);
-      }
+      // One request for all files (ZIP archives are unpacked on the server)
+      const result = await bulkUploadDocuments(acceptedFiles);
       setMessage({
-        type: 'success',
-        text: `${acceptedFiles.length}件のファイルをアップロードしました`,
+        type: result.rejected.length > 0 ? 'error' : 'success',
+        text: result.message,
       });
       loadData();
     } catch (err: any) {
@@ -113,6 +112,7 @@ export default function Admin() {
       'application/vnd.ms-powerpoint': ['.ppt'],
       'application/pdf': ['.pdf'],
       'image/*': ['.png', '.jpg', '.jpeg'],
+      'application/zip': ['.zip'],
     },
   });
 
@@ -260,7 +260,7 @@ export default function Admin() {
                 ファイルをドラッグ＆ドロップ、またはクリックして選択
               </p>
               <p className="text-sm text-gray-400">
-                対応形式: Excel, Word, PowerPoint, PDF, 画像
+                対応形式: Excel, Word, PowerPoint, PDF, 画像, ZIP（複数ファイルをまとめて登録）
               </p>
             </div>
           )}
@@ -6,6 +6,7 @@ Azure AI Searchインデックスに再登録します。
 """
 
 import os
+import sys
 import json
 from datetime import datetime
 from sqlalchemy import create_engine, text
@@ -14,6 +15,10 @@ from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
 from openai import AzureOpenAI
 
+# 埋め込みはバックエンドのチャンク埋め込みストア（chunk_embeddings）を経由して再利用する
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from services.embedding_store import embed_with_store
+
 # 環境変数から設定を取得
 MYSQL_HOST = os.getenv("MYSQL_HOST")
 MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
@@ -80,13 +85,13 @@ openai_client = AzureOpenAI(
     azure_endpoint=AZURE_OPENAI_ENDPOINT
 )
 
-def get_embedding(text: str):
-    """テキストの埋め込みベクトルを生成"""
+def get_embeddings_batch(texts):
+    """テキストの埋め込みベクトルを一括生成（入力順）"""
     response = openai_client.embeddings.create(
-        input=text,
+        input=texts,
         model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT
     )
-    return response.data[0].embedding
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
 def reindex_all_chunks():
     """すべてのドキュメントチャンクを再インデックス"""
@@ -116,15 +121,21 @@ def reindex_all_chunks():
     print("埋め込みベクトルを生成してインデックスに登録中...")
     print("（この処理には時間がかかる場合があります）")
 
-    documents_to_upload = []
     success_count = 0
     error_count = 0
 
-    for i, chunk in enumerate(chunks, 1):
+    # 50件ごとに埋め込み（保存済みのベクトルは再利用）とバッチアップロード
+    for start in range(0, len(chunks), 50):
+        batch = chunks[start:start + 50]
         try:
-            # 埋め込みベクトルを生成
-            embedding = get_embedding(chunk.content)
+            embeddings = embed_with_store(get_embeddings_batch, [chunk.content for chunk in batch])
+        except Exception as e:
+            print(f"⚠️ 埋め込み生成中にエラー: {e}")
+            error_count += len(batch)
+            continue
 
+        documents_to_upload = []
+        for chunk, embedding in zip(batch, embeddings):
             # インデックス用のドキュメントを作成
             # DateTimeOffsetにはタイムゾーン情報が必要
             if chunk.created_at:
@@ -133,7 +144,7 @@ def reindex_all_chunks():
             else:
                 created_at_str = datetime.now().isoformat() + "Z"
 
-            doc = {
+            documents_to_upload.append({
                 "id": str(chunk.id),
                 "content": chunk.content,
                 "title": chunk.title or "",
@@ -142,36 +153,15 @@ def reindex_all_chunks():
                 "metadata": "{}",  # デフォルト値
                 "created_at": created_at_str,
                 "content_vector": embedding
-            }
-
-            documents_to_upload.append(doc)
-
-            # 50件ごとにバッチアップロード
-            if len(documents_to_upload) >= 50:
-                try:
-                    result = search_client.upload_documents(documents=documents_to_upload)
-                    success_count += len(documents_to_upload)
-                    print(f"進捗: {i}/{len(chunks)} 件処理完了 (成功: {success_count}, エラー: {error_count})")
-                    documents_to_upload = []
-                except Exception as e:
-                    print(f"⚠️ バッチアップロード中にエラー: {e}")
-                    error_count += len(documents_to_upload)
-                    documents_to_upload = []
-
-        except Exception as e:
-            print(f"⚠️ チャンク {chunk.id} の処理中にエラー: {e}")
-            error_count += 1
-            continue
+            })
 
-    # 残りのドキュメントをアップロード
-    if documents_to_upload:
         try:
-            result = search_client.upload_documents(documents=documents_to_upload)
+            search_client.upload_documents(documents=documents_to_upload)
             success_count += len(documents_to_upload)
-            print(f"進捗: {len(chunks)}/{len(chunks)} 件処理完了 (成功: {success_count}, エラー: {error_count})")
         except Exception as e:
-            print(f"⚠️ 最終バッチのアップロード中にエラー: {e}")
+            print(f"⚠️ バッチアップロード中にエラー: {e}")
             error_count += len(documents_to_upload)
+        print(f"進捗: {start + len(batch)}/{len(chunks)} 件処理完了 (成功: {success_count}, エラー: {error_count})")
 
     print("\n=== 再インデックス処理完了 ===")
     print(f"✅ 成功: {success_count} 件")